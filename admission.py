@@ -0,0 +1,255 @@
+"""
+Admission Control für die Lese-Endpunkte: Kostenklassen mit Parallelitätslimit, begrenzter Warteschlange und
+Statement-Timeout.
+
+- light: Einzelabrufe und Seiten über den Primärschlüssel,
+- standard: spielerbezogene bzw. gefilterte Statistiken und Spieler-Streams,
+- heavy: Statistiken ohne jeden Filter (alle Spieler, gesamter Zeitraum) und der Export aller Battles.
+
+Ist eine Klasse ausgelastet, wartet die Anfrage in einer FIFO-Warteschlange (höchstens
+ADMISSION_QUEUE_TIMEOUT_SECONDS). Ist die Warteschlange voll oder die Wartezeit um, antwortet der Endpunkt
+sofort mit 503 und Retry-After, statt eine Verbindung aus dem Pool zu blockieren. Jede Klasse hat eigene
+Plätze, ungefilterte Aggregationen können Einzelabrufe also nicht aushungern.
+
+Während eine Anfrage ihren Platz hält, bekommt jede ihrer Queries den Statement-Timeout der Klasse in der
+Datenbank: MySQL per Optimizer-Hint MAX_EXECUTION_TIME (nur SELECT), SQLite per Progress-Handler, der die
+Ausführung nach Ablauf abbricht. Die Verbindung ist danach sofort wieder frei; der Endpunkt antwortet mit 503.
+"""
+import asyncio
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.util import await_only
+from starlette.concurrency import iterate_in_threadpool
+
+from config import (
+    ADMISSION_DEFAULTS, ADMISSION_ENABLED, ADMISSION_QUEUE_TIMEOUT_SECONDS, ADMISSION_RETRY_AFTER_SECONDS,
+    admission_limits
+)
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_REJECTED
+
+# SQLite ruft den Progress-Handler alle so viele VM-Instruktionen auf
+PROGRESS_HANDLER_INSTRUCTIONS = 10000
+
+# MySQL-Fehlercode für "maximum statement execution time exceeded"
+MYSQL_EXECUTION_TIME_EXCEEDED = 3024
+
+# Schlüssel in Connection.info: Zeitpunkt (time.monotonic), ab dem SQLite die laufende Query abbricht
+DEADLINE = "statement_deadline"
+
+_SELECT = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+
+# Statement-Timeout der laufenden Anfrage in ms (0 = keiner); wird in Threadpool und run_sync übernommen
+_statement_timeout = ContextVar("statement_timeout_ms", default=0)
+
+
+class StatementTimeout(Exception):
+    """Die Datenbank hat eine Query nach Ablauf des Statement-Timeouts abgebrochen."""
+
+
+@dataclass(frozen=True)
+class CostClass:
+    name: str
+    concurrency: int
+    queue_size: int
+    statement_timeout_ms: int
+
+
+class Limiter:
+    """Parallelitätslimit mit FIFO-Warteschlange fester Länge (nur im Event-Loop verwenden)."""
+
+    def __init__(self, cost_class: CostClass):
+        self.cost_class = cost_class
+        self.active = 0
+        self._waiters = deque()
+
+    async def acquire(self):
+        """Belegt einen Platz oder wirft HTTPException 503 (Warteschlange voll bzw. Wartezeit abgelaufen)."""
+        if self.has_capacity():
+            self._take()
+            return
+        if len(self._waiters) >= self.cost_class.queue_size:
+            raise self._rejected("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_QUEUED.labels(self.cost_class.name).inc()
+        try:
+            # release() übergibt den Platz direkt an den Wartenden (active bleibt gleich)
+            await asyncio.wait_for(waiter, ADMISSION_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise self._rejected("queue_timeout")
+        except BaseException:
+            # Abbruch der Anfrage: ein bereits übergebener Platz geht an den Nächsten
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            ADMISSION_QUEUED.labels(self.cost_class.name).dec()
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def has_capacity(self) -> bool:
+        return self.active < self.cost_class.concurrency and not self._waiters
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+        ADMISSION_IN_FLIGHT.labels(self.cost_class.name).dec()
+
+    def _take(self):
+        self.active += 1
+        ADMISSION_IN_FLIGHT.labels(self.cost_class.name).inc()
+
+    def _rejected(self, reason):
+        return overloaded(self.cost_class.name, reason, "Server ausgelastet, bitte später erneut versuchen.")
+
+    def statistics(self):
+        return {"active": self.active, "queued": len(self._waiters), **vars(self.cost_class)}
+
+
+def overloaded(cost: str, reason: str, detail: str) -> HTTPException:
+    ADMISSION_REJECTED.labels(cost, reason).inc()
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)})
+
+
+COST_CLASSES = {name: CostClass(name, *admission_limits(name)) for name in ADMISSION_DEFAULTS}
+limiters = {name: Limiter(cost_class) for name, cost_class in COST_CLASSES.items()}
+
+
+def statistics_cost(player_tag=None, start_date=None, end_date=None, **options) -> str:
+    """heavy ohne Spieler-, Zeit- und Dimensionsfilter (Aggregation über alle Battles), sonst standard."""
+    filters = (player_tag, start_date, end_date, options.get("battle_mode"), options.get("event_map"))
+    return "standard" if any(filters) else "heavy"
+
+
+def has_capacity(cost: str) -> bool:
+    """
+    Ob die Kostenklasse sofort einen Platz frei hat. Für Hintergrundarbeit, die sich nicht in die Warteschlange
+    vor Anfragen stellen soll: direkt danach betritt admitted() den Block ohne zu warten.
+    """
+    return not ADMISSION_ENABLED or limiters[cost].has_capacity()
+
+
+@asynccontextmanager
+async def admitted(cost: str):
+    """Hält einen Platz der Kostenklasse; Queries im Block laufen mit deren Statement-Timeout."""
+    if not ADMISSION_ENABLED:
+        yield
+        return
+    limiter = limiters[cost]
+    await limiter.acquire()
+    token = _statement_timeout.set(limiter.cost_class.statement_timeout_ms)
+    try:
+        yield
+    except StatementTimeout:
+        raise overloaded(cost, "statement_timeout", "Abfrage zu aufwendig, bitte Filter oder Zeitraum einschränken.")
+    finally:
+        _statement_timeout.reset(token)
+        limiter.release()
+
+
+async def admitted_stream(cost: str, iterator):
+    """
+    Belegt den Platz vor Beginn der Antwort (503 ist also noch möglich) und gibt ihn erst frei, wenn der
+    Stream endet oder abgebrochen wird. Streams laufen ohne Statement-Timeout (Exporte dauern legitim lange).
+    """
+    if not ADMISSION_ENABLED:
+        return iterator
+    limiter = limiters[cost]
+    await limiter.acquire()
+    stream = _release_after(limiter, iterator)
+    # Generator starten: ab hier gibt sein finally den Platz frei, auch wenn der Client vorher abbricht
+    await stream.asend(None)
+    return stream
+
+
+async def _release_after(limiter, iterator):
+    try:
+        yield
+        if not hasattr(iterator, "__aiter__"):
+            iterator = iterate_in_threadpool(iterator)
+        async for chunk in iterator:
+            yield chunk
+    finally:
+        limiter.release()
+
+
+def statistics():
+    return {name: limiter.statistics() for name, limiter in limiters.items()}
+
+
+# --- Statement-Timeouts in der Datenbank ------------------------------------------------
+
+
+def with_max_execution_time(statement: str, timeout_ms: int) -> str:
+    """Setzt den MySQL-Optimizer-Hint MAX_EXECUTION_TIME hinter das einleitende SELECT."""
+    return _SELECT.sub(f"SELECT /*+ MAX_EXECUTION_TIME({timeout_ms}) */", statement, count=1)
+
+
+def _mysql_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timeout_ms = _statement_timeout.get()
+    if timeout_ms:
+        statement = with_max_execution_time(statement, timeout_ms)
+    return statement, parameters
+
+
+def _sqlite_connect(dbapi_connection, connection_record):
+    info = connection_record.info
+
+    def expired():
+        deadline = info.get(DEADLINE)
+        return deadline is not None and time.monotonic() > deadline
+
+    if hasattr(dbapi_connection, "set_progress_handler"):
+        dbapi_connection.set_progress_handler(expired, PROGRESS_HANDLER_INSTRUCTIONS)
+    else:
+        # aiosqlite: der Handler läuft im Thread der Verbindung, liest aber nur das info-Dict
+        await_only(dbapi_connection._connection.set_progress_handler(expired, PROGRESS_HANDLER_INSTRUCTIONS))
+
+
+def _sqlite_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Gilt bis zur nächsten Query bzw. bis die Verbindung zurück in den Pool geht (auch beim Lesen der Zeilen)
+    timeout_ms = _statement_timeout.get()
+    conn.info[DEADLINE] = time.monotonic() + timeout_ms / 1000 if timeout_ms else None
+
+
+def _sqlite_reset(dbapi_connection, connection_record):
+    connection_record.info[DEADLINE] = None
+
+
+def _is_timeout(error) -> bool:
+    if not isinstance(error, OperationalError):
+        return False
+    if getattr(error.orig, "args", None) and error.orig.args[0] == MYSQL_EXECUTION_TIME_EXCEEDED:
+        return True
+    return "interrupted" in str(error.orig)
+
+
+def _handle_error(context):
+    if _statement_timeout.get() and _is_timeout(context.sqlalchemy_exception):
+        raise StatementTimeout(str(context.original_exception))
+
+
+def install_statement_timeouts(engine):
+    """Registriert die Statement-Timeouts an einer (synchronen) Engine; für AsyncEngine deren sync_engine."""
+    if engine.dialect.name == "mysql":
+        event.listen(engine, "before_cursor_execute", _mysql_before_cursor_execute, retval=True)
+    elif engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _sqlite_connect)
+        event.listen(engine, "before_cursor_execute", _sqlite_before_cursor_execute)
+        event.listen(engine, "reset", _sqlite_reset)
+    else:
+        return
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,275 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from sqlalchemy import DateTime, func, case, select, union
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.sql.visitors import InternalTraversal
+
+from config import USE_ROLLUP
+from models import BattleData, BattleDailyRollup
+
+# Dimensionen, nach denen Battles verdichtet werden können (Schlüssel der Rollup-Tabelle)
+DIMENSIONS = ("player_tag", "day", "brawler_name", "battle_mode", "event_map")
+
+# Zeit-Buckets für Zeitreihen; "day" ist die Rollup-Dimension, die übrigen werden per bucket_start berechnet
+BUCKETS = ("hour", "day", "week", "month")
+TIME_BUCKETS = ("hour", "week", "month")
+
+# Kennzahlen eines verdichteten Eintrags ("Grain")
+MEASURES = ("battles", "victories", "trophy_change", "duration_sum", "duration_count", "first_battle", "last_battle")
+
+# Ein Tag gilt als vollständig abgedeckt, wenn der Zeitraum bis mindestens 23:59:59 reicht (battle_time hat Sekundenauflösung)
+END_OF_DAY = time(23, 59, 59)
+
+
+def victory_condition():
+    """Victory-Bedingung basierend auf battle_mode (Showdown über den Rang, sonst über battle_result)."""
+    return case(
+        (BattleData.battle_mode == 'duoShowdown', BattleData.rank <= 2),
+        (BattleData.battle_mode == 'soloShowdown', BattleData.rank <= 4),
+        (BattleData.battle_mode.notin_(['duoShowdown', 'soloShowdown']),
+         BattleData.battle_result == 'victory')
+    )
+
+
+def is_victory(battle_mode, rank, battle_result):
+    """Victory-Bedingung in Python, mit derselben NULL-Semantik wie victory_condition()."""
+    if battle_mode == 'duoShowdown':
+        return rank is not None and rank <= 2
+    if battle_mode == 'soloShowdown':
+        return rank is not None and rank <= 4
+    if battle_mode is not None:
+        return battle_result == 'victory'
+    return False
+
+
+def player_filter(column, player_tag):
+    """Filter auf einen Spieler oder, für Batch-Abfragen, auf eine Liste bzw. ein Tupel von Spielern."""
+    if isinstance(player_tag, (list, tuple)):
+        return column.in_(player_tag)
+    return column == player_tag
+
+
+def build_filters(player_tag=None, start_date=None, end_date=None):
+    """Basis-Filter für Spieler und Zeitraum erstellen."""
+    filters = []
+    if player_tag:
+        filters.append(player_filter(BattleData.player_tag, player_tag))
+    if start_date:
+        filters.append(BattleData.battle_time >= start_date)
+    if end_date:
+        filters.append(BattleData.battle_time <= end_date)
+    return filters
+
+
+class bucket_start(FunctionElement):
+    """
+    Beginn des Zeit-Buckets (hour, week, month) eines Zeitstempels oder Datums als DATETIME.
+    Wochen beginnen am Montag. Wird je Dialekt in natives SQL übersetzt, damit das Bucketing in der Datenbank läuft.
+    """
+    name = "bucket_start"
+    type = DateTime()
+    inherit_cache = True
+    # unit gehört zum Cache-Schlüssel des kompilierten Statements
+    _traverse_internals = FunctionElement._traverse_internals + [("unit", InternalTraversal.dp_string)]
+
+    def __init__(self, expression, unit):
+        if unit not in TIME_BUCKETS:
+            raise ValueError(f"Unbekannter Bucket '{unit}'")
+        self.unit = unit
+        super().__init__(expression)
+
+
+# SQLite: strftime liefert Text im DATETIME-Format, den der SQLite-DateTime-Typ wieder als datetime liest
+SQLITE_BUCKETS = {
+    "hour": "strftime('%Y-%m-%d %H:00:00', {0})",
+    "week": "strftime('%Y-%m-%d 00:00:00', {0}, 'weekday 0', '-6 days')",
+    "month": "strftime('%Y-%m-01 00:00:00', {0})",
+}
+
+MYSQL_BUCKETS = {
+    "hour": "TIMESTAMP(DATE({0}), MAKETIME(HOUR({0}), 0, 0))",
+    "week": "TIMESTAMP(DATE({0}) - INTERVAL WEEKDAY({0}) DAY)",
+    "month": "TIMESTAMP(DATE({0}) - INTERVAL (DAYOFMONTH({0}) - 1) DAY)",
+}
+
+
+@compiles(bucket_start)
+def _compile_bucket_start(element, compiler, **kw):
+    expression = compiler.process(list(element.clauses)[0], **kw)
+    return SQLITE_BUCKETS[element.unit].format(expression)
+
+
+@compiles(bucket_start, "mysql")
+def _compile_bucket_start_mysql(element, compiler, **kw):
+    expression = compiler.process(list(element.clauses)[0], **kw)
+    return MYSQL_BUCKETS[element.unit].format(expression)
+
+
+def raw_dimension(name):
+    """Spalte bzw. Ausdruck einer Dimension in battle_logs."""
+    if name == "day":
+        return func.date(BattleData.battle_time).label("day")
+    if name in TIME_BUCKETS:
+        return bucket_start(BattleData.battle_time, name).label(name)
+    return getattr(BattleData, name).label(name)
+
+
+def rollup_dimension(name):
+    """Spalte bzw. Ausdruck einer Dimension in der Rollup-Tabelle (Wochen und Monate aus dem Tag)."""
+    if name in TIME_BUCKETS:
+        return bucket_start(BattleDailyRollup.day, name).label(name)
+    return getattr(BattleDailyRollup, name).label(name)
+
+
+def raw_measures():
+    """Kennzahlen über Rohdaten aus battle_logs."""
+    return [
+        func.count().label('battles'),
+        func.sum(case((victory_condition(), 1), else_=0)).label('victories'),
+        func.coalesce(func.sum(BattleData.trophy_change), 0).label('trophy_change'),
+        func.coalesce(func.sum(BattleData.battle_duration), 0).label('duration_sum'),
+        func.count(BattleData.battle_duration).label('duration_count'),
+        func.min(BattleData.battle_time).label('first_battle'),
+        func.max(BattleData.battle_time).label('last_battle')
+    ]
+
+
+def rollup_measures():
+    """Kennzahlen über bereits verdichtete Tageswerte aus der Rollup-Tabelle."""
+    return [
+        func.sum(BattleDailyRollup.battles).label('battles'),
+        func.sum(BattleDailyRollup.victories).label('victories'),
+        func.sum(BattleDailyRollup.trophy_change).label('trophy_change'),
+        func.sum(BattleDailyRollup.duration_sum).label('duration_sum'),
+        func.sum(BattleDailyRollup.duration_count).label('duration_count'),
+        func.min(BattleDailyRollup.first_battle).label('first_battle'),
+        func.max(BattleDailyRollup.last_battle).label('last_battle')
+    ]
+
+
+def full_days(start_date=None, end_date=None):
+    """Erster und letzter vollständig im Zeitraum liegende Tag (None bei offenem Ende)."""
+    first_day = None
+    if start_date:
+        first_day = start_date.date() if start_date.time() == time.min else start_date.date() + timedelta(days=1)
+    last_day = None
+    if end_date:
+        last_day = end_date.date() if end_date.time() >= END_OF_DAY else end_date.date() - timedelta(days=1)
+    return first_day, last_day
+
+
+def split_range(player_tag=None, start_date=None, end_date=None):
+    """
+    Zerlegt einen Zeitraum in vollständig abgedeckte Tage (aus der Rollup-Tabelle) und angebrochene Randtage (aus Rohdaten).
+    Liefert (rollup_filters, raw_filter_lists); rollup_filters ist None, wenn kein ganzer Tag im Zeitraum liegt.
+    """
+    first_day, last_day = full_days(start_date, end_date)
+    if first_day and last_day and first_day > last_day:
+        return None, [build_filters(player_tag, start_date, end_date)]
+
+    rollup_filters = []
+    if player_tag:
+        rollup_filters.append(player_filter(BattleDailyRollup.player_tag, player_tag))
+    if first_day:
+        rollup_filters.append(BattleDailyRollup.day >= first_day)
+    if last_day:
+        rollup_filters.append(BattleDailyRollup.day <= last_day)
+
+    raw_filter_lists = []
+    if start_date and start_date < datetime.combine(first_day, time.min):
+        raw_filter_lists.append(
+            build_filters(player_tag, start_date) + [BattleData.battle_time < datetime.combine(first_day, time.min)]
+        )
+    if end_date and end_date >= datetime.combine(last_day + timedelta(days=1), time.min):
+        raw_filter_lists.append(
+            build_filters(player_tag, datetime.combine(last_day + timedelta(days=1), time.min), end_date)
+        )
+    return rollup_filters, raw_filter_lists
+
+
+def _normalize(row, dims, from_rollup):
+    """Wandelt eine Ergebniszeile in ein Dict mit einheitlichen Python-Typen um."""
+    grain = {}
+    for name in dims:
+        value = getattr(row, name)
+        if name == "day" and isinstance(value, str):
+            value = date.fromisoformat(value)  # SQLite liefert date() als String
+        elif name in TIME_BUCKETS and isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        elif from_rollup and value == '':
+            value = None  # Rollup speichert NULL als leeren String
+        grain[name] = value
+    for name in MEASURES:
+        value = getattr(row, name)
+        grain[name] = int(value) if isinstance(value, (int, Decimal)) else value
+    return grain
+
+
+def merge_grains(grains, dims):
+    """Fasst Grains auf die angegebenen Dimensionen zusammen (Summen bzw. Min/Max)."""
+    merged = {}
+    for grain in grains:
+        key = tuple(grain[name] for name in dims)
+        entry = merged.get(key)
+        if entry is None:
+            merged[key] = {**{name: grain[name] for name in dims}, **{name: grain[name] for name in MEASURES}}
+            continue
+        for name in ("battles", "victories", "trophy_change", "duration_sum", "duration_count"):
+            entry[name] += grain[name]
+        entry["first_battle"] = min(entry["first_battle"], grain["first_battle"])
+        entry["last_battle"] = max(entry["last_battle"], grain["last_battle"])
+    return list(merged.values())
+
+
+def fetch_grains(db, dims, player_tag=None, start_date=None, end_date=None):
+    """
+    Liefert die nach `dims` verdichteten Kennzahlen für Spieler und Zeitraum.
+    Ganze Tage werden aus der Rollup-Tabelle gelesen, nur angebrochene Randtage aus battle_logs.
+    Stunden-Buckets sind feiner als die Rollup-Tabelle und kommen immer aus battle_logs.
+    """
+    if not USE_ROLLUP or "hour" in dims:
+        return _raw_grains(db, dims, build_filters(player_tag, start_date, end_date))
+
+    rollup_filters, raw_filter_lists = split_range(player_tag, start_date, end_date)
+    grains = []
+    if rollup_filters is not None:
+        grains.extend(_rollup_grains(db, dims, rollup_filters))
+    for filters in raw_filter_lists:
+        grains.extend(_raw_grains(db, dims, filters))
+    return merge_grains(grains, dims)
+
+
+def count_players(db, player_tag=None, start_date=None, end_date=None):
+    """Anzahl unterschiedlicher Spieler im Zeitraum (über Rollup und Randtage hinweg)."""
+    if not USE_ROLLUP:
+        return db.query(func.count(func.distinct(BattleData.player_tag))).filter(
+            *build_filters(player_tag, start_date, end_date)
+        ).scalar()
+
+    rollup_filters, raw_filter_lists = split_range(player_tag, start_date, end_date)
+    parts = [select(BattleData.player_tag).where(*filters) for filters in raw_filter_lists]
+    if rollup_filters is not None:
+        parts.append(select(BattleDailyRollup.player_tag).where(*rollup_filters))
+    players = union(*parts).subquery() if len(parts) > 1 else parts[0].distinct().subquery()
+    return db.execute(select(func.count()).select_from(players)).scalar()
+
+
+def players(db, player_tag=None, start_date=None, end_date=None):
+    """Menge der Spieler-Tags mit Battles in battle_logs im Zeitraum."""
+    rows = db.query(BattleData.player_tag).filter(*build_filters(player_tag, start_date, end_date)).distinct()
+    return {tag for tag, in rows}
+
+
+# Ohne Treffer liefert eine Aggregation ohne GROUP BY eine Zeile mit NULL-Werten, daher `if row.battles`
+def _raw_grains(db, dims, filters):
+    columns = [raw_dimension(name) for name in dims]
+    rows = db.query(*columns, *raw_measures()).filter(*filters).group_by(*columns).all()
+    return [_normalize(row, dims, from_rollup=False) for row in rows if row.battles]
+
+
+def _rollup_grains(db, dims, filters):
+    columns = [rollup_dimension(name) for name in dims]
+    rows = db.query(*columns, *rollup_measures()).filter(*filters).group_by(*columns).all()
+    return [_normalize(row, dims, from_rollup=True) for row in rows if row.battles]
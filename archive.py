@@ -0,0 +1,325 @@
+"""
+Kalte Ablage (Cold Tier) für alte Battles: monatsweise partitionierte, zstd-komprimierte Parquet-Dateien
+(benötigt pyarrow).
+
+`python manage.py archive --before 2024-01-01` verschiebt alle Battles vor dem Stichtag (auf den Monatsanfang
+abgerundet) nach ARCHIVE_DIR/battle_logs/month=YYYY-MM/part-*.parquet und löscht sie aus battle_logs.
+Innerhalb einer Datei sind die Zeilen nach (player_tag, battle_time) sortiert, sodass die Row-Group-Statistiken
+Spielerfilter beschleunigen.
+
+Beim Lesen werden nur Monatspartitionen geöffnet, die den angefragten Zeitraum überschneiden (Partition
+Pruning), nur die benötigten Spalten gelesen (Column Pruning) und die Dateien per Memory-Map eingebunden.
+Anfragen, die nur archivfreie Monate betreffen, berühren das Archiv nicht.
+"""
+import json
+import os
+import uuid
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import delete, func, select
+
+from config import ARCHIVE_DIR
+from models import BattleData, BattleDailyDurations, BattleDailyPlayers, BattleDailyRollup
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow ist nur für das Archiv nötig
+    pa = None
+
+TABLE_DIR = "battle_logs"
+MANIFEST = "_manifest.json"
+ROW_GROUP_SIZE = 64 * 1024
+WRITE_BATCH_SIZE = 50000
+
+# Spalten, aus denen Grains berechnet werden
+GRAIN_COLUMNS = (
+    "player_tag", "battle_time", "brawler_name", "battle_mode", "event_map", "battle_result", "rank",
+    "trophy_change", "battle_duration"
+)
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Das Parquet-Archiv benötigt pyarrow (pip install pyarrow).")
+
+
+def _schema():
+    """Arrow-Schema der archivierten battle_logs-Spalten."""
+    types = {"String": pa.string(), "Integer": pa.int64(), "DateTime": pa.timestamp("us"), "Boolean": pa.bool_()}
+    return pa.schema([
+        pa.field(column.name, types[type(column.type).__name__], nullable=not column.primary_key)
+        for column in BattleData.__table__.columns
+    ])
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _root():
+    return os.path.join(ARCHIVE_DIR, TABLE_DIR)
+
+
+def archived_months():
+    """Monate mit mindestens einer Parquet-Datei (aus den Verzeichnisnamen month=YYYY-MM)."""
+    if not ARCHIVE_DIR or not os.path.isdir(_root()):
+        return []
+    months = []
+    for name in os.listdir(_root()):
+        if name.startswith("month="):
+            year, month = name[len("month="):].split("-")
+            months.append(date(int(year), int(month), 1))
+    return sorted(months)
+
+
+def version():
+    """Änderungsstand des Archivs (mtime des Manifests); None ohne Archiv."""
+    if not ARCHIVE_DIR:
+        return None
+    try:
+        return os.stat(os.path.join(_root(), MANIFEST)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _partitions(start_date=None, end_date=None):
+    """Dateien der Monatspartitionen, die den Zeitraum überschneiden (Partition Pruning)."""
+    paths = []
+    for month in archived_months():
+        if start_date and next_month(month) <= start_date.date():
+            continue
+        if end_date and month > end_date.date():
+            continue
+        directory = os.path.join(_root(), f"month={month:%Y-%m}")
+        paths.extend(os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith(".parquet"))
+    return paths
+
+
+def overlaps(start_date=None, end_date=None):
+    """True, wenn der Zeitraum archivierte Monate berührt."""
+    return bool(ARCHIVE_DIR) and bool(_partitions(start_date, end_date))
+
+
+# --- Archivieren ------------------------------------------------------------------
+
+def _write_month(connection, month, path):
+    """Schreibt alle Battles eines Monats sortiert nach (player_tag, battle_time) in eine Parquet-Datei."""
+    schema = _schema()
+    names = schema.names
+    query = select(*[BattleData.__table__.c[name] for name in names]).where(
+        BattleData.battle_time >= datetime.combine(month, time.min),
+        BattleData.battle_time < datetime.combine(next_month(month), time.min)
+    ).order_by(BattleData.player_tag, BattleData.battle_time, BattleData.brawler_id)
+
+    rows_written = 0
+    result = connection.execution_options(stream_results=True).execute(query)
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for rows in result.partitions(WRITE_BATCH_SIZE):
+            columns = list(zip(*rows))
+            writer.write_table(pa.table(dict(zip(names, columns)), schema=schema), row_group_size=ROW_GROUP_SIZE)
+            rows_written += len(rows)
+    return rows_written
+
+
+def _update_manifest(month, rows):
+    """Protokolliert einen archivierten Monat; die neue mtime signalisiert den Lesern die Änderung."""
+    path = os.path.join(_root(), MANIFEST)
+    manifest = {"runs": []}
+    if os.path.exists(path):
+        with open(path) as file:
+            manifest = json.load(file)
+    manifest["runs"].append({
+        "archived_at": datetime.now().isoformat(timespec="seconds"),
+        "month": f"{month:%Y-%m}",
+        "rows": rows,
+    })
+    with open(path + ".tmp", "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _delete_month(connection, month):
+    """Löscht die Battles eines Monats (tageweise) aus battle_logs und die Rollup- und Sketch-Tage des Monats."""
+    day = month
+    while day < next_month(month):
+        connection.execute(delete(BattleData).where(
+            BattleData.battle_time >= datetime.combine(day, time.min),
+            BattleData.battle_time < datetime.combine(day + timedelta(days=1), time.min)
+        ))
+        day += timedelta(days=1)
+    # Rollup-Tage des Monats würden sonst zusätzlich zum Archiv gezählt
+    connection.execute(delete(BattleDailyRollup).where(
+        BattleDailyRollup.day >= month, BattleDailyRollup.day < next_month(month)
+    ))
+    # Ebenso die Tages-Sketches; approx=true rechnet für archivierte Monate exakt über beide Schichten
+    for model in (BattleDailyPlayers, BattleDailyDurations):
+        connection.execute(delete(model).where(model.day >= month, model.day < next_month(month)))
+
+
+def archive_before(engine, cutoff):
+    """
+    Verschiebt alle Battles vor dem Monatsanfang von `cutoff` ins Archiv. Pro Monat wird in einer Transaktion
+    die Datei geschrieben, die Zeilen werden aus battle_logs sowie den Rollup- und Sketch-Tabellen gelöscht und
+    die Datei umbenannt; schlägt ein Schritt fehl, wird die Datei entfernt. Liefert {Monat: Anzahl Zeilen}.
+    """
+    _require_pyarrow()
+    if not ARCHIVE_DIR:
+        raise RuntimeError("ARCHIVE_DIR ist nicht gesetzt.")
+    cutoff = month_start(cutoff)
+
+    with engine.connect() as connection:
+        oldest = connection.execute(
+            select(func.min(BattleData.battle_time)).where(BattleData.battle_time < datetime.combine(cutoff, time.min))
+        ).scalar()
+    if oldest is None:
+        return {}
+
+    archived = {}
+    month = month_start(oldest)
+    while month < cutoff:
+        directory = os.path.join(_root(), f"month={month:%Y-%m}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet")
+        try:
+            with engine.begin() as connection:
+                rows = _write_month(connection, month, path + ".tmp")
+                if rows:
+                    _delete_month(connection, month)
+                    # Umbenennen vor dem Commit: scheitert der Commit, wird die Datei unten wieder entfernt
+                    os.replace(path + ".tmp", path)
+                    archived[month] = rows
+        except BaseException:
+            for leftover in (path, path + ".tmp"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+        finally:
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+            if not os.listdir(directory):
+                os.rmdir(directory)
+        if month in archived:
+            _update_manifest(month, archived[month])
+        month = next_month(month)
+    return archived
+
+
+# --- Abfragen ---------------------------------------------------------------------
+
+def _filter(player_tag=None, start_date=None, end_date=None):
+    """Arrow-Filterausdruck (wird für Row-Group-Pruning an die Parquet-Statistiken weitergereicht)."""
+    conditions = []
+    if isinstance(player_tag, (list, tuple)):
+        conditions.append(pc.field("player_tag").isin(list(player_tag)))
+    elif player_tag:
+        conditions.append(pc.field("player_tag") == player_tag)
+    if start_date:
+        conditions.append(pc.field("battle_time") >= pa.scalar(start_date, pa.timestamp("us")))
+    if end_date:
+        conditions.append(pc.field("battle_time") <= pa.scalar(end_date, pa.timestamp("us")))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _read(columns, player_tag=None, start_date=None, end_date=None):
+    """Liest die betroffenen Partitionen spalten- und zeilenweise gefiltert per Memory-Map."""
+    paths = _partitions(start_date, end_date)
+    if not paths:
+        return None
+    _require_pyarrow()
+    expression = _filter(player_tag, start_date, end_date)
+    tables = [pq.read_table(path, columns=list(columns), filters=expression, memory_map=True) for path in paths]
+    return pa.concat_tables(tables)
+
+
+def _victory(table):
+    """Victory-Bedingung wie aggregation.is_victory (NULL zählt nicht als Sieg)."""
+    mode, rank, result = table["battle_mode"], table["rank"], table["battle_result"]
+    showdown = pc.is_in(mode, value_set=pa.array(["duoShowdown", "soloShowdown"]))
+    victory = pc.if_else(
+        pc.equal(mode, "duoShowdown"), pc.less_equal(rank, 2),
+        pc.if_else(pc.equal(mode, "soloShowdown"), pc.less_equal(rank, 4),
+                   pc.and_(pc.invert(showdown), pc.equal(result, "victory")))
+    )
+    return pc.fill_null(victory, False)
+
+
+def _dimension(table, name):
+    battle_time = table["battle_time"]
+    if name == "day":
+        return pc.cast(battle_time, pa.date32())
+    if name == "hour":
+        return pc.floor_temporal(battle_time, unit="hour")
+    if name == "week":
+        return pc.floor_temporal(battle_time, unit="week", week_starts_monday=True)
+    if name == "month":
+        return pc.floor_temporal(battle_time, unit="month")
+    return table[name]
+
+
+def grains(dims, player_tag=None, start_date=None, end_date=None):
+    """Grains (wie aggregation.fetch_grains) aus den archivierten Monaten im Zeitraum; [] ohne Archivdaten."""
+    table = _read(GRAIN_COLUMNS, player_tag, start_date, end_date)
+    if table is None or not table.num_rows:
+        return []
+
+    duration = table["battle_duration"]
+    prepared = pa.table({
+        **{f"dim_{name}": _dimension(table, name) for name in dims},
+        "battle_time": table["battle_time"],
+        "victory": pc.cast(_victory(table), pa.int64()),
+        "trophy_change": pc.fill_null(table["trophy_change"], 0),
+        "duration": pc.fill_null(duration, 0),
+        "has_duration": pc.cast(pc.is_valid(duration), pa.int64()),
+    })
+    aggregated = prepared.group_by([f"dim_{name}" for name in dims]).aggregate([
+        ("battle_time", "count"), ("victory", "sum"), ("trophy_change", "sum"), ("duration", "sum"),
+        ("has_duration", "sum"), ("battle_time", "min"), ("battle_time", "max"),
+    ])
+
+    result = []
+    for row in aggregated.to_pylist():
+        grain = {name: row[f"dim_{name}"] for name in dims}
+        grain.update({
+            "battles": row["battle_time_count"],
+            "victories": row["victory_sum"],
+            "trophy_change": row["trophy_change_sum"],
+            "duration_sum": row["duration_sum"],
+            "duration_count": row["has_duration_sum"],
+            "first_battle": row["battle_time_min"],
+            "last_battle": row["battle_time_max"],
+        })
+        result.append(grain)
+    return result
+
+
+def duration_counts(dims, player_tag=None, start_date=None, end_date=None):
+    """
+    Häufigkeiten der Kampfdauer im Archiv: [(Gruppe nach `dims`, battle_duration, Anzahl)], ohne Battles ohne
+    Dauer. Grundlage der exakten Perzentile über beide Schichten (sketches.exact_duration_percentiles).
+    """
+    table = _read((*dims, "battle_duration"), player_tag, start_date, end_date)
+    if table is None or not table.num_rows:
+        return []
+    table = table.filter(pc.is_valid(table["battle_duration"]))
+    aggregated = table.group_by([*dims, "battle_duration"]).aggregate([([], "count_all")])
+    return [
+        (tuple(row[name] for name in dims), row["battle_duration"], row["count_all"])
+        for row in aggregated.to_pylist()
+    ]
+
+
+def players(player_tag=None, start_date=None, end_date=None):
+    """Menge der Spieler mit archivierten Battles im Zeitraum."""
+    table = _read(("player_tag",), player_tag, start_date, end_date)
+    if table is None:
+        return set()
+    return set(pc.unique(table["player_tag"]).to_pylist())
@@ -0,0 +1,95 @@
+"""
+Vergleicht p50/p99-Latenz des synchronen und des asynchronen Datenbankpfads
+unter vielen gleichzeitigen /brawler-statistics-Anfragen.
+
+Verwendung:
+    python -m benchmarks.async_vs_sync --rows 200000 --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import load_sqlite
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+async def _fire(concurrency, players):
+    """Schickt `concurrency` gleichzeitige Anfragen durch die ASGI-App und misst jede einzeln."""
+    import httpx
+    from main import app
+
+    async def one(client, i):
+        started = time.perf_counter()
+        response = await client.get("/brawler-statistics", params={"player_tag": f"#P{i % players:07d}"})
+        response.raise_for_status()
+        return time.perf_counter() - started
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await one(client, 0)  # Aufwärmen (Verbindungsaufbau, Import)
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(one(client, i) for i in range(concurrency)))
+        wall = time.perf_counter() - started
+    return latencies, wall
+
+
+def run_worker(args):
+    latencies, wall = asyncio.run(_fire(args.concurrency, args.players))
+    print(json.dumps({
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+        "wall_s": round(wall, 3),
+        "requests": len(latencies)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark: synchroner vs. asynchroner Datenbankpfad")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--database", help="Vorhandene SQLite-Datei verwenden statt neu zu generieren")
+    parser.add_argument("--worker", choices=("sync", "async"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    database = args.database
+    if not database:
+        database = os.path.join(tempfile.mkdtemp(), "bench.sqlite")
+        load_sqlite(database, args.rows, players=args.players)
+
+    results = {}
+    for mode in ("sync", "async"):
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{database}",
+            "USE_ASYNC_DB": "true" if mode == "async" else "false",
+            "CACHE_ENABLED": "false",  # jede Anfrage soll die Datenbank treffen
+        }
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.async_vs_sync", "--worker", mode,
+             "--concurrency", str(args.concurrency), "--players", str(args.players)],
+            env=env, check=True, capture_output=True, text=True
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'Modus':<8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'Wall s':>10}")
+    for mode, result in results.items():
+        print(f"{mode:<8}{result['p50_ms']:>10}{result['p99_ms']:>10}{result['max_ms']:>10}{result['wall_s']:>10}")
+
+
+if __name__ == "__main__":
+    main()
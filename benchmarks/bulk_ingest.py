@@ -0,0 +1,73 @@
+"""
+Misst den Durchsatz von POST /battle-data/bulk in Zeilen pro Sekunde.
+
+Verwendung:
+    python -m benchmarks.bulk_ingest --sizes 10000 100000 --batch-size 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.datagen import COLUMNS, generate_rows
+
+
+def _records(rows):
+    records = []
+    for values in generate_rows(rows, players=max(1, rows // 1000)):
+        record = dict(zip(COLUMNS, values))
+        record["battle_time"] = record["battle_time"].replace(" ", "T")
+        records.append(record)
+    return records
+
+
+async def _post(app, body, content_type, batch_size):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        response = await client.post(
+            "/battle-data/bulk", params={"batch_size": batch_size}, content=body,
+            headers={"content-type": content_type}
+        )
+        response.raise_for_status()
+        return response.json(), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark: Durchsatz der Bulk-Ingestion")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    # Eigene, leere SQLite-Datei; muss vor dem Import der App gesetzt sein
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bulk.sqlite')}"
+    os.environ["CACHE_ENABLED"] = "false"
+    from database import Base, get_engine
+    from main import app
+    from models import BattleData
+
+    # Die App legt Tabellen nur mit CREATE_SCHEMA_ON_STARTUP (im Lifespan) an, ASGITransport startet keinen Lifespan
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine)
+
+    print(f"{'Zeilen':>8}  {'Format':<7}{'Zeilen/s':>12}{'Server s':>10}{'Gesamt s':>10}")
+    for size in args.sizes:
+        records = _records(size)
+        bodies = {
+            "json": (json.dumps(records).encode(), "application/json"),
+            "ndjson": ("\n".join(json.dumps(record) for record in records).encode(), "application/x-ndjson"),
+        }
+        for name, (body, content_type) in bodies.items():
+            with engine.begin() as connection:
+                connection.execute(BattleData.__table__.delete())
+            result, total = asyncio.run(_post(app, body, content_type, args.batch_size))
+            print(f"{size:>8}  {name:<7}{result['rows_per_second']:>12.0f}"
+                  f"{result['elapsed_seconds']:>10.2f}{total:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Misst den Kaltstart eines uvicorn-Workers: Zeit vom Prozessstart bis zur ersten beantworteten Anfrage und
+deren Latenz, jeweils ohne und mit WARMUP_ON_STARTUP.
+
+Gemessen wird von außen (Start des Prozesses bis zur ersten Antwort auf --path) und zusätzlich die vom
+Worker selbst gemeldeten Startphasen (app_startup_phase_seconds, app_cold_start_seconds aus /metrics).
+
+Verwendung:
+    python -m benchmarks.cold_start --rows 1000000 --repeat 3
+    python -m benchmarks.cold_start --database bench.sqlite --path /map-statistics
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _gauges(text):
+    """Startphasen und Kaltstartzeit aus dem Prometheus-Text."""
+    values = {}
+    for line in text.splitlines():
+        if line.startswith("app_startup_phase_seconds{"):
+            phase = line.split('phase="', 1)[1].split('"', 1)[0]
+            values[phase] = float(line.rsplit(" ", 1)[1])
+        elif line.startswith("app_cold_start_seconds "):
+            values["cold_start"] = float(line.rsplit(" ", 1)[1])
+    return values
+
+
+def measure(database, path, warmup, timeout=300):
+    """Startet einen Worker und liefert (Sekunden bis zur ersten Antwort, deren Latenz, Gauges des Workers)."""
+    import httpx
+
+    port = _free_port()
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{database}", "CREATE_SCHEMA_ON_STARTUP": "false",
+           "WARMUP_ON_STARTUP": "true" if warmup else "false"}
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:create_app", "--factory", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn beendet mit Exit-Code {process.returncode}")
+                if time.perf_counter() - started > timeout:
+                    raise TimeoutError("Worker nicht rechtzeitig bereit")
+                request_started = time.perf_counter()
+                try:
+                    response = client.get(path)
+                except httpx.TransportError:
+                    time.sleep(0.01)  # Port noch nicht offen (Lifespan läuft noch)
+                    continue
+                finished = time.perf_counter()
+                response.raise_for_status()
+                break
+            gauges = _gauges(client.get("/metrics").text)
+    finally:
+        process.terminate()
+        process.wait()
+    return finished - started, finished - request_started, gauges
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark: Kaltstart eines Workers ohne und mit Warmup")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--path", default="/battle-statistics", help="Erste Anfrage (sollte in WARMUP_PATHS liegen)")
+    parser.add_argument("--database", help="Vorhandene SQLite-Datei verwenden statt neu zu generieren")
+    args = parser.parse_args()
+
+    database = args.database
+    if not database:
+        from benchmarks.datagen import load_sqlite
+
+        database = os.path.join(tempfile.mkdtemp(), "cold_start.sqlite")
+        started = time.perf_counter()
+        load_sqlite(database, args.rows, players=args.players)
+        print(f"{args.rows} Zeilen generiert in {time.perf_counter() - started:.1f} s")
+
+    print(f"{'Warmup':<8}{'Lauf':>5}{'bis Antwort s':>15}{'Anfrage ms':>12}"
+          f"{'import s':>10}{'warmup s':>10}{'ready s':>9}{'Worker s':>10}")
+    for warmup in (False, True):
+        for run in range(1, args.repeat + 1):
+            total, latency, gauges = measure(database, args.path, warmup)
+            print(f"{'an' if warmup else 'aus':<8}{run:>5}{total:>15.2f}{latency * 1000:>12.1f}"
+                  f"{gauges.get('import', 0):>10.2f}{gauges.get('warmup', 0):>10.2f}"
+                  f"{gauges.get('ready', 0):>9.2f}{gauges.get('cold_start', 0):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Vergleicht die Columnar-Engine mit dem SQL-Pfad für die Statistik-Endpunkte.
+
+Verwendung:
+    python -m benchmarks.columnar_vs_sql --rows 5000000
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+
+
+def _best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark: Columnar-Engine vs. SQL-Pfad")
+    parser.add_argument("--rows", type=int, default=5000000)
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--database", help="Vorhandene SQLite-Datei verwenden statt neu zu generieren")
+    args = parser.parse_args()
+
+    database = args.database
+    if not database:
+        from benchmarks.datagen import load_sqlite
+
+        database = os.path.join(tempfile.mkdtemp(), "columnar.sqlite")
+        started = time.perf_counter()
+        load_sqlite(database, args.rows, players=args.players)
+        print(f"{args.rows} Zeilen generiert in {time.perf_counter() - started:.1f} s")
+
+    # Der SQL-Pfad soll direkt auf battle_logs laufen, ohne Cache und ohne Rollup
+    os.environ.update({"DATABASE_URL": f"sqlite:///{database}", "USE_ROLLUP": "false",
+                       "USE_COLUMNAR_ENGINE": "false", "CACHE_ENABLED": "false"})
+    import stats
+    from columnar import ColumnStore
+    from database import SessionLocal, get_engine
+
+    started = time.perf_counter()
+    store = ColumnStore()
+    with get_engine().connect() as connection:
+        store.load(connection)
+    print(f"Columnar-Engine geladen in {time.perf_counter() - started:.1f} s ({store.size} Zeilen)\n")
+
+    scenarios = {
+        "alle Spieler": {},
+        "ein Spieler": {"player_tag": "#P0000001"},
+        "Zeitraum 30 Tage": {"start_date": datetime(2024, 2, 1), "end_date": datetime(2024, 3, 1, 23, 59, 59)},
+    }
+    reducers = {
+        "battle-statistics": (stats.BATTLE_DIMS, lambda g, f: stats.reduce_battle_statistics(g, store.count_players(**f))),
+        "brawler-statistics": (stats.BRAWLER_DIMS, lambda g, f: stats.reduce_brawler_statistics(g, f.get("player_tag"))),
+        "gamemode-statistics": (stats.GAMEMODE_DIMS, lambda g, f: stats.reduce_gamemode_statistics(g, f.get("player_tag"))),
+        "map-statistics": (stats.MAP_DIMS, lambda g, f: stats.reduce_map_statistics(g, f.get("player_tag"))),
+        "trophy-progress": (stats.TROPHY_DIMS, lambda g, f: stats.reduce_trophy_progress(g, f.get("player_tag"))),
+    }
+    sql_functions = {
+        "battle-statistics": stats.battle_statistics,
+        "brawler-statistics": stats.brawler_statistics,
+        "gamemode-statistics": stats.gamemode_statistics,
+        "map-statistics": stats.map_statistics,
+        "trophy-progress": stats.trophy_progress,
+    }
+
+    print(f"{'Endpunkt':<22}{'Szenario':<20}{'SQL ms':>10}{'Columnar ms':>13}{'Faktor':>9}  gleich")
+    db = SessionLocal()
+    try:
+        for endpoint, (dims, reduce) in reducers.items():
+            for scenario, filters in scenarios.items():
+                sql_time, sql_result = _best_of(lambda: sql_functions[endpoint](db, **filters), args.repeat)
+                col_time, col_result = _best_of(
+                    lambda: reduce(store.grains(dims, **filters), filters), args.repeat
+                )
+                print(f"{endpoint:<22}{scenario:<20}{sql_time * 1000:>10.1f}{col_time * 1000:>13.1f}"
+                      f"{sql_time / col_time:>8.1f}x  {'ja' if sql_result == col_result else 'NEIN'}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
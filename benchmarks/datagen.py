@@ -0,0 +1,128 @@
+"""
+Deterministischer Generator für synthetische battle_logs-Daten.
+
+Verwendung:
+    python -m benchmarks.datagen bench.sqlite --rows 100000
+    python -m benchmarks.datagen bench.sqlite --rows 1000000 --players 1000 --brawlers 80 --maps 60 --days 180
+"""
+import argparse
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+# Spalten in der Reihenfolge von battle_logs
+COLUMNS = (
+    "player_tag", "battle_time", "brawler_id", "brawler_name", "brawler_power", "brawler_trophies",
+    "brawler_trophy_change", "player_name", "event_id", "event_mode", "event_map", "battle_mode",
+    "battle_type", "battle_result", "battle_duration", "trophy_change", "rank", "is_star_player"
+)
+
+MODES = ("gemGrab", "brawlBall", "heist", "bounty", "knockout", "hotZone", "soloShowdown", "duoShowdown")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS battle_logs (
+    player_tag VARCHAR(50) NOT NULL,
+    battle_time DATETIME NOT NULL,
+    brawler_id INTEGER NOT NULL,
+    brawler_name VARCHAR(50),
+    brawler_power INTEGER,
+    brawler_trophies INTEGER,
+    brawler_trophy_change INTEGER,
+    player_name VARCHAR(50),
+    event_id INTEGER,
+    event_mode VARCHAR(50),
+    event_map VARCHAR(100),
+    battle_mode VARCHAR(50),
+    battle_type VARCHAR(50),
+    battle_result VARCHAR(10),
+    battle_duration INTEGER,
+    trophy_change INTEGER,
+    rank INTEGER,
+    is_star_player BOOLEAN,
+    PRIMARY KEY (player_tag, battle_time, brawler_id)
+)
+"""
+
+
+def generate_rows(rows, players=100, brawlers=60, maps=40, modes=len(MODES), days=90,
+                  start=datetime(2024, 1, 1), seed=42):
+    """Erzeugt `rows` Battles, gleichmäßig auf Spieler verteilt und pro Spieler zeitlich aufsteigend."""
+    rng = random.Random(seed)
+    modes = MODES[:modes]
+    # Jede Map gehört fest zu einem Modus, wie im Spiel
+    map_modes = [(f"Map {i:03d}", modes[i % len(modes)]) for i in range(maps)]
+    per_player = -(-rows // players)
+    step = max(2, days * 86400 // per_player)
+
+    produced = 0
+    for p in range(players):
+        player_tag = f"#P{p:07d}"
+        player_name = f"Player {p}"
+        for i in range(per_player):
+            if produced >= rows:
+                return
+            battle_time = start + timedelta(seconds=i * step + rng.randrange(step // 2))
+            brawler_id = 16000000 + rng.randrange(brawlers)
+            event_map, battle_mode = map_modes[rng.randrange(maps)]
+            trophies = rng.randrange(0, 1000)
+
+            if battle_mode == "soloShowdown":
+                rank, result, duration = rng.randint(1, 10), None, None
+                trophy_change = 9 - 2 * rank if rank <= 4 else -(rank - 4)
+            elif battle_mode == "duoShowdown":
+                rank, result, duration = rng.randint(1, 5), None, None
+                trophy_change = 9 - 3 * rank if rank <= 2 else -(rank - 1)
+            else:
+                rank = None
+                result = rng.choices(("victory", "defeat", "draw"), (48, 47, 5))[0]
+                duration = rng.randint(60, 240)
+                trophy_change = {"victory": 8, "defeat": -6, "draw": 0}[result]
+
+            yield (
+                player_tag, battle_time.strftime("%Y-%m-%d %H:%M:%S.000000"), brawler_id,
+                f"BRAWLER {brawler_id - 16000000:02d}", rng.randint(1, 11), trophies, trophy_change,
+                player_name, 15000000 + map_modes.index((event_map, battle_mode)), battle_mode, event_map,
+                battle_mode, "ranked", result, duration, trophy_change, rank, rng.random() < 0.15
+            )
+            produced += 1
+
+
+def load_sqlite(path, rows, batch_size=50000, **options):
+    """Legt battle_logs in einer SQLite-Datei an und füllt sie mit generierten Daten."""
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("DROP TABLE IF EXISTS battle_logs")
+        connection.execute(SCHEMA)
+        insert = f"INSERT INTO battle_logs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        batch = []
+        for row in generate_rows(rows, **options):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                connection.executemany(insert, batch)
+                batch.clear()
+        if batch:
+            connection.executemany(insert, batch)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetische battle_logs-Daten in eine SQLite-Datei schreiben")
+    parser.add_argument("database", help="Pfad der SQLite-Datei")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--brawlers", type=int, default=60)
+    parser.add_argument("--maps", type=int, default=40)
+    parser.add_argument("--modes", type=int, default=len(MODES), choices=range(1, len(MODES) + 1))
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--start", type=datetime.fromisoformat, default=datetime(2024, 1, 1))
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    load_sqlite(args.database, args.rows, players=args.players, brawlers=args.brawlers, maps=args.maps,
+                modes=args.modes, days=args.days, start=args.start, seed=args.seed)
+    print(f"{args.rows} Battles nach {args.database} geschrieben.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Benchmark-Harness für alle lesenden Endpunkte.
+
+Für jede Datenmenge wird eine SQLite-Datei mit synthetischen Battles erzeugt (bzw. aus --data-dir
+wiederverwendet) und die ASGI-App in einem eigenen Prozess durch httpx angesprochen. Pro Endpunkt werden
+Latenz-Perzentile, Anzahl SQL-Queries pro Anfrage und der Peak-RSS des Prozesses gemessen. Die Ergebnisse
+landen als JSON-Datei; mit --baseline wird gegen einen früheren Lauf verglichen und bei einer Regression
+über --threshold mit Exit-Code 1 abgebrochen.
+
+Verwendung:
+    python -m benchmarks.harness --sizes 10000 1000000 10000000 --output bench.json
+    python -m benchmarks.harness --sizes 10000 --baseline bench.json --threshold 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+from benchmarks.async_vs_sync import percentile
+from benchmarks.datagen import load_sqlite
+
+# Spieler, dessen Daten die spielerbezogenen Anfragen abfragen
+BENCH_PLAYER = "#P0000001"
+
+# Regressionen unterhalb dieser absoluten Differenz gelten als Messrauschen
+NOISE_FLOOR_MS = 2.0
+
+
+def requests(options, key):
+    """Die gemessenen Anfragen als (Name, Pfad, Query-Parameter)."""
+    start = options["start"] + timedelta(days=options["days"] // 3)
+    window = {"start_date": start.isoformat(), "end_date": (start + timedelta(days=30)).isoformat()}
+    player = {"player_tag": BENCH_PLAYER}
+    tag = quote(BENCH_PLAYER, safe="")  # "#" im Pfad würde sonst als Fragment abgeschnitten
+    cases = [
+        ("battle-data (Seite)", "/battle-data", {"limit": 1000}),
+        ("battle-data (NDJSON)", "/battle-data", {"format": "ndjson", "limit": 10000}),
+        ("battle-data/{player_tag}", f"/battle-data/{tag}", {"limit": 1000}),
+        ("battle-data/{key}", "/battle-data/{}/{}/{}".format(*(quote(str(part), safe="") for part in key)), {}),
+    ]
+    for endpoint in ("battle-statistics", "trophy-progress", "brawler-statistics", "gamemode-statistics",
+                     "map-statistics", "player-dashboard"):
+        cases.append((f"{endpoint} (Spieler)", f"/{endpoint}", player))
+        if endpoint != "player-dashboard":
+            cases.append((f"{endpoint} (30 Tage)", f"/{endpoint}", window))
+    return cases
+
+
+def _count_queries():
+    """Zählt alle SQL-Statements, die über die (synchrone bzw. asynchrone) Engine der App laufen."""
+    from sqlalchemy import event
+
+    import database
+
+    counter = {"queries": 0}
+
+    def before_cursor_execute(*args):
+        counter["queries"] += 1
+
+    for engine in database.get_engines().sync_engines():
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    return counter
+
+
+def _peak_rss_mb():
+    # ru_maxrss ist auf Linux in KiB, auf macOS in Byte angegeben
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+async def _measure(cases, repeat):
+    import httpx
+
+    from main import app
+
+    counter = _count_queries()
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, path, params in cases:
+            await client.get(path, params=params)  # Aufwärmen
+            latencies, queries = [], []
+            for _ in range(repeat):
+                before = counter["queries"]
+                started = time.perf_counter()
+                response = await client.get(path, params=params)
+                latencies.append(time.perf_counter() - started)
+                queries.append(counter["queries"] - before)
+            results[name] = {
+                "status": response.status_code,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                "max_ms": round(max(latencies) * 1000, 2),
+                "queries": max(queries),
+                "response_bytes": len(response.content),
+                "peak_rss_mb": _peak_rss_mb(),
+            }
+    return results
+
+
+def run_worker(args):
+    """Läuft im Unterprozess mit gesetzter DATABASE_URL und misst alle Anfragen gegen eine Datenmenge."""
+    options = json.loads(args.worker)
+    import manage
+
+    # Sekundärindizes wie in Produktion anlegen (create_all allein ergänzt sie nicht auf bestehenden Tabellen)
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            manage.create_indexes(args)
+        finally:
+            sys.stdout = stdout
+
+    connection = sqlite3.connect(options["database"])
+    # battle_time im gespeicherten Format übergeben, damit der Vergleich auch auf SQLite trifft
+    key = connection.execute(
+        "SELECT player_tag, battle_time, brawler_id FROM battle_logs WHERE player_tag = ? LIMIT 1", (BENCH_PLAYER,)
+    ).fetchone()
+    connection.close()
+
+    options["start"] = datetime.fromisoformat(options["start"])
+    results = asyncio.run(_measure(requests(options, key), args.repeat))
+    print(json.dumps({"endpoints": results, "peak_rss_mb": _peak_rss_mb()}))
+
+
+def prepare_database(data_dir, rows, options):
+    """Erzeugt die SQLite-Datei für eine Datenmenge; vorhandene Dateien mit gleichen Parametern werden wiederverwendet."""
+    name = "bench_{rows}_{players}p_{brawlers}b_{maps}m_{modes}g_{days}d_{seed}.sqlite".format(rows=rows, **options)
+    path = os.path.join(data_dir, name)
+    if os.path.exists(path):
+        return path, 0.0
+    started = time.perf_counter()
+    load_sqlite(path + ".tmp", rows, start=datetime.fromisoformat(options["start"]),
+                **{k: v for k, v in options.items() if k != "start"})
+    os.replace(path + ".tmp", path)
+    return path, round(time.perf_counter() - started, 1)
+
+
+def compare(current, baseline, threshold):
+    """Liefert die Regressionen (p50-Latenz oder Query-Anzahl) gegenüber einem früheren Lauf."""
+    regressions = []
+    for size, result in current["sizes"].items():
+        previous = baseline.get("sizes", {}).get(size)
+        if not previous:
+            continue
+        for name, measured in result["endpoints"].items():
+            before = previous["endpoints"].get(name)
+            if not before:
+                continue
+            if (measured["p50_ms"] > before["p50_ms"] * (1 + threshold)
+                    and measured["p50_ms"] - before["p50_ms"] > NOISE_FLOOR_MS):
+                regressions.append(f"{size} Zeilen, {name}: p50 {before['p50_ms']} ms -> {measured['p50_ms']} ms")
+            if measured["queries"] > before["queries"]:
+                regressions.append(f"{size} Zeilen, {name}: Queries {before['queries']} -> {measured['queries']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark aller lesenden Endpunkte über die ASGI-App")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 1000000, 10000000])
+    parser.add_argument("--repeat", type=int, default=10, help="Anfragen pro Endpunkt (nach einer Aufwärmanfrage)")
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--brawlers", type=int, default=60)
+    parser.add_argument("--maps", type=int, default=40)
+    parser.add_argument("--modes", type=int, default=8)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--start", default="2024-01-01")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=os.path.join(os.getcwd(), ".benchmarks"),
+                        help="Ablage der generierten SQLite-Dateien (werden wiederverwendet)")
+    parser.add_argument("--cache", action="store_true", help="Ergebnis-Cache aktiviert lassen")
+    parser.add_argument("--output", help="Ergebnisse als JSON speichern")
+    parser.add_argument("--baseline", help="JSON eines früheren Laufs, gegen den verglichen wird")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Erlaubte relative p50-Verschlechterung")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    options = {"players": args.players, "brawlers": args.brawlers, "maps": args.maps, "modes": args.modes,
+               "days": args.days, "start": datetime.fromisoformat(args.start).isoformat(), "seed": args.seed}
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "repeat": args.repeat,
+        "options": options,
+        "sizes": {},
+    }
+
+    for rows in args.sizes:
+        database, generated_in = prepare_database(args.data_dir, rows, options)
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{database}",
+            "CACHE_ENABLED": "true" if args.cache else "false",
+        }
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.harness", "--worker", json.dumps({**options, "database": database}),
+             "--repeat", str(args.repeat)],
+            env=env, check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result["generated_in_s"] = generated_in
+        report["sizes"][str(rows)] = result
+
+        print(f"\n{rows} Zeilen (Peak-RSS {result['peak_rss_mb']} MB)")
+        print(f"{'Anfrage':<34}{'Status':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'Queries':>9}")
+        for name, measured in result["endpoints"].items():
+            print(f"{name:<34}{measured['status']:>7}{measured['p50_ms']:>10}{measured['p95_ms']:>10}"
+                  f"{measured['p99_ms']:>10}{measured['queries']:>9}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.threshold)
+        if regressions:
+            print("\nRegressionen gegenüber der Baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nKeine Regression gegenüber der Baseline.")
+
+
+if __name__ == "__main__":
+    main()
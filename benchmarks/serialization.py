@@ -0,0 +1,106 @@
+"""
+Vergleicht den bisherigen Serialisierungspfad der battle-data-Endpunkte (ORM-Objekte, zeilenweise Validierung
+über BattleDataRead, Standard-JSON-Encoder) mit dem schnellen Pfad (Row-Tupel, orjson) bei einer Seite
+mit 100k Zeilen, jeweils über eine ASGI-App, sowie für NDJSON.
+
+Verwendung:
+    python -m benchmarks.serialization --rows 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import List
+
+from benchmarks.datagen import load_sqlite
+
+
+def _best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark: Serialisierung großer battle-data-Antworten")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--database", help="Vorhandene SQLite-Datei verwenden statt neu zu generieren")
+    args = parser.parse_args()
+
+    database = args.database
+    if not database:
+        database = os.path.join(tempfile.mkdtemp(), "serialization.sqlite")
+        load_sqlite(database, args.rows, players=1)
+    os.environ.update({"DATABASE_URL": f"sqlite:///{database}", "CACHE_ENABLED": "false"})
+
+    import httpx
+    from fastapi import FastAPI
+
+    from database import SessionLocal
+    from models import BattleData
+    from pagination import KEY_COLUMNS, read_page
+    from schemas import BattleDataRead
+    from serialization import FastJSONResponse, ndjson_lines, orjson, row_dicts
+
+    # Beide Varianten als eigene App, damit eine einzige Seite mit allen Zeilen ausgeliefert werden kann
+    legacy, fast = FastAPI(), FastAPI()
+
+    @legacy.get("/battle-data", response_model=List[BattleDataRead])
+    def legacy_page():
+        db = SessionLocal()
+        try:
+            return db.query(BattleData).order_by(*KEY_COLUMNS).limit(args.rows).all()
+        finally:
+            db.close()
+
+    @fast.get("/battle-data", response_model=List[BattleDataRead])
+    def fast_page():
+        db = SessionLocal()
+        try:
+            return FastJSONResponse(row_dicts(read_page(db, [], None, args.rows)))
+        finally:
+            db.close()
+
+    async def fetch(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/battle-data")
+            response.raise_for_status()
+            return response.content
+
+    db = SessionLocal()
+    try:
+        entries = db.query(BattleData).order_by(*KEY_COLUMNS).limit(args.rows).all()
+        rows = read_page(db, [], None, args.rows)
+    finally:
+        db.close()
+
+    measurements = {
+        "JSON-Seite (ASGI)": (
+            lambda: asyncio.run(fetch(legacy)),
+            lambda: asyncio.run(fetch(fast)),
+        ),
+        "NDJSON (nur Kodierung)": (
+            lambda: "".join(BattleDataRead.model_validate(entry).model_dump_json() + "\n" for entry in entries),
+            lambda: ndjson_lines(rows),
+        ),
+    }
+
+    print(f"{len(rows)} Zeilen, Encoder: {'orjson' if orjson else 'json (Fallback)'}\n")
+    print(f"{'Pfad':<26}{'bisher s':>10}{'schnell s':>11}{'Faktor':>9}")
+    for name, (legacy_fn, fast_fn) in measurements.items():
+        legacy_time, legacy_body = _best_of(legacy_fn, args.repeat)
+        fast_time, fast_body = _best_of(fast_fn, args.repeat)
+        if name.startswith("JSON") and json.loads(legacy_body) != json.loads(fast_body):
+            raise AssertionError("Die Antworten beider Pfade unterscheiden sich.")
+        print(f"{name:<26}{legacy_time:>10.3f}{fast_time:>11.3f}{legacy_time / fast_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
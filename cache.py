@@ -0,0 +1,205 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import func
+
+from aggregation import player_filter
+from config import CACHE_ENABLED, CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, CACHE_STALE_SECONDS, cache_ttl
+from models import BattleData
+
+
+class ResultCache:
+    """
+    Begrenzter In-Process-Cache für Statistik-Ergebnisse.
+    Einträge laufen nach ihrer TTL ab, werden bei Überschreiten von Anzahl oder Größe nach LRU verdrängt
+    und verfallen, sobald sich das Daten-Watermark (max(battle_time), Anzahl Battles) des Spielers
+    verschiebt. Für Schlüssel, die im Hintergrund neu berechnet werden, darf lookup() veraltete Einträge
+    noch eine Weile ausliefern (stale-while-revalidate).
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, watermark, expires_at, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_hits = 0
+
+    def get(self, key, watermark):
+        """Liefert (True, Wert) bei einem gültigen Treffer, sonst (False, None)."""
+        state, value = self.lookup(key, watermark)
+        return state == "hit", value
+
+    def lookup(self, key, watermark, stale_seconds: float = 0.0):
+        """
+        Liefert ("hit", Wert) bei einem gültigen Treffer, ("stale", Wert) für einen abgelaufenen bzw. durch ein
+        neues Watermark überholten Eintrag, der höchstens stale_seconds über seine TTL hinaus alt ist,
+        sonst ("miss", None). Veraltete Einträge bleiben bis zur Neuberechnung erhalten.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, cached_watermark, expires_at, _ = entry
+                now = time.monotonic()
+                expired = expires_at <= now
+                if not expired and cached_watermark == watermark:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return "hit", value
+                if stale_seconds and now < expires_at + stale_seconds:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    return "stale", value
+                if expired:
+                    self.expirations += 1
+                else:
+                    self.invalidations += 1
+                self._remove(key)
+            self.misses += 1
+            return "miss", None
+
+    def peek(self, key):
+        """(Watermark, verbleibende TTL in Sekunden) eines Eintrags ohne Zähler und LRU-Update; None ohne Eintrag."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            return entry[1], entry[2] - time.monotonic()
+
+    def set(self, key, value, watermark, ttl: float):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, watermark, time.monotonic() + ttl, size)
+            self._size += size
+            # LRU-Verdrängung, bis Anzahl und Größe wieder im Rahmen sind
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_players(self, player_tags):
+        """
+        Entfernt alle Einträge, deren Ergebnis von diesen Spielern abhängt: ihre eigenen, Batch-Einträge mit
+        einem von ihnen und Einträge über alle Spieler. Liefert die Anzahl entfernter Einträge.
+        """
+        player_tags = set(player_tags)
+        if not player_tags:
+            return 0
+        with self._lock:
+            stale = [
+                key for key in self._entries
+                if key[1] is None or (key[1] in player_tags if isinstance(key[1], str) else not player_tags.isdisjoint(key[1]))
+            ]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        self._size -= self._entries.pop(key)[3]
+
+    def statistics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_hits": self.stale_hits,
+                "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0
+            }
+
+
+result_cache = ResultCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES)
+
+# Hintergrund-Neuberechnung häufig angefragter Schlüssel (precompute.Scheduler); None, solange keiner läuft
+revalidator = None
+
+# Importzähler dieses Workers; upsert_batch erhöht ihn nach jedem Commit (Teil des globalen Watermarks)
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def bump_generation():
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+
+def watermark(db, player_tag=None):
+    """
+    Daten-Watermark (max(battle_time), Anzahl Battles) des Spielers bzw. der Spieler einer Batch-Abfrage;
+    zugleich der Validator für ETag/Last-Modified (conditional.py). Die Anzahl erfasst auch nachgetragene ältere
+    Battles; überschriebene Battles entfernt upsert_batch per invalidate_players aus dem Cache.
+
+    Über alle Spieler wäre count(*) ein Scan der ganzen Tabelle bei jeder Anfrage. Dort besteht das Watermark aus
+    max(battle_time) (eine Index-Suche) und dem Importzähler dieses Workers; der Zähler wird vor der Abfrage
+    gelesen, damit ein Wert nie unter einem neueren Zähler gespeichert wird, als er Daten gesehen hat.
+    """
+    if not player_tag:
+        generation = _generation
+        return db.query(func.max(BattleData.battle_time)).scalar(), generation
+    query = db.query(func.max(BattleData.battle_time), func.count())
+    query = query.filter(player_filter(BattleData.player_tag, player_tag))
+    return tuple(query.one())
+
+
+def cache_key(endpoint, player_tag=None, start_date=None, end_date=None, **options):
+    """Normalisierter Cache-Schlüssel aus Endpunkt, Filterparametern und weiteren Optionen des Endpunkts."""
+    return (
+        endpoint,
+        player_tag or None,
+        start_date.isoformat() if start_date else None,
+        end_date.isoformat() if end_date else None,
+        tuple(sorted(options.items()))
+    )
+
+
+def cached_statistics(db, endpoint, compute, player_tag=None, start_date=None, end_date=None, version=None, **options):
+    """
+    Liefert (Ergebnis, veraltet) für compute(db, ..., **options) aus dem Cache oder berechnet und speichert es.
+    version ist das bereits für ETag/Last-Modified gelesene Watermark der Anfrage (sonst wird es hier gelesen);
+    veraltet ist ein Wert, der per stale-while-revalidate noch zu einem älteren Watermark gehört.
+    """
+    if not CACHE_ENABLED:
+        return compute(db, player_tag, start_date, end_date, **options), False
+
+    key = cache_key(endpoint, player_tag, start_date, end_date, **options)
+    current = version if version is not None else watermark(db, player_tag)
+    scheduler = revalidator
+    if scheduler is not None and scheduler.track(key, endpoint, compute, player_tag, start_date, end_date, options):
+        # Heißer Schlüssel: veralteten Wert sofort ausliefern und die Neuberechnung dem Scheduler überlassen
+        state, value = result_cache.lookup(key, current, CACHE_STALE_SECONDS)
+        if state == "stale":
+            scheduler.enqueue(key)
+        if state != "miss":
+            return value, state == "stale"
+    else:
+        found, value = result_cache.get(key, current)
+        if found:
+            return value, False
+
+    value = compute(db, player_tag, start_date, end_date, **options)
+    result_cache.set(key, value, current, cache_ttl(endpoint))
+    return value, False
@@ -0,0 +1,50 @@
+"""
+Single-Flight: gleichzeitige identische Statistik-Anfragen teilen sich eine Berechnung.
+
+Der Schlüssel ist der normalisierte Cache-Schlüssel (Endpunkt, player_tag, Zeitraum, Optionen) mit dem
+Watermark der Anfrage, Ergebnis und ETag gehören also zum selben Stand. Die erste Anfrage startet die
+Berechnung als eigenen Task, alle weiteren mit gleichem Schlüssel warten, solange er läuft, auf dessen
+Ergebnis bzw. Exception (auch HTTPException wie 404 geht an alle Wartenden). Da vor der Übergabe an den
+Runner zusammengefasst wird, gilt das für den synchronen Pfad (Threadpool) wie für den asynchronen; wartende
+Anfragen belegen weder einen Thread noch eine Datenbankverbindung. Die Berechnung öffnet ihre eigene Session
+(main.run_statistics), nicht die der ersten Anfrage; bricht diese ab (Client-Disconnect) und get_db schließt
+ihre Session, läuft die Berechnung für die übrigen weiter.
+"""
+import asyncio
+import weakref
+
+from metrics import COALESCED_REQUESTS, COALESCING_EXECUTIONS
+
+
+class SingleFlight:
+    """Laufende Berechnungen pro Event-Loop und Schlüssel."""
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()  # Event-Loop -> {Schlüssel: Task}
+
+    def in_flight(self) -> int:
+        return sum(len(calls) for calls in self._calls.values())
+
+    async def run(self, key, label, fn, *args, **kwargs):
+        """Führt `await fn(*args, **kwargs)` aus oder schließt sich einer laufenden Ausführung mit gleichem Schlüssel an."""
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        task = calls.get(key)
+        if task is None:
+            COALESCING_EXECUTIONS.labels(label).inc()
+            task = calls[key] = loop.create_task(fn(*args, **kwargs))
+            task.add_done_callback(lambda done: self._finished(calls, key, done))
+        else:
+            COALESCED_REQUESTS.labels(label).inc()
+        # shield: der Abbruch einer einzelnen Anfrage bricht nicht die gemeinsame Berechnung ab
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _finished(calls, key, task):
+        if calls.get(key) is task:
+            del calls[key]
+        if not task.cancelled():
+            task.exception()  # gilt als abgeholt, auch wenn alle Wartenden abgebrochen wurden
+
+
+statistics_flight = SingleFlight()
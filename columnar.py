@@ -0,0 +1,304 @@
+"""
+Optionale spaltenorientierte In-Memory-Engine für die Statistik-Endpunkte (benötigt numpy).
+
+battle_logs wird einmalig in NumPy-Arrays geladen; String-Spalten werden dictionary-kodiert,
+die Victory-Bedingung wird beim Laden ausgewertet. Statistiken entstehen dann aus Masken und
+sortierten Gruppen (np.add/minimum/maximum.reduceat) ohne SQL-Roundtrip.
+"""
+import threading
+import time as _time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select
+
+import archive
+from aggregation import MEASURES, is_victory
+from config import COLUMNAR_CATCHUP_OVERLAP_SECONDS, COLUMNAR_REFRESH_SECONDS, USE_COLUMNAR_ENGINE
+from models import BattleData
+
+try:
+    import numpy as np
+except ImportError:  # numpy ist nur für die Columnar-Engine nötig
+    np = None
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_DATE = date(1970, 1, 1)
+
+# Dictionary-kodierte String-Spalten
+STRING_COLUMNS = ("player_tag", "brawler_name", "battle_mode", "event_map")
+LOAD_COLUMNS = (
+    BattleData.player_tag, BattleData.battle_time, BattleData.brawler_id, BattleData.brawler_name,
+    BattleData.battle_mode, BattleData.event_map, BattleData.battle_result, BattleData.rank,
+    BattleData.trophy_change, BattleData.battle_duration
+)
+LOAD_BATCH_SIZE = 100000
+
+
+class Dictionary:
+    """Bidirektionale Zuordnung String <-> Integer-Code (None ist ein gewöhnlicher Wert)."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class ColumnStore:
+    """Spaltenspeicher für battle_logs mit inkrementellem Anhängen neuer bzw. geänderter Zeilen."""
+
+    # Spaltenname -> dtype
+    ARRAYS = {
+        "player_tag": "int32", "brawler_name": "int32", "battle_mode": "int32", "event_map": "int32",
+        "battle_time": "int64", "brawler_id": "int64", "victory": "bool", "trophy_change": "int64",
+        "battle_duration": "int64", "has_duration": "bool", "valid": "bool"
+    }
+
+    def __init__(self):
+        if np is None:
+            raise RuntimeError("Die Columnar-Engine benötigt numpy (pip install numpy).")
+        self.dictionaries = {name: Dictionary() for name in STRING_COLUMNS}
+        self.columns = {name: np.zeros(0, dtype=dtype) for name, dtype in self.ARRAYS.items()}
+        self.size = 0
+        self.max_battle_time = None
+        self.refreshed_at = 0.0
+        self.archive_version = None
+        self._lock = threading.RLock()
+
+    # --- Laden und Anhängen -------------------------------------------------
+
+    def load(self, connection):
+        """Lädt battle_logs vollständig, in Blöcken über einen serverseitigen Cursor."""
+        result = connection.execution_options(stream_results=True).execute(select(*LOAD_COLUMNS))
+        for rows in result.partitions(LOAD_BATCH_SIZE):
+            self._append(rows)
+        self.refreshed_at = _time.monotonic()
+
+    def catch_up(self, connection):
+        """
+        Hängt Zeilen an, die seit dem letzten Laden hinzugekommen sind. Um verspätet eingetroffene Battles
+        mitzunehmen, wird ein Überlappungsfenster vor dem jüngsten geladenen battle_time erneut gelesen;
+        bereits vorhandene Schlüssel werden übersprungen statt doppelt gezählt.
+        """
+        query = select(*LOAD_COLUMNS)
+        if self.max_battle_time is not None:
+            since = self.max_battle_time - timedelta(seconds=COLUMNAR_CATCHUP_OVERLAP_SECONDS)
+            query = query.where(BattleData.battle_time >= since)
+        rows = connection.execute(query).all()
+        with self._lock:
+            positions = self._existing_positions(rows)
+            missing = [row for row, position in zip(rows, positions) if position is None]
+            if missing:
+                self._append(missing)
+        self.refreshed_at = _time.monotonic()
+
+    def upsert(self, rows):
+        """Fügt Zeilen an; existiert der Schlüssel bereits, wird die alte Zeile ungültig markiert."""
+        with self._lock:
+            for position in self._existing_positions(rows):
+                if position is not None:
+                    self.columns["valid"][position] = False
+            self._append(rows)
+
+    def _existing_positions(self, rows):
+        """Position der gültigen Zeile mit gleichem Schlüssel (oder None) für jede übergebene Zeile."""
+        if not self.size or not rows:
+            return [None] * len(rows)
+        # Kandidaten vektorisiert über Spieler und Zeitfenster eingrenzen, dann exakt per Schlüssel abgleichen
+        player_codes = [self.dictionaries["player_tag"].codes.get(row.player_tag) for row in rows]
+        player_codes = np.array([code for code in player_codes if code is not None], dtype="int32")
+        if not player_codes.size:
+            return [None] * len(rows)
+        times = [_seconds(row.battle_time) for row in rows]
+        n = self.size
+        candidates = np.flatnonzero(
+            self.columns["valid"][:n]
+            & np.isin(self.columns["player_tag"][:n], player_codes)
+            & (self.columns["battle_time"][:n] >= min(times))
+            & (self.columns["battle_time"][:n] <= max(times))
+        )
+        players = self.dictionaries["player_tag"].values
+        positions = {
+            (players[p], int(t), int(b)): int(i) for i, p, t, b in zip(
+                candidates,
+                self.columns["player_tag"][candidates],
+                self.columns["battle_time"][candidates],
+                self.columns["brawler_id"][candidates]
+            )
+        }
+        return [positions.get((row.player_tag, seconds, row.brawler_id)) for row, seconds in zip(rows, times)]
+
+    def _append(self, rows):
+        with self._lock:
+            count = len(rows)
+            self._reserve(self.size + count)
+            start, end = self.size, self.size + count
+            for name in STRING_COLUMNS:
+                encode = self.dictionaries[name].encode
+                self.columns[name][start:end] = [encode(getattr(row, name)) for row in rows]
+            self.columns["battle_time"][start:end] = [_seconds(row.battle_time) for row in rows]
+            self.columns["brawler_id"][start:end] = [row.brawler_id for row in rows]
+            self.columns["victory"][start:end] = [
+                is_victory(row.battle_mode, row.rank, row.battle_result) for row in rows
+            ]
+            self.columns["trophy_change"][start:end] = [row.trophy_change or 0 for row in rows]
+            self.columns["battle_duration"][start:end] = [row.battle_duration or 0 for row in rows]
+            self.columns["has_duration"][start:end] = [row.battle_duration is not None for row in rows]
+            self.columns["valid"][start:end] = True
+            self.size = end
+
+            latest = max(row.battle_time for row in rows) if rows else None
+            if latest is not None and (self.max_battle_time is None or latest > self.max_battle_time):
+                self.max_battle_time = latest
+
+    def _reserve(self, capacity):
+        """Vergrößert die Arrays amortisiert (Verdopplung), damit Anhängen nicht jedes Mal kopiert."""
+        current = len(self.columns["valid"])
+        if capacity <= current:
+            return
+        new_capacity = max(capacity, current * 2, 1024)
+        for name, array in self.columns.items():
+            grown = np.zeros(new_capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.columns[name] = grown
+
+    # --- Abfragen ----------------------------------------------------------
+
+    def _mask(self, player_tag=None, start_date=None, end_date=None):
+        n = self.size
+        mask = self.columns["valid"][:n].copy()
+        if isinstance(player_tag, (list, tuple)):
+            # Batch-Abfrage über mehrere Spieler; unbekannte Tags haben keinen Code und keine Zeilen
+            codes = [self.dictionaries["player_tag"].codes.get(tag) for tag in player_tag]
+            mask &= np.isin(self.columns["player_tag"][:n], [code for code in codes if code is not None])
+        elif player_tag:
+            code = self.dictionaries["player_tag"].codes.get(player_tag)
+            if code is None:
+                return np.zeros(n, dtype=bool)
+            mask &= self.columns["player_tag"][:n] == code
+        if start_date:
+            mask &= self.columns["battle_time"][:n] >= _seconds(start_date)
+        if end_date:
+            mask &= self.columns["battle_time"][:n] <= _seconds(end_date)
+        return mask
+
+    def _dimension(self, name, rows):
+        seconds = self.columns["battle_time"][rows]
+        if name == "day":
+            return seconds // 86400
+        if name == "hour":
+            return seconds // 3600
+        if name == "week":
+            # 1970-01-01 war ein Donnerstag; +3 Tage verschiebt die Wochengrenze auf Montag
+            return (seconds // 86400 + 3) // 7
+        if name == "month":
+            return seconds.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+        return self.columns[name][rows]
+
+    def _decode(self, name, code):
+        code = int(code)
+        if name == "day":
+            return EPOCH_DATE + timedelta(days=code)
+        if name == "hour":
+            return EPOCH + timedelta(hours=code)
+        if name == "week":
+            return EPOCH + timedelta(days=code * 7 - 3)
+        if name == "month":
+            return datetime(1970 + code // 12, code % 12 + 1, 1)
+        return self.dictionaries[name].values[code]
+
+    def grains(self, dims, player_tag=None, start_date=None, end_date=None):
+        """Liefert dieselben Grains wie aggregation.fetch_grains, berechnet über die Spalten-Arrays."""
+        with self._lock:
+            rows = np.flatnonzero(self._mask(player_tag, start_date, end_date))
+            if not rows.size:
+                return []
+
+            # Zeilen nach Gruppenschlüssel sortieren; Gruppengrenzen sind die Stellen, an denen sich ein Schlüssel ändert
+            keys = [self._dimension(name, rows) for name in dims]
+            if keys:
+                order = np.lexsort(keys[::-1])
+                rows = rows[order]
+                keys = [key[order] for key in keys]
+                changed = np.zeros(rows.size, dtype=bool)
+                changed[0] = True
+                for key in keys:
+                    changed[1:] |= key[1:] != key[:-1]
+                boundaries = np.flatnonzero(changed)
+            else:
+                boundaries = np.zeros(1, dtype=np.int64)
+
+            column = self.columns
+            battle_time = column["battle_time"][rows]
+            measures = {
+                "battles": np.add.reduceat(np.ones(rows.size, dtype=np.int64), boundaries),
+                "victories": np.add.reduceat(column["victory"][rows].astype(np.int64), boundaries),
+                "trophy_change": np.add.reduceat(column["trophy_change"][rows], boundaries),
+                "duration_sum": np.add.reduceat(column["battle_duration"][rows], boundaries),
+                "duration_count": np.add.reduceat(column["has_duration"][rows].astype(np.int64), boundaries),
+                "first_battle": np.minimum.reduceat(battle_time, boundaries),
+                "last_battle": np.maximum.reduceat(battle_time, boundaries),
+            }
+
+            grains = []
+            for g, boundary in enumerate(boundaries):
+                grain = {name: self._decode(name, key[boundary]) for name, key in zip(dims, keys)}
+                for name in MEASURES:
+                    value = int(measures[name][g])
+                    grain[name] = EPOCH + timedelta(seconds=value) if name in ("first_battle", "last_battle") else value
+                grains.append(grain)
+            return grains
+
+    def count_players(self, player_tag=None, start_date=None, end_date=None):
+        with self._lock:
+            mask = self._mask(player_tag, start_date, end_date)
+            return int(np.unique(self.columns["player_tag"][:self.size][mask]).size)
+
+    def players(self, player_tag=None, start_date=None, end_date=None):
+        """Menge der Spieler-Tags im Zeitraum (für die Vereinigung mit dem Parquet-Archiv)."""
+        with self._lock:
+            mask = self._mask(player_tag, start_date, end_date)
+            values = self.dictionaries["player_tag"].values
+            return {values[code] for code in np.unique(self.columns["player_tag"][:self.size][mask])}
+
+
+def _seconds(value):
+    """Naiver datetime -> Sekunden seit 1970 (ohne Zeitzonen-Umrechnung, wie in der Datenbank gespeichert)."""
+    return (value - EPOCH) // timedelta(seconds=1)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def loaded_store():
+    """Die Columnar-Engine, falls sie bereits geladen ist (ohne einen Ladevorgang auszulösen)."""
+    return _store
+
+
+def active_store(engine):
+    """
+    Liefert die geladene Columnar-Engine oder None, wenn sie nicht aktiviert ist.
+    Beim ersten Aufruf wird battle_logs geladen, danach höchstens alle COLUMNAR_REFRESH_SECONDS nachgeladen.
+    Nach einem Archivlauf (die Zeilen fehlen dann in battle_logs) wird vollständig neu geladen.
+    """
+    global _store
+    if not USE_COLUMNAR_ENGINE:
+        return None
+    with _store_lock:
+        archive_version = archive.version()
+        if _store is None or _store.archive_version != archive_version:
+            store = ColumnStore()
+            with engine.connect() as connection:
+                store.load(connection)
+            store.archive_version = archive_version
+            _store = store
+        elif _time.monotonic() - _store.refreshed_at >= COLUMNAR_REFRESH_SECONDS:
+            with engine.connect() as connection:
+                _store.catch_up(connection)
+    return _store
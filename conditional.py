@@ -0,0 +1,72 @@
+"""
+Conditional GET (ETag / Last-Modified / 304) für spielerbezogene Endpunkte.
+
+Der Validator ist das Cache-Watermark des Spielers (cache.watermark: max(battle_time) und Anzahl der Battles,
+eine Query über den Primärschlüssel-Index) und wird mit Pfad und Query-Parametern der Anfrage kombiniert.
+Stimmt er mit If-None-Match bzw. If-Modified-Since überein, wird mit 304 geantwortet, bevor die Aggregation
+läuft. Sonst prüft der Ergebnis-Cache gegen denselben, einmal pro Anfrage gelesenen Stand, ETag und Body
+passen also zusammen.
+"""
+import hashlib
+from dataclasses import dataclass, field
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Response
+
+
+class NotModified(Exception):
+    """Der Client hat bereits den aktuellen Stand; wird als 304 ohne Body beantwortet."""
+
+    def __init__(self, headers: dict):
+        self.headers = headers
+
+
+@dataclass
+class Validator:
+    """Watermark der Anfrage (None ohne player_tag) und die daraus gesetzten ETag-/Last-Modified-Header."""
+    version: Optional[tuple] = None
+    headers: dict = field(default_factory=dict)
+    response: Optional[Response] = None
+
+    def withdraw(self):
+        """Nimmt die Header zurück, wenn der Body nicht zum Watermark gehört (veralteter Cache-Eintrag)."""
+        if self.response is not None:
+            for name in self.headers:
+                del self.response.headers[name]
+        self.headers = {}
+
+
+def validator_headers(path: str, query_params, latest, count) -> dict:
+    """ETag (schwach, da Upserts bestehender Battles nicht erfasst werden) und Last-Modified."""
+    params = "&".join(f"{key}={value}" for key, value in sorted(query_params.multi_items()))
+    digest = hashlib.sha1(f"{path}?{params}|{latest.isoformat()}|{count}".encode()).hexdigest()
+    return {
+        "ETag": f'W/"{digest}"',
+        # battle_time wird ohne Zeitzone gespeichert und hier als UTC interpretiert
+        "Last-Modified": format_datetime(latest.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True),
+    }
+
+
+def is_not_modified(request_headers, headers: dict) -> bool:
+    """
+    Prüft If-None-Match (schwacher Vergleich) bzw., nur wenn dieser fehlt, If-Modified-Since (RFC 7232).
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return headers["ETag"].removeprefix("W/") in tags
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return parsedate_to_datetime(headers["Last-Modified"]) <= since
+    return False
@@ -0,0 +1,125 @@
+import os
+from dotenv import load_dotenv
+
+# Lade Umgebungsvariablen aus .env
+load_dotenv()
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """Liest eine boolesche Umgebungsvariable (true/1/yes/on)."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("true", "1", "yes", "on")
+
+
+# Hole Database URL aus Umgebungsvariablen
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Fehlende Tabellen beim Start eines Workers anlegen (create_all im Lifespan); sonst einmalig
+# `python manage.py create-indexes` ausführen
+CREATE_SCHEMA_ON_STARTUP = env_flag("CREATE_SCHEMA_ON_STARTUP")
+
+# Vor der ersten Anfrage Connection-Pools füllen und den Ergebnis-Cache der wichtigsten Endpunkte vorwärmen
+WARMUP_ON_STARTUP = env_flag("WARMUP_ON_STARTUP")
+WARMUP_PATHS = [path.strip() for path in os.getenv(
+    "WARMUP_PATHS",
+    "/battle-statistics,/brawler-statistics,/gamemode-statistics,/map-statistics,/trophy-progress,/leaderboard"
+).split(",") if path.strip()]
+
+# Statistiken aus der täglichen Rollup-Tabelle beantworten (vorher `python manage.py rebuild-rollup` ausführen)
+USE_ROLLUP = env_flag("USE_ROLLUP")
+
+# approx=true aus den Tages-Sketches beantworten (vorher `python manage.py rebuild-sketches` ausführen);
+# ohne diese Option werden die Sketches bei approx=true aus battle_logs gebildet
+USE_SKETCHES = env_flag("USE_SKETCHES")
+
+# Verzeichnis des Parquet-Archivs für alte Battles (`python manage.py archive --before DATUM`, benötigt pyarrow);
+# leer = kein Archiv
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+
+# Ergebnis-Cache für die Statistik-Endpunkte
+CACHE_ENABLED = env_flag("CACHE_ENABLED", True)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+# So lange über TTL bzw. neue Battles hinaus dürfen Werte heißer Schlüssel ausgeliefert werden, während der
+# Scheduler sie neu berechnet (stale-while-revalidate)
+CACHE_STALE_SECONDS = float(os.getenv("CACHE_STALE_SECONDS", "300"))
+
+# Hintergrund-Neuberechnung der meistangefragten spielerbezogenen Statistiken (benötigt CACHE_ENABLED)
+PRECOMPUTE_ENABLED = env_flag("PRECOMPUTE_ENABLED")
+PRECOMPUTE_MAX_KEYS = int(os.getenv("PRECOMPUTE_MAX_KEYS", "1000"))
+PRECOMPUTE_MIN_REQUESTS = float(os.getenv("PRECOMPUTE_MIN_REQUESTS", "3"))
+PRECOMPUTE_INTERVAL_SECONDS = float(os.getenv("PRECOMPUTE_INTERVAL_SECONDS", "5"))
+PRECOMPUTE_QUEUE_SIZE = int(os.getenv("PRECOMPUTE_QUEUE_SIZE", "100"))
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", "2"))
+
+# Gleichzeitige identische Statistik-Anfragen teilen sich eine Berechnung (Single-Flight, coalescing.py)
+COALESCE_REQUESTS = env_flag("COALESCE_REQUESTS", True)
+
+# Admission Control der Lese-Endpunkte (admission.py): pro Kostenklasse gleichzeitige Ausführungen, Plätze in
+# der Warteschlange und Statement-Timeout in ms (0 = keiner). Die Standardwerte passen zusammen in den
+# Standard-Pool (DB_POOL_SIZE + DB_MAX_OVERFLOW = 15), schwere Anfragen belegen nie alle Verbindungen.
+ADMISSION_ENABLED = env_flag("ADMISSION_ENABLED", True)
+ADMISSION_DEFAULTS = {"light": (8, 64, 5000), "standard": (4, 16, 15000), "heavy": (2, 4, 30000)}
+# Höchstens so lange wartet eine Anfrage auf einen Platz, danach 503
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "5"))
+# Retry-After der 503-Antworten
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "2"))
+
+# Live-Stream neuer Battles (GET /live/{player_tag}, live.py): Abstand der gemeinsamen Datenbankabfrage,
+# Keepalive-Kommentare und gepufferte Ereignisse pro Abonnent (bei Überlauf wird der Stream beendet)
+LIVE_POLL_SECONDS = float(os.getenv("LIVE_POLL_SECONDS", "2"))
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "100"))
+
+
+def cache_ttl(endpoint: str) -> float:
+    """TTL eines Endpunkts, überschreibbar per CACHE_TTL_<ENDPUNKT> (z. B. CACHE_TTL_MAP_STATISTICS)."""
+    name = "CACHE_TTL_" + endpoint.upper().replace("-", "_")
+    return float(os.getenv(name, CACHE_TTL_SECONDS))
+
+
+def admission_limits(cost_class: str):
+    """
+    (gleichzeitige Ausführungen, Warteschlange, Statement-Timeout in ms) einer Kostenklasse, überschreibbar per
+    ADMISSION_<KLASSE>_CONCURRENCY, ADMISSION_<KLASSE>_QUEUE und ADMISSION_<KLASSE>_TIMEOUT_MS.
+    """
+    concurrency, queue, timeout_ms = ADMISSION_DEFAULTS[cost_class]
+    prefix = "ADMISSION_" + cost_class.upper()
+    return (
+        int(os.getenv(prefix + "_CONCURRENCY", concurrency)),
+        int(os.getenv(prefix + "_QUEUE", queue)),
+        int(os.getenv(prefix + "_TIMEOUT_MS", timeout_ms)),
+    )
+
+# Lese-Replikas für GET-Endpunkte (kommagetrennt); Schreibzugriffe gehen immer an DATABASE_URL
+READ_DATABASE_URLS = [url.strip() for url in os.getenv("READ_DATABASE_URL", "").split(",") if url.strip()]
+# Verteilung auf die Replikas: round_robin oder least_busy (wenigste offene Sessions)
+READ_ROUTING = os.getenv("READ_ROUTING", "round_robin")
+
+# Connection-Pool pro Engine (wird für SQLite ignoriert)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+DB_POOL_PRE_PING = env_flag("DB_POOL_PRE_PING")
+
+# Async-Datenbankzugriff (aiomysql bzw. aiosqlite); ohne ASYNC_DATABASE_URL wird sie aus DATABASE_URL abgeleitet
+USE_ASYNC_DB = env_flag("USE_ASYNC_DB")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+# Batchgröße für POST /battle-data/bulk
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+
+# Maximale Anzahl Spieler pro Anfrage an die Batch-Statistik-Endpunkte
+BATCH_MAX_PLAYERS = int(os.getenv("BATCH_MAX_PLAYERS", "200"))
+
+# Spaltenorientierte In-Memory-Engine (numpy) für die Statistik-Endpunkte
+USE_COLUMNAR_ENGINE = env_flag("USE_COLUMNAR_ENGINE")
+COLUMNAR_REFRESH_SECONDS = float(os.getenv("COLUMNAR_REFRESH_SECONDS", "60"))
+COLUMNAR_CATCHUP_OVERLAP_SECONDS = int(os.getenv("COLUMNAR_CATCHUP_OVERLAP_SECONDS", str(6 * 3600)))
+
+# Queries ab dieser Dauer (ms) landen im Slow-Query-Log (Logger "battle_stats.slow_query"); 0 deaktiviert das Log
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "500"))
@@ -1,21 +1,230 @@
-import os
-from dotenv import load_dotenv
+import threading
+from contextlib import contextmanager
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from starlette.concurrency import run_in_threadpool
+
+from config import (
+    DATABASE_URL, ASYNC_DATABASE_URL, USE_ASYNC_DB, READ_DATABASE_URLS, READ_ROUTING,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+)
+
+
+def engine_options(url: str) -> dict:
+    """Pool-Einstellungen aus der Umgebung; SQLite bekommt stattdessen nur die nötigen connect_args."""
+    if url.startswith("sqlite"):
+        if "aiosqlite" in url:
+            return {}
+        # SQLite-Verbindungen werden im Threadpool geöffnet und ggf. in einem anderen Thread geschlossen
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+# Async-Treiber zu den unterstützten synchronen Treibern
+ASYNC_DRIVERS = {
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql": "mysql+aiomysql",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    """Leitet aus der synchronen DATABASE_URL die URL mit Async-Treiber ab (z. B. pymysql -> aiomysql)."""
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+Base = declarative_base()
+
+
+class LazySessionMaker(sessionmaker):
+    """sessionmaker, der die Engines erst beim ersten Öffnen einer Session ohne explizites bind erzeugt."""
+
+    def __call__(self, **local_kw):
+        if "bind" not in local_kw and self.kw.get("bind") is None:
+            get_engines()  # bindet SessionLocal an die Primary-Engine
+        return super().__call__(**local_kw)
+
+
+SessionLocal = LazySessionMaker(autocommit=False, autoflush=False)
+
+# Optionaler Async-Pfad (USE_ASYNC_DB=true); die Sessions werden immer mit explizitem bind geöffnet
+AsyncSessionLocal = None
+if USE_ASYNC_DB:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    AsyncSessionLocal = sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+# Unterstützte Strategien für die Verteilung lesender Sessions
+ROUTING_STRATEGIES = ("round_robin", "least_busy")
+
+
+class ReadRouter:
+    """
+    Verteilt lesende Sessions auf die Replikas: reihum (round_robin) oder auf das Replika mit den
+    wenigsten gerade offenen Sessions (least_busy, bei Gleichstand reihum).
+    """
+
+    def __init__(self, engines, strategy: str = "round_robin"):
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unbekannte READ_ROUTING-Strategie '{strategy}' (erlaubt: {', '.join(ROUTING_STRATEGIES)}).")
+        self.engines = list(engines)
+        self.strategy = strategy
+        self.in_flight = [0] * len(self.engines)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        """Wählt ein Replika und zählt es für die Dauer des Blocks als belegt."""
+        with self._lock:
+            count = len(self.engines)
+            if self.strategy == "least_busy":
+                order = [(self._next + offset) % count for offset in range(count)]
+                index = min(order, key=self.in_flight.__getitem__)
+            else:
+                index = self._next
+            self._next = (index + 1) % count
+            self.in_flight[index] += 1
+        try:
+            yield self.engines[index]
+        finally:
+            with self._lock:
+                self.in_flight[index] -= 1
+
+
+class Engines:
+    """
+    Alle Engines der Anwendung: Primary, Lese-Replikas (READ_DATABASE_URL) und bei USE_ASYNC_DB deren
+    Async-Gegenstücke. create_engine öffnet noch keine Verbindung; die erste entsteht bei der ersten Query.
+    """
+
+    def __init__(self):
+        if not DATABASE_URL:
+            raise ValueError(
+                "Keine DATABASE_URL in Umgebungsvariablen gefunden. "
+                "Bitte .env Datei mit DATABASE_URL erstellen."
+            )
+        self.primary = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+        # Ohne Replikas liest alles vom Primary
+        self.replicas = [create_engine(url, **engine_options(url)) for url in READ_DATABASE_URLS]
+        self.read_router = ReadRouter(self.replicas, READ_ROUTING) if self.replicas else None
+
+        self.async_primary = None
+        self.async_replicas = []
+        self.async_read_router = None
+        if USE_ASYNC_DB:
+            from sqlalchemy.ext.asyncio import create_async_engine
+
+            async_url = ASYNC_DATABASE_URL or async_database_url(DATABASE_URL)
+            self.async_primary = create_async_engine(async_url, **engine_options(async_url))
+            self.async_replicas = [
+                create_async_engine(async_database_url(url), **engine_options(async_database_url(url)))
+                for url in READ_DATABASE_URLS
+            ]
+            if self.async_replicas:
+                self.async_read_router = ReadRouter(self.async_replicas, READ_ROUTING)
+
+    def sync_engines(self):
+        """Alle synchronen Engines, bei Async-Engines deren sync_engine (für Event-Listener)."""
+        async_engines = [self.async_primary, *self.async_replicas] if self.async_primary is not None else []
+        return [self.primary, *self.replicas, *(engine.sync_engine for engine in async_engines)]
+
+    async def dispose(self):
+        """Schließt die Verbindungen aller Pools (z. B. beim Herunterfahren eines Workers)."""
+        for engine in [self.primary, *self.replicas]:
+            await run_in_threadpool(engine.dispose)
+        if self.async_primary is not None:
+            for engine in [self.async_primary, *self.async_replicas]:
+                await engine.dispose()
+
+
+_engines = None
+_engines_lock = threading.Lock()
+
+# Callbacks, die jede (synchrone) Engine direkt nach dem Erzeugen erhält, z. B. metrics.instrument_engine
+_engine_hooks = []
+
+
+def get_engines() -> Engines:
+    """Erzeugt die Engines beim ersten Aufruf (nicht beim Import) und bindet SessionLocal an den Primary."""
+    global _engines
+    if _engines is None:
+        with _engines_lock:
+            if _engines is None:
+                engines = Engines()
+                SessionLocal.configure(bind=engines.primary)
+                for hook in _engine_hooks:
+                    for engine in engines.sync_engines():
+                        hook(engine)
+                _engines = engines
+    return _engines
+
+
+def engines_created() -> bool:
+    return _engines is not None
+
+
+def get_engine():
+    """Die Primary-Engine (Schreibzugriffe, Wartung)."""
+    return get_engines().primary
+
+
+def __getattr__(name):
+    # Kompatibilität für Skripte mit `from database import engine`: erzeugt die Engines erst beim Zugriff
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def on_engine_created(hook):
+    """Registriert einen Callback für alle synchronen Engines; bereits erzeugte Engines erhalten ihn sofort."""
+    with _engines_lock:
+        if hook in _engine_hooks:
+            return
+        _engine_hooks.append(hook)
+        if _engines is not None:
+            for engine in _engines.sync_engines():
+                hook(engine)
+
+
+@contextmanager
+def session_bind(read_only: bool, asynchronous: bool = False):
+    """Engine für eine neue Session: Lesezugriffe über den ReadRouter, Schreibzugriffe immer an den Primary."""
+    engines = get_engines()
+    router = engines.async_read_router if asynchronous else engines.read_router
+    if not read_only or router is None:
+        yield engines.async_primary if asynchronous else engines.primary
+        return
+    with router.acquire() as bind:
+        yield bind
+
+
+class SyncRunner:
+    """Führt Datenbankfunktionen mit einer blockierenden Session im Threadpool aus."""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def run(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
 
-# Lade Umgebungsvariablen aus .env
-load_dotenv()
 
-# Hole Database URL aus Umgebungsvariablen
-DATABASE_URL = os.getenv("DATABASE_URL")
+class AsyncRunner:
+    """Führt Datenbankfunktionen über eine AsyncSession aus, ohne einen Thread zu blockieren."""
 
-if not DATABASE_URL:
-    raise ValueError(
-        "Keine DATABASE_URL in Umgebungsvariablen gefunden. "
-        "Bitte .env Datei mit DATABASE_URL erstellen."
-    )
+    def __init__(self, session):
+        self.session = session
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+    async def run(self, fn, *args, **kwargs):
+        return await self.session.run_sync(fn, *args, **kwargs)
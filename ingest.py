@@ -0,0 +1,145 @@
+import json
+from types import SimpleNamespace
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from cache import bump_generation, result_cache
+from columnar import loaded_store
+import live
+import sketches
+from config import USE_ROLLUP, USE_SKETCHES
+from models import BattleData
+from rollup import refresh_slices
+from schemas import BattleDataBase
+
+KEY_FIELDS = ("player_tag", "battle_time", "brawler_id")
+VALUE_FIELDS = tuple(name for name in BattleDataBase.model_fields if name not in KEY_FIELDS)
+
+
+class RecordError(Exception):
+    """Ein einzelner Datensatz konnte nicht gelesen oder validiert werden."""
+
+
+async def iter_records(request):
+    """
+    Liest Datensätze aus dem Request-Body: NDJSON (application/x-ndjson) wird zeilenweise gestreamt,
+    ansonsten wird ein JSON-Array erwartet. Liefert pro Datensatz das Dict oder einen RecordError.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type:
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield _parse_line(line)
+        if buffer.strip():
+            yield _parse_line(buffer)
+        return
+
+    try:
+        records = json.loads(await request.body())
+    except ValueError as error:
+        raise RecordError(f"Ungültiges JSON: {error}")
+    if not isinstance(records, list):
+        raise RecordError("Erwartet wird ein JSON-Array von Battle-Datensätzen.")
+    for record in records:
+        yield record
+
+
+def _parse_line(line):
+    try:
+        return json.loads(line)
+    except ValueError as error:
+        return RecordError(f"Ungültige NDJSON-Zeile: {error}")
+
+
+def validate_record(record):
+    """Validiert einen Datensatz gegen BattleDataBase und liefert ihn als Dict der Tabellenspalten."""
+    if isinstance(record, RecordError):
+        raise record
+    try:
+        return BattleDataBase.model_validate(record).model_dump()
+    except ValidationError as error:
+        raise RecordError("; ".join(
+            f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()
+        ))
+
+
+def _upsert_statement(dialect_name):
+    """INSERT ... ON DUPLICATE KEY UPDATE (MySQL) bzw. INSERT OR REPLACE (SQLite) über den Primärschlüssel."""
+    if dialect_name == "mysql":
+        statement = mysql_insert(BattleData)
+        return statement.on_duplicate_key_update({name: statement.inserted[name] for name in VALUE_FIELDS})
+    if dialect_name == "sqlite":
+        return insert(BattleData).prefix_with("OR REPLACE")
+    raise ValueError(f"Bulk-Upsert wird für {dialect_name} nicht unterstützt.")
+
+
+def upsert_batch(db, rows):
+    """
+    Schreibt einen Batch per Upsert und committet ihn. Liefert (inserted, updated).
+    Doppelte Schlüssel innerhalb des Batches zählen als Update (der letzte Datensatz gewinnt).
+    """
+    unique = {tuple(row[name] for name in KEY_FIELDS): row for row in rows}
+    keys = list(unique)
+
+    existing = db.execute(
+        select(BattleData.player_tag, BattleData.battle_time, BattleData.brawler_id).where(
+            tuple_(BattleData.player_tag, BattleData.battle_time, BattleData.brawler_id).in_(keys)
+        )
+    ).all()
+    updated = len(existing) + len(rows) - len(unique)
+
+    # pymysql bündelt executemany mit VALUES-Klausel zu mehrzeiligen INSERT-Statements
+    db.execute(_upsert_statement(db.get_bind().dialect.name), list(unique.values()))
+
+    if USE_ROLLUP:
+        refresh_slices(db.connection(), {(player_tag, battle_time.date()) for player_tag, battle_time, _ in keys})
+    existing_keys = {tuple(row) for row in existing}
+    if USE_SKETCHES:
+        # Neue Battles werden in die Sketches gemergt, Tage mit überschriebenen Battles neu aufgebaut
+        updated_days = {battle_time.date() for _, battle_time, _ in existing_keys}
+        if updated_days:
+            sketches.refresh_days(db.connection(), updated_days)
+        sketches.add_battles(db.connection(), [
+            tuple(row[column.key] for column in sketches.RAW_COLUMNS) for key, row in unique.items()
+            if key not in existing_keys and row["battle_time"].date() not in updated_days
+        ])
+    db.commit()
+
+    # Geladene Columnar-Engine inkrementell nachführen statt neu zu laden
+    store = loaded_store()
+    if store is not None:
+        store.upsert([SimpleNamespace(**row) for row in unique.values()])
+
+    # Live-Streams der betroffenen Spieler wecken (ältester neuer Battle pro Spieler, überschriebene Spieler)
+    new_battles = {}
+    for player_tag, battle_time, brawler_id in keys:
+        if (player_tag, battle_time, brawler_id) not in existing_keys:
+            key = (battle_time, brawler_id)
+            new_battles[player_tag] = min(key, new_battles.get(player_tag, key))
+    live.hub.notify(new_battles, {player_tag for player_tag, _, _ in existing_keys})
+    # Neuer Stand für das globale Watermark (max(battle_time) allein erkennt weder Nachträge noch Überschreibungen)
+    bump_generation()
+    # Überschriebene Battles ändern das Watermark nicht, daher die Cache-Einträge der Spieler direkt entfernen
+    result_cache.invalidate_players({player_tag for player_tag, _, _ in keys})
+    return len(rows) - updated, updated
+
+
+# Dokumentation des Request-Bodys in OpenAPI (der Body wird selbst geparst, um NDJSON streamen zu können)
+OPENAPI_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"type": "array", "items": BattleDataBase.model_json_schema()}},
+            "application/x-ndjson": {"schema": BattleDataBase.model_json_schema()}
+        }
+    }
+}
+
+# Maximale Anzahl einzeln gemeldeter Fehler in der Antwort
+MAX_REPORTED_ERRORS = 100
@@ -0,0 +1,194 @@
+"""
+Top-K-Ranglisten über Spieler, Brawler, Modi und Maps.
+
+Gruppierung, Mindestanzahl Battles (HAVING), Sortierung und LIMIT laufen in SQL über die UNION ALL aus
+Rollup-Tabelle (ganze Tage) und Rohdaten (Randtage); übertragen werden nur die k Gewinner. Ist die
+Columnar-Engine aktiv oder berührt der Zeitraum das Parquet-Archiv, wird über die Grains mit einem begrenzten
+Heap (heapq) ausgewählt.
+"""
+import heapq
+
+from sqlalchemy import and_, case, func, select, union_all
+
+import archive
+from aggregation import build_filters, merge_grains, raw_measures, rollup_measures, split_range
+from columnar import active_store
+from config import USE_ROLLUP
+from models import BattleData, BattleDailyRollup
+from stats import fetch_grains
+
+# Dimensionen, nach denen gerankt werden kann
+DIMENSIONS = ("player_tag", "brawler_name", "battle_mode", "event_map")
+
+METRICS = (
+    "battles", "victories", "trophy_change", "win_rate", "avg_trophies_per_battle", "avg_duration",
+    "seconds_per_trophy"
+)
+
+# Standard-Sortierung: kürzere Dauer bzw. weniger Sekunden pro Trophäe sind besser, sonst gilt "mehr ist besser"
+ASCENDING_METRICS = ("avg_duration", "seconds_per_trophy")
+
+# Summierbare Kennzahlen, aus denen sich alle Metriken ableiten
+SUMMED = ("battles", "victories", "trophy_change", "duration_sum", "duration_count")
+
+
+def default_order(metric):
+    return "asc" if metric in ASCENDING_METRICS else "desc"
+
+
+def _metric_value(metric, battles, victories, trophy_change, duration_sum, duration_count):
+    """Metrik aus den Summen einer Gruppe (Python-Pendant zu _metric_expression); None, wenn nicht definiert."""
+    if metric in ("battles", "victories", "trophy_change"):
+        return {"battles": battles, "victories": victories, "trophy_change": trophy_change}[metric]
+    if metric == "win_rate":
+        return victories * 100.0 / battles
+    if metric == "avg_trophies_per_battle":
+        return trophy_change * 1.0 / battles
+    if not duration_count:
+        return None
+    if metric == "avg_duration":
+        return duration_sum * 1.0 / duration_count
+    # seconds_per_trophy wie in stats._seconds_per_trophy nur bei positiver Trophäenänderung
+    if trophy_change > 0:
+        return duration_sum * 1.0 / duration_count * battles / trophy_change
+    return None
+
+
+def _metric_expression(metric, sums):
+    """SQL-Ausdruck der Metrik über die summierten Spalten (`* 1.0` erzwingt Fließkomma-Division)."""
+    battles, victories, trophy_change, duration_sum, duration_count = (sums[name] for name in SUMMED)
+    if metric in ("battles", "victories", "trophy_change"):
+        return sums[metric]
+    if metric == "win_rate":
+        return victories * 100.0 / battles
+    if metric == "avg_trophies_per_battle":
+        return trophy_change * 1.0 / battles
+    if metric == "avg_duration":
+        return case((duration_count > 0, duration_sum * 1.0 / duration_count), else_=None)
+    return case(
+        (and_(duration_count > 0, trophy_change > 0), duration_sum * 1.0 / duration_count * battles / trophy_change),
+        else_=None
+    )
+
+
+def _extra_filters(model, battle_mode, event_map):
+    filters = []
+    if battle_mode:
+        filters.append(model.battle_mode == battle_mode)
+    if event_map:
+        filters.append(model.event_map == event_map)
+    return filters
+
+
+def _grouped_parts(dimension, player_tag, start_date, end_date, battle_mode, event_map):
+    """Nach der Dimension vorgruppierte SELECTs über Rollup-Tabelle und Rohdaten (Rollup speichert NULL als '')."""
+    if USE_ROLLUP:
+        rollup_filters, raw_filter_lists = split_range(player_tag, start_date, end_date)
+    else:
+        rollup_filters, raw_filter_lists = None, [build_filters(player_tag, start_date, end_date)]
+
+    parts = []
+    if rollup_filters is not None:
+        key = getattr(BattleDailyRollup, dimension)
+        parts.append(
+            select(key.label("key"), *[m for m in rollup_measures() if m.name in SUMMED])
+            .where(*rollup_filters, *_extra_filters(BattleDailyRollup, battle_mode, event_map), key != '')
+            .group_by(key)
+        )
+    for filters in raw_filter_lists:
+        key = getattr(BattleData, dimension)
+        parts.append(
+            select(key.label("key"), *[m for m in raw_measures() if m.name in SUMMED])
+            .where(*filters, *_extra_filters(BattleData, battle_mode, event_map), key.isnot(None), key != '')
+            .group_by(key)
+        )
+    return parts
+
+
+def top_k_sql(db, metric, dimension, k, min_battles=1, order="desc", player_tag=None, start_date=None,
+              end_date=None, battle_mode=None, event_map=None):
+    """Die k besten Gruppen per GROUP BY/HAVING/ORDER BY/LIMIT als (key, battles, ..., duration_count)."""
+    parts = _grouped_parts(dimension, player_tag, start_date, end_date, battle_mode, event_map)
+    grains = (union_all(*parts) if len(parts) > 1 else parts[0]).subquery()
+
+    sums = {name: func.sum(grains.c[name]) for name in SUMMED}
+    metric_expression = _metric_expression(metric, sums)
+    query = (
+        select(grains.c.key, *[sums[name].label(name) for name in SUMMED])
+        .group_by(grains.c.key)
+        .having(and_(sums["battles"] >= min_battles, metric_expression.isnot(None)))
+        .order_by(metric_expression.asc() if order == "asc" else metric_expression.desc(), grains.c.key)
+        .limit(k)
+    )
+    return [tuple(row) for row in db.execute(query)]
+
+
+def top_k_grains(db, metric, dimension, k, min_battles=1, order="desc", player_tag=None, start_date=None,
+                 end_date=None, battle_mode=None, event_map=None):
+    """Wie top_k_sql, aber über die Grains aus stats.fetch_grains (Columnar-Engine bzw. Archiv) mit einem Heap."""
+    filter_dims = tuple(name for name, value in (("battle_mode", battle_mode), ("event_map", event_map)) if value)
+    dims = tuple(dict.fromkeys((dimension,) + filter_dims))
+    grains = [
+        grain for grain in fetch_grains(db, dims, player_tag, start_date, end_date)
+        if grain[dimension] and all(grain[name] == value for name, value in
+                                    (("battle_mode", battle_mode), ("event_map", event_map)) if value)
+    ]
+
+    candidates = []
+    for grain in merge_grains(grains, (dimension,)):
+        sums = tuple(grain[name] for name in SUMMED)
+        value = _metric_value(metric, *sums)
+        if grain["battles"] >= min_battles and value is not None:
+            candidates.append((value, grain[dimension], sums))
+
+    if order == "asc":
+        best = heapq.nsmallest(k, candidates, key=lambda c: (c[0], c[1]))
+    else:
+        best = heapq.nsmallest(k, candidates, key=lambda c: (-c[0], c[1]))
+    return [(key, *sums) for _, key, sums in best]
+
+
+def leaderboard(db, player_tag=None, start_date=None, end_date=None, metric="win_rate", dimension="player_tag",
+                k=50, min_battles=1, order=None, battle_mode=None, event_map=None):
+    """Top-K-Rangliste; liefert das Dict für LeaderboardResponse."""
+    order = order or default_order(metric)
+    options = dict(min_battles=min_battles, order=order, player_tag=player_tag, start_date=start_date,
+                   end_date=end_date, battle_mode=battle_mode, event_map=event_map)
+    if active_store(db.get_bind()) is not None or archive.overlaps(start_date, end_date):
+        rows = top_k_grains(db, metric, dimension, k, **options)
+    else:
+        rows = top_k_sql(db, metric, dimension, k, **options)
+
+    entries = []
+    for rank, (key, *sums) in enumerate(rows, start=1):
+        battles, victories, trophy_change, duration_sum, duration_count = (int(value) for value in sums)
+        value = _metric_value(metric, battles, victories, trophy_change, duration_sum, duration_count)
+        avg_duration = _metric_value("avg_duration", battles, victories, trophy_change, duration_sum, duration_count)
+        seconds_per_trophy = _metric_value(
+            "seconds_per_trophy", battles, victories, trophy_change, duration_sum, duration_count
+        )
+        entries.append({
+            "rank": rank,
+            "key": key,
+            "value": round(value, 2),
+            "battles": battles,
+            "victories": victories,
+            "trophy_change": trophy_change,
+            "win_rate": round(victories / battles * 100, 2),
+            "avg_trophies_per_battle": round(trophy_change / battles, 2),
+            "avg_duration": round(avg_duration, 2) if avg_duration is not None else None,
+            "seconds_per_trophy": round(seconds_per_trophy, 2) if seconds_per_trophy is not None else None
+        })
+
+    return {
+        "metric": metric,
+        "dimension": dimension,
+        "order": order,
+        "min_battles": min_battles,
+        "player_tag": player_tag,
+        "battle_mode": battle_mode,
+        "event_map": event_map,
+        "start_date": start_date,
+        "end_date": end_date,
+        "entries": entries
+    }
@@ -0,0 +1,322 @@
+"""
+Live-Stream neuer Battles pro Spieler (Server-Sent Events) mit laufend fortgeschriebenen Kennzahlen.
+
+Alle Streams eines Workers teilen sich einen Hub. Pro Spieler gibt es einen Feed mit den Kennzahlen
+(Battles, Siege, Trophäenänderung, Win-Rate) und einem Cursor: (battle_time, brawler_id) des jüngsten
+gezählten Battles, wie im Primärschlüssel. So gehen mehrere Battles mit gleichem battle_time nicht verloren.
+Der erste Abonnent eines Spielers lädt sie mit einer Aggregat-Abfrage; danach werden sie nur noch im Speicher
+fortgeschrieben.
+
+Ein einziger Watch-Task fragt alle LIVE_POLL_SECONDS mit einer Abfrage für alle abonnierten Spieler die
+Battles nach deren Cursor ab, egal wie viele Streams offen sind. Importe über diesen Worker wecken den Watch
+sofort (notify); Importe über andere Worker oder Prozesse erscheinen mit dem nächsten Durchlauf. Jedes
+Ereignis wird einmal pro Spieler kodiert und an alle Abonnenten verteilt.
+
+Überschreibt ein Import bestehende Battles oder liefert er Battles, die älter als der Cursor sind, werden die
+Kennzahlen des Spielers im nächsten Durchlauf neu aggregiert (Ereignis "totals"). Solche Nachträge aus anderen
+Workern bleiben bis zum nächsten Neuaufbau des Feeds unberücksichtigt.
+"""
+import asyncio
+import logging
+from collections import deque
+
+from sqlalchemy import and_, case, func, or_, select, tuple_
+from sqlalchemy.orm import aliased
+from starlette.concurrency import run_in_threadpool
+
+from aggregation import is_victory, victory_condition
+from config import LIVE_HEARTBEAT_SECONDS, LIVE_POLL_SECONDS, LIVE_QUEUE_SIZE
+from database import SessionLocal, session_bind
+from metrics import LIVE_EVENTS, LIVE_FEEDS, LIVE_POLLS, LIVE_SUBSCRIBERS
+from models import BattleData
+from pagination import ROW_COLUMNS
+from serialization import dumps, row_dicts
+
+logger = logging.getLogger("battle_stats.live")
+
+# Kommentarzeile, damit Proxys und Clients die Verbindung nicht für tot halten
+KEEPALIVE = b": keepalive\n\n"
+
+
+def sse(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+class Subscriber:
+    """Puffer eines Streams; läuft er über, wird der Stream beendet (der Client verbindet neu)."""
+
+    def __init__(self, size=LIVE_QUEUE_SIZE):
+        self.size = size
+        self.events = deque()
+        self.wakeup = asyncio.Event()
+        self.overflowed = False
+
+    def push(self, event: bytes):
+        if len(self.events) >= self.size:
+            self.overflowed = True
+            self.events.clear()
+        else:
+            self.events.append(event)
+        self.wakeup.set()
+
+
+class Feed:
+    """Laufende Kennzahlen und Abonnenten eines Spielers."""
+
+    def __init__(self, player_tag):
+        self.player_tag = player_tag
+        self.subscribers = set()
+        self.loaded = asyncio.get_running_loop().create_future()
+        self.battles = 0
+        self.victories = 0
+        self.trophy_change = 0
+        self.cursor = None  # (battle_time, brawler_id) des jüngsten gezählten Battles
+        self.resync = False
+
+    @property
+    def active(self) -> bool:
+        return self.loaded.done() and not self.loaded.cancelled() and self.loaded.exception() is None
+
+    def load(self, totals):
+        """Übernimmt (battles, victories, trophy_change, cursor) aus der Datenbank."""
+        self.battles, self.victories, self.trophy_change, self.cursor = totals or (0, 0, 0, None)
+
+    def totals(self):
+        return {
+            "battles": self.battles,
+            "victories": self.victories,
+            "trophy_change": self.trophy_change,
+            "win_rate": round(self.victories / self.battles * 100, 2) if self.battles else 0.0,
+            "last_battle": self.cursor[0] if self.cursor else None,
+        }
+
+    def add(self, battle: dict) -> bytes:
+        """Zählt einen neuen Battle; Battles bis zum Cursor sind nach einem Neuaufbau bereits enthalten."""
+        key = (battle["battle_time"], battle["brawler_id"])
+        if self.cursor is None or key > self.cursor:
+            self.battles += 1
+            self.victories += is_victory(battle["battle_mode"], battle["rank"], battle["battle_result"])
+            self.trophy_change += battle["trophy_change"] or 0
+            self.cursor = key
+        return sse("battle", {"battle": battle, "totals": self.totals()})
+
+    def broadcast(self, event: bytes, name: str):
+        LIVE_EVENTS.labels(name).inc()
+        for subscriber in self.subscribers:
+            subscriber.push(event)
+
+
+class Hub:
+    """Feeds aller Spieler mit offenen Streams und der gemeinsame Watch-Task (nur im Event-Loop verwenden)."""
+
+    def __init__(self, poll_interval=LIVE_POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self.feeds = {}
+        self._loop = None
+        self._wake = None
+        self._watch = None
+
+    async def stream(self, player_tag):
+        """Abonniert den Spieler und liefert den SSE-Stream (erstes Ereignis: "snapshot" mit den Kennzahlen)."""
+        feed = self.feeds.get(player_tag)
+        if feed is None:
+            feed = self.feeds[player_tag] = Feed(player_tag)
+            LIVE_FEEDS.set(len(self.feeds))
+            self._ensure_watch()
+            try:
+                totals = await run_in_threadpool(_totals, [player_tag])
+            except BaseException as error:
+                del self.feeds[player_tag]
+                LIVE_FEEDS.set(len(self.feeds))
+                if isinstance(error, asyncio.CancelledError):
+                    feed.loaded.cancel()  # Wartende laden selbst neu
+                else:
+                    feed.loaded.set_exception(error)
+                    feed.loaded.exception()  # gilt als abgeholt, auch ohne weitere Wartende
+                raise
+            feed.load(totals.get(player_tag))
+            feed.loaded.set_result(None)
+        else:
+            try:
+                await asyncio.shield(feed.loaded)
+            except asyncio.CancelledError:
+                if not feed.loaded.cancelled():
+                    raise  # die eigene Anfrage wurde abgebrochen
+            if self.feeds.get(player_tag) is not feed:
+                # Laden abgebrochen oder Feed inzwischen ohne Abonnenten entfernt
+                return await self.stream(player_tag)
+
+        subscriber = Subscriber()
+        feed.subscribers.add(subscriber)
+        LIVE_SUBSCRIBERS.inc()
+        events = self._events(feed, subscriber, sse("snapshot", {"totals": feed.totals()}))
+        # Generator starten: ab hier meldet sein finally den Abonnenten ab, auch wenn der Client vorher abbricht
+        await events.asend(None)
+        return events
+
+    async def _events(self, feed, subscriber, snapshot):
+        try:
+            yield
+            yield snapshot
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE
+                    continue
+                subscriber.wakeup.clear()
+                if subscriber.overflowed:
+                    return
+                events = b"".join(subscriber.events)
+                subscriber.events.clear()
+                yield events
+        finally:
+            feed.subscribers.discard(subscriber)
+            LIVE_SUBSCRIBERS.dec()
+            self._prune()
+
+    def _prune(self):
+        for player_tag, feed in list(self.feeds.items()):
+            if feed.active and not feed.subscribers:
+                del self.feeds[player_tag]
+        LIVE_FEEDS.set(len(self.feeds))
+
+    def _ensure_watch(self):
+        if self._watch is None:
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._watch = self._loop.create_task(self._watch_loop())
+
+    async def _watch_loop(self):
+        while True:
+            if not self.feeds:
+                self._watch = None
+                return
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Abfrage neuer Battles fehlgeschlagen")
+
+    async def poll(self):
+        """Eine Abfrage für alle Feeds: neue Battles nach dem Cursor und ggf. neu aggregierte Kennzahlen."""
+        feeds = {player_tag: feed for player_tag, feed in self.feeds.items() if feed.active}
+        if not feeds:
+            return
+        cursors = {player_tag: feed.cursor for player_tag, feed in feeds.items()}
+        resync = [player_tag for player_tag, feed in feeds.items() if feed.resync]
+        for player_tag in resync:
+            feeds[player_tag].resync = False
+        try:
+            rows, totals = await run_in_threadpool(_changes, cursors, resync)
+        except BaseException:
+            for player_tag in resync:
+                feeds[player_tag].resync = True
+            raise
+        LIVE_POLLS.inc()
+
+        for player_tag in resync:
+            feed = feeds[player_tag]
+            feed.load(totals.get(player_tag))
+            feed.broadcast(sse("totals", {"totals": feed.totals()}), "totals")
+        for battle in row_dicts(rows):
+            feed = feeds[battle["player_tag"]]
+            feed.broadcast(feed.add(battle), "battle")
+
+    # --- Aufrufe aus dem Import (Threadpool oder Event-Loop) ---------------------------
+
+    def notify(self, new_battles, updated_players):
+        """
+        Meldet einen committeten Import: {player_tag: (battle_time, brawler_id) des ältesten neuen Battles} und
+        die Spieler mit überschriebenen Battles. Weckt den Watch, wenn einer davon abonniert ist (thread-sicher).
+        """
+        if self._loop is None or not self.feeds:
+            return
+        self._loop.call_soon_threadsafe(self._dispatch, new_battles, updated_players)
+
+    def _dispatch(self, new_battles, updated_players):
+        wake = False
+        for player_tag in {*new_battles, *updated_players}:
+            feed = self.feeds.get(player_tag)
+            if feed is None or not feed.active:
+                continue
+            oldest = new_battles.get(player_tag)
+            behind = oldest is not None and feed.cursor is not None and oldest <= feed.cursor
+            if player_tag in updated_players or behind:
+                feed.resync = True
+            wake = True
+        if wake and self._wake is not None:
+            self._wake.set()
+
+
+def _totals_query(player_tags):
+    """Kennzahlen pro Spieler und der Cursor: brawler_id aus dem Primärschlüssel beim jüngsten battle_time."""
+    totals = (
+        select(
+            BattleData.player_tag,
+            func.count().label("battles"),
+            func.sum(case((victory_condition(), 1), else_=0)).label("victories"),
+            func.sum(BattleData.trophy_change).label("trophy_change"),
+            func.max(BattleData.battle_time).label("last_battle"),
+        )
+        .where(BattleData.player_tag.in_(sorted(player_tags)))
+        .group_by(BattleData.player_tag)
+        .subquery()
+    )
+    latest = aliased(BattleData)
+    return (
+        select(*totals.c, func.max(latest.brawler_id))
+        .join(latest, and_(latest.player_tag == totals.c.player_tag, latest.battle_time == totals.c.last_battle))
+        .group_by(*totals.c)
+    )
+
+
+def _read(work):
+    with session_bind(read_only=True) as bind:
+        db = SessionLocal(bind=bind)
+        try:
+            return work(db)
+        finally:
+            db.close()
+
+
+def _totals_by_player(db, player_tags):
+    """(battles, victories, trophy_change, (last_battle, brawler_id)) pro Spieler in einer Abfrage."""
+    return {
+        player_tag: (battles, int(victories or 0), int(trophy_change or 0), (last_battle, brawler_id))
+        for player_tag, battles, victories, trophy_change, last_battle, brawler_id
+        in db.execute(_totals_query(player_tags))
+    }
+
+
+def _totals(player_tags):
+    return _read(lambda db: _totals_by_player(db, player_tags))
+
+
+def _changes(cursors, resync):
+    """
+    Kennzahlen der neu zu aggregierenden Spieler und die Battles aller Feeds nach ihrem Cursor (eine Abfrage),
+    in derselben Reihenfolge (battle_time, brawler_id), in der Feed.add den Cursor fortschreibt.
+    """
+    def work(db):
+        # Kennzahlen zuerst: danach eingefügte Battles liegen hinter dem neuen Cursor und werden normal gezählt
+        totals = _totals_by_player(db, resync) if resync else {}
+        position = tuple_(BattleData.battle_time, BattleData.brawler_id)
+        conditions = [
+            BattleData.player_tag == player_tag if cursor is None
+            else and_(BattleData.player_tag == player_tag, position > cursor)
+            for player_tag, cursor in cursors.items()
+        ]
+        rows = db.execute(
+            select(*ROW_COLUMNS).where(or_(*conditions)).order_by(BattleData.battle_time, BattleData.brawler_id)
+        ).all()
+        return rows, totals
+
+    return _read(work)
+
+
+hub = Hub()
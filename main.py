@@ -1,489 +1,495 @@
-from typing import List, Optional
+import time
+from contextlib import asynccontextmanager, nullcontext
+from typing import Dict, List, Literal, Optional, Union
 from datetime import datetime
-from fastapi import FastAPI, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, case, and_, cast, Date
-
-from database import SessionLocal, engine, Base
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+import admission
+import leaderboard
+import live
+import precompute
+import sketches
+import stats
+from cache import cache_key, cached_statistics, result_cache, watermark
+from coalescing import statistics_flight
+from conditional import NotModified, Validator, is_not_modified, validator_headers
+from config import BULK_BATCH_SIZE, COALESCE_REQUESTS, USE_ROLLUP, USE_ASYNC_DB, USE_SKETCHES
+from database import SessionLocal, AsyncSessionLocal, SyncRunner, AsyncRunner, on_engine_created, session_bind
+from ingest import MAX_REPORTED_ERRORS, OPENAPI_REQUEST_BODY, RecordError, iter_records, upsert_batch, validate_record
+from metrics import MetricsMiddleware, cold_start, instrument_engine, render_metrics
 from models import BattleData
-from schemas import BattleDataRead, BattleStatistics, TrophyProgressResponse, BrawlerStats, BrawlerStatsResponse, GameModeStats, GameModeStatsResponse, MapStats, MapStatsResponse
+from rollup import enable_incremental_refresh
+from schemas import BatchStatisticsRequest, BattleDataRead, BattleStatistics, BulkIngestResult, CacheStatistics, LeaderboardResponse, TrophyProgressResponse, BrawlerStatsResponse, GameModeStatsResponse, MapStatsResponse, PlayerDashboardResponse
+from pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, has_entries, ndjson_stream, parse_fields, read_entry, read_page
+)
+from serialization import FastJSONResponse, row_dicts
+from startup import lifespan
 
-# Erzeugt Tabellen in der Datenbank (falls nicht bereits vorhanden)
-Base.metadata.create_all(bind=engine)
+router = APIRouter()
 
-app = FastAPI()
+DatabaseRunner = Union[SyncRunner, AsyncRunner]
+
+# HTTP-Methoden, deren Datenbankzugriffe auf ein Lese-Replika gehen dürfen
+READ_METHODS = ("GET", "HEAD")
+
+# POST-Routen, die nur lesen (Abfrageparameter im Body) und daher ebenfalls auf ein Replika dürfen
+READ_ONLY_ROUTES = ("/battle-statistics/batch", "/brawler-statistics/batch")
+
+@asynccontextmanager
+async def open_runner(read_only: bool):
+    """Runner mit eigener Session: AsyncSession bei USE_ASYNC_DB, sonst blockierende Session im Threadpool."""
+    if USE_ASYNC_DB:
+        with session_bind(read_only, asynchronous=True) as bind:
+            async with AsyncSessionLocal(bind=bind) as session:
+                yield AsyncRunner(session)
+        return
+
+    with session_bind(read_only) as bind:
+        db = SessionLocal(bind=bind)
+        try:
+            yield SyncRunner(db)
+        finally:
+            await run_in_threadpool(db.close)
 
-# Dependency für die DB-Session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
+# Dependency für die DB-Session der Anfrage.
+# GET-Requests lesen von einem Replika (falls READ_DATABASE_URL gesetzt), alles andere vom Primary.
+async def get_db(request: Request):
+    route = request.scope.get("route")
+    read_only = request.method in READ_METHODS or getattr(route, "path", None) in READ_ONLY_ROUTES
+    async with open_runner(read_only) as runner:
+        yield runner
 
-@app.get("/battle-data", response_model=List[BattleDataRead])
-def read_all_battle_data(db: Session = Depends(get_db)):
-    """Liest alle BattleData-Einträge aus."""
-    return db.query(BattleData).all()
 
+async def not_modified_handler(request: Request, exc: NotModified):
+    return Response(status_code=304, headers=exc.headers)
 
-@app.get("/battle-data/{player_tag}", response_model=List[BattleDataRead])
-def read_battle_data_by_player(player_tag: str, db: Session = Depends(get_db)):
-    """Liest alle BattleData-Einträge eines bestimmten Spielers anhand des player_tag."""
-    results = db.query(BattleData).filter(BattleData.player_tag == player_tag).all()
-    if not results:
+
+async def conditional_get(request: Request, response: Response, db: DatabaseRunner = Depends(get_db)) -> Validator:
+    """
+    Dependency für spielerbezogene GET-Endpunkte (player_tag als Pfad- oder Query-Parameter): liest das
+    Watermark des Spielers (max(battle_time), Anzahl Battles), setzt daraus ETag/Last-Modified und bricht mit
+    304 ab, wenn der Client den Stand bereits hat. Die Statistik-Endpunkte reichen das Watermark an
+    run_statistics weiter, damit der Cache es nicht ein zweites Mal liest.
+    """
+    player_tag = request.path_params.get("player_tag") or request.query_params.get("player_tag")
+    if not player_tag:
+        return Validator()
+    version = await db.run(watermark, player_tag)
+    latest, count = version
+    if not count:
+        return Validator(version)  # der Endpunkt antwortet mit 404
+    headers = validator_headers(request.url.path, request.query_params, latest, count)
+    if is_not_modified(request.headers, headers):
+        raise NotModified(headers)
+    response.headers.update(headers)
+    return Validator(version, headers, response)
+
+
+async def run_statistics(
+    db: DatabaseRunner, endpoint, compute, player_tag=None, start_date=None, end_date=None,
+    validator: Optional[Validator] = None, **options
+):
+    """
+    cached_statistics mit einem Platz der passenden Kostenklasse (admission.py).
+    Gleichzeitige Anfragen mit gleichem Cache-Schlüssel und Watermark warten auf die bereits laufende
+    Ausführung, statt sie zu wiederholen (COALESCE_REQUESTS), und belegen dabei keinen eigenen Platz. Die
+    gemeinsame Ausführung öffnet eine eigene lesende Session wie precompute._refresh: sie läuft weiter, wenn die
+    erste Anfrage abbricht und get_db deren Session schließt. Ohne Zusammenfassen dient der Runner der Anfrage.
+    Liefert der Cache einen veralteten Wert (stale-while-revalidate), entfallen ETag und Last-Modified.
+    """
+    cost = admission.statistics_cost(player_tag, start_date, end_date, **options)
+    version = validator.version if validator else None
+
+    async def execute(runner_context):
+        # Session erst öffnen, wenn ein Platz frei ist
+        async with admission.admitted(cost), runner_context as runner:
+            return await runner.run(
+                cached_statistics, endpoint, compute, player_tag, start_date, end_date, version=version, **options
+            )
+
+    if COALESCE_REQUESTS:
+        key = (cache_key(endpoint, player_tag, start_date, end_date, **options), version)
+        value, stale = await statistics_flight.run(key, endpoint, lambda: execute(open_runner(read_only=True)))
+    else:
+        value, stale = await execute(nullcontext(db))
+    if stale and validator:
+        validator.withdraw()
+    return value
+
+
+# Beschreibung des approx-Parameters der Statistik-Endpunkte mit Sketch-Unterstützung
+APPROX_DESCRIPTION = "Schätzung aus HyperLogLog-/KLL-Sketches statt exakter Auswertung (siehe README)"
+
+# Beschreibung des fields-Parameters (Sparse Fieldsets) der battle-data-Endpunkte
+FIELDS_DESCRIPTION = "Kommagetrennte Feldliste, z. B. player_tag,battle_time,trophy_change (Standard: alle Felder)"
+
+
+def page_response(rows, limit, fields=None, headers=None):
+    """
+    Kodiert eine Seite direkt mit orjson. Die Row-Tupel stammen typisiert aus der Datenbank, daher entfällt
+    die zeilenweise Validierung über BattleDataRead; response_model bleibt für das OpenAPI-Schema bestehen.
+    """
+    headers = dict(headers or {})
+    if len(rows) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1])
+    return FastJSONResponse(row_dicts(rows, fields), headers=headers)
+
+
+@router.get("/battle-data", response_model=List[BattleDataRead])
+async def read_all_battle_data(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Maximale Anzahl Einträge pro Seite"),
+    cursor: Optional[str] = Query(None, description="Cursor aus dem X-Next-Cursor-Header der vorherigen Seite"),
+    output_format: Literal["json", "ndjson"] = Query("json", alias="format", description="json (seitenweise) oder ndjson (Stream)"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    db: DatabaseRunner = Depends(get_db)
+):
+    """
+    Liest BattleData-Einträge seitenweise aus (Keyset-Pagination über player_tag, battle_time, brawler_id).
+    Mit format=ndjson werden alle Einträge ab dem Cursor als Stream geliefert.
+    Mit fields werden nur die angegebenen Spalten gelesen und ausgeliefert.
+    """
+    fields = parse_fields(fields)
+    if output_format == "ndjson":
+        stream = await admission.admitted_stream("heavy", ndjson_stream([], cursor, limit, fields))
+        return StreamingResponse(stream, media_type="application/x-ndjson")
+
+    limit = limit or DEFAULT_PAGE_SIZE
+    async with admission.admitted("light"):
+        results = await db.run(read_page, [], cursor, limit, fields)
+    return page_response(results, limit, fields)
+
+
+@router.get("/battle-data/{player_tag}", response_model=List[BattleDataRead])
+async def read_battle_data_by_player(
+    player_tag: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Maximale Anzahl Einträge pro Seite"),
+    cursor: Optional[str] = Query(None, description="Cursor aus dem X-Next-Cursor-Header der vorherigen Seite"),
+    output_format: Literal["json", "ndjson"] = Query("json", alias="format", description="json (seitenweise) oder ndjson (Stream)"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    validator: Validator = Depends(conditional_get),
+    db: DatabaseRunner = Depends(get_db)
+):
+    """Liest die BattleData-Einträge eines bestimmten Spielers anhand des player_tag (seitenweise oder als Stream)."""
+    filters = [BattleData.player_tag == player_tag]
+    fields = parse_fields(fields)
+
+    if output_format == "ndjson":
+        # Existenz vorab prüfen, damit auch im Streaming-Modus ein 404 möglich ist
+        if not cursor and not await db.run(has_entries, filters):
+            raise HTTPException(status_code=404, detail="Keine Einträge für diesen Player gefunden.")
+        stream = await admission.admitted_stream("standard", ndjson_stream(filters, cursor, limit, fields))
+        return StreamingResponse(stream, media_type="application/x-ndjson", headers=validator.headers)
+
+    limit = limit or DEFAULT_PAGE_SIZE
+    async with admission.admitted("light"):
+        results = await db.run(read_page, filters, cursor, limit, fields)
+    if not results and not cursor:
         raise HTTPException(status_code=404, detail="Keine Einträge für diesen Player gefunden.")
-    return results
+    return page_response(results, limit, fields, validator.headers)
+
+
+@router.post("/battle-data/bulk", response_model=BulkIngestResult, openapi_extra=OPENAPI_REQUEST_BODY)
+async def bulk_ingest_battle_data(
+    request: Request,
+    batch_size: int = Query(BULK_BATCH_SIZE, ge=1, le=10000, description="Anzahl Datensätze pro Upsert-Batch"),
+    db: DatabaseRunner = Depends(get_db)
+):
+    """
+    Schreibt Battle-Datensätze als JSON-Array oder NDJSON-Stream (Content-Type application/x-ndjson).
+    Die Datensätze werden in Batches per Upsert über den Primärschlüssel geschrieben;
+    ungültige Datensätze werden übersprungen und in der Antwort gemeldet.
+    """
+    started = time.perf_counter()
+    received = inserted = updated = rejected = batches = 0
+    errors = []
+    batch = []
+
+    async def flush():
+        nonlocal inserted, updated, batches, batch
+        batch_inserted, batch_updated = await db.run(upsert_batch, batch)
+        inserted += batch_inserted
+        updated += batch_updated
+        batches += 1
+        batch = []
+
+    try:
+        async for record in iter_records(request):
+            index, received = received, received + 1
+            try:
+                batch.append(validate_record(record))
+            except RecordError as error:
+                rejected += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"index": index, "detail": str(error)})
+                continue
+            if len(batch) >= batch_size:
+                await flush()
+    except RecordError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if batch:
+        await flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "received": received,
+        "inserted": inserted,
+        "updated": updated,
+        "rejected": rejected,
+        "batches": batches,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round((inserted + updated) / elapsed, 1) if elapsed else 0.0,
+        "errors": errors
+    }
 
 
-@app.get("/battle-data/{player_tag}/{battle_time}/{brawler_id}", response_model=BattleDataRead)
-def read_one_battle_data(player_tag: str, battle_time: str, brawler_id: int, db: Session = Depends(get_db)):
+@router.get("/battle-data/{player_tag}/{battle_time}/{brawler_id}", response_model=BattleDataRead)
+async def read_one_battle_data(
+    player_tag: str,
+    battle_time: str,
+    brawler_id: int,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    validator: Validator = Depends(conditional_get),
+    db: DatabaseRunner = Depends(get_db)
+):
     """
     Liest einen einzelnen BattleData-Eintrag anhand des zusammengesetzten Primärschlüssels.
     Erwartet battle_time als String im ISO-Format, z. B. '2023-05-06T15:30:00'.
     """
-    entry = db.query(BattleData).filter(
-        BattleData.player_tag == player_tag,
-        BattleData.battle_time == battle_time,
-        BattleData.brawler_id == brawler_id
-    ).first()
+    fields = parse_fields(fields)
+    async with admission.admitted("light"):
+        entry = await db.run(read_entry, player_tag, battle_time, brawler_id, fields)
     if not entry:
         raise HTTPException(status_code=404, detail="Keine Daten für diese Parameter gefunden.")
-    return entry
+    return FastJSONResponse(row_dicts([entry], fields)[0], headers=validator.headers)
 
 
-@app.get("/battle-statistics", response_model=BattleStatistics)
-def get_battle_statistics(
+@router.get("/battle-statistics", response_model=BattleStatistics)
+async def get_battle_statistics(
     player_tag: Optional[str] = None,
     start_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
     end_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
-    db: Session = Depends(get_db)
+    approx: bool = Query(False, description=APPROX_DESCRIPTION),
+    validator: Validator = Depends(conditional_get),
+    db: DatabaseRunner = Depends(get_db)
 ):
     """
     Liefert Statistiken über Battle Logs. Optional gefiltert nach Spieler und Zeitraum.
+    Mit approx=true wird unique_players aus HyperLogLog-Sketches geschätzt (Standardfehler ca. 1,6 %).
     """
-    # Basis-Filter erstellen
-    filters = []
-    if player_tag:
-        filters.append(BattleData.player_tag == player_tag)
-    if start_date:
-        filters.append(BattleData.battle_time >= start_date)
-    if end_date:
-        filters.append(BattleData.battle_time <= end_date)
-
-    # Basis-Statistiken mit Filtern
-    stats = db.query(
-        func.min(BattleData.battle_time).label('first_battle'),
-        func.max(BattleData.battle_time).label('last_battle'),
-        func.count().label('total_battles'),
-        func.count(func.distinct(BattleData.player_tag)).label('unique_players')
-    ).filter(*filters).first()
-
-    # Wenn keine Daten gefunden wurden
-    if not stats.first_battle:
-        raise HTTPException(status_code=404, detail="Keine Battles im angegebenen Zeitraum gefunden.")
-
-    # Berechne Tage zwischen erstem und letztem Battle
-    days_diff = (stats.last_battle - stats.first_battle).days + 1
-
-    # Victory-Bedingung basierend auf battle_mode
-    victory_condition = case(
-        (BattleData.battle_mode == 'duoShowdown', BattleData.rank <= 2),
-        (BattleData.battle_mode == 'soloShowdown', BattleData.rank <= 4),
-        (BattleData.battle_mode.notin_(['duoShowdown', 'soloShowdown']), 
-         BattleData.battle_result == 'victory')
+    return await run_statistics(
+        db, "battle-statistics", stats.battle_statistics, player_tag, start_date, end_date,
+        approx=approx, validator=validator
     )
 
-    # Erweiterte Statistiken mit denselben Filtern
-    extended_stats = db.query(
-        func.sum(case((victory_condition, 1), else_=0)).label('victories'),
-        func.sum(BattleData.trophy_change).label('total_trophies')
-    ).filter(*filters).first()
 
-    return {
-        "first_battle": stats.first_battle,
-        "last_battle": stats.last_battle,
-        "total_battles": stats.total_battles,
-        "unique_players": stats.unique_players,
-        "avg_battles_per_day": round(stats.total_battles / days_diff, 2),
-        "avg_trophies_per_day": round(extended_stats.total_trophies / days_diff, 2),
-        "avg_victories_per_day": round(extended_stats.victories / days_diff, 2),
-        "win_rate": round(extended_stats.victories / stats.total_battles * 100, 2)
-    }
+@router.post("/battle-statistics/batch", response_model=Dict[str, Optional[BattleStatistics]])
+async def get_batch_battle_statistics(body: BatchStatisticsRequest, db: DatabaseRunner = Depends(get_db)):
+    """
+    Liefert die Battle-Statistiken mehrerer Spieler (z. B. eines Clubs) als Zuordnung player_tag -> Statistik.
+    Alle Spieler werden in einer nach player_tag gruppierten Abfrage berechnet; Spieler ohne Battles im
+    Zeitraum erhalten null.
+    """
+    player_tags = tuple(dict.fromkeys(body.player_tags))
+    return await run_statistics(
+        db, "battle-statistics-batch", stats.batch_battle_statistics, player_tags,
+        body.start_date, body.end_date
+    )
 
 
-@app.get("/trophy-progress", response_model=TrophyProgressResponse)
-def get_trophy_progress(
+@router.get("/trophy-progress", response_model=TrophyProgressResponse)
+async def get_trophy_progress(
     player_tag: Optional[str] = None,
     start_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
     end_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
-    db: Session = Depends(get_db)
+    bucket: Literal["hour", "day", "week", "month"] = Query("day", description="Zeitraum pro Punkt der Zeitreihe"),
+    max_points: Optional[int] = Query(None, ge=3, le=10000, description="Zeitreihe per LTTB auf höchstens so viele Punkte ausdünnen"),
+    validator: Validator = Depends(conditional_get),
+    db: DatabaseRunner = Depends(get_db)
 ):
     """
-    Liefert den täglichen Trophy Progress. Optional gefiltert nach Spieler und Zeitraum.
-    """
-    # Basis-Filter erstellen
-    filters = []
-    if player_tag:
-        filters.append(BattleData.player_tag == player_tag)
-    if start_date:
-        filters.append(BattleData.battle_time >= start_date)
-    if end_date:
-        filters.append(BattleData.battle_time <= end_date)
-
-    # Victory-Bedingung (wie in get_battle_statistics)
-    victory_condition = case(
-        (BattleData.battle_mode == 'duoShowdown', BattleData.rank <= 2),
-        (BattleData.battle_mode == 'soloShowdown', BattleData.rank <= 4),
-        (BattleData.battle_mode.notin_(['duoShowdown', 'soloShowdown']), 
-         BattleData.battle_result == 'victory')
+    Liefert den Trophy Progress pro Tag (bzw. Stunde, Woche, Monat) inklusive kumulierter Trophäenänderung.
+    Optional gefiltert nach Spieler und Zeitraum und per max_points auf eine feste Punktzahl ausgedünnt.
+    """
+    return await run_statistics(
+        db, "trophy-progress", stats.trophy_progress, player_tag, start_date, end_date,
+        bucket=bucket, max_points=max_points, validator=validator
     )
 
-    # Tägliche Statistiken abfragen
-    daily_stats = db.query(
-        cast(BattleData.battle_time, Date).label('date'),
-        func.sum(BattleData.trophy_change).label('trophy_change'),
-        func.count().label('total_battles'),
-        func.sum(case((victory_condition, 1), else_=0)).label('victory_count')
-    ).filter(
-        *filters
-    ).group_by(
-        cast(BattleData.battle_time, Date)
-    ).order_by(
-        cast(BattleData.battle_time, Date)
-    ).all()
-
-    if not daily_stats:
-        raise HTTPException(status_code=404, detail="Keine Daten für den angegebenen Zeitraum gefunden.")
-
-    # Gesamtstatistiken berechnen
-    total_trophy_change = sum(day.trophy_change for day in daily_stats)
-    total_battles = sum(day.total_battles for day in daily_stats)
-    total_victories = sum(day.victory_count for day in daily_stats)
-
-    # Tägliche Fortschritte formatieren
-    daily_progress = [
-        {
-            "date": day.date,
-            "trophy_change": day.trophy_change,
-            "total_battles": day.total_battles,
-            "victory_count": day.victory_count,
-            "win_rate": round(day.victory_count / day.total_battles * 100, 2)
-        }
-        for day in daily_stats
-    ]
 
-    return {
-        "player_tag": player_tag,
-        "start_date": daily_stats[0].date,
-        "end_date": daily_stats[-1].date,
-        "daily_progress": daily_progress,
-        "total_trophy_change": total_trophy_change,
-        "total_battles": total_battles,
-        "overall_win_rate": round(total_victories / total_battles * 100, 2)
-    }
-
-
-@app.get("/brawler-statistics", response_model=BrawlerStatsResponse)
-def get_brawler_statistics(
+@router.get("/brawler-statistics", response_model=BrawlerStatsResponse)
+async def get_brawler_statistics(
     player_tag: Optional[str] = None,
     start_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
     end_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
-    db: Session = Depends(get_db)
+    validator: Validator = Depends(conditional_get),
+    db: DatabaseRunner = Depends(get_db)
 ):
     """
     Liefert Statistiken für jeden verwendeten Brawler. Optional gefiltert nach Spieler und Zeitraum.
     """
-    # Basis-Filter erstellen
-    filters = []
-    if player_tag:
-        filters.append(BattleData.player_tag == player_tag)
-    if start_date:
-        filters.append(BattleData.battle_time >= start_date)
-    if end_date:
-        filters.append(BattleData.battle_time <= end_date)
-
-    # Victory-Bedingung basierend auf battle_mode
-    victory_condition = case(
-        (BattleData.battle_mode == 'duoShowdown', BattleData.rank <= 2),
-        (BattleData.battle_mode == 'soloShowdown', BattleData.rank <= 4),
-        (BattleData.battle_mode.notin_(['duoShowdown', 'soloShowdown']), 
-         BattleData.battle_result == 'victory')
+    return await run_statistics(
+        db, "brawler-statistics", stats.brawler_statistics, player_tag, start_date, end_date, validator=validator
     )
 
-    # Statistiken pro Brawler abfragen mit COALESCE für NULL-Werte
-    brawler_stats = db.query(
-        BattleData.brawler_name,
-        func.count().label('battles'),
-        func.sum(case((victory_condition, 1), else_=0)).label('victories'),
-        func.coalesce(func.sum(BattleData.trophy_change), 0).label('trophy_change')  # Behandelt NULL-Werte
-    ).filter(
-        *filters
-    ).group_by(
-        BattleData.brawler_name
-    ).order_by(
-        func.count().desc()  # Sortierung nach Anzahl Battles
-    ).all()
-
-    if not brawler_stats:
-        raise HTTPException(status_code=404, detail="Keine Daten für den angegebenen Zeitraum gefunden.")
-
-    # Gesamtstatistiken berechnen
-    total_battles = sum(stat.battles for stat in brawler_stats)
-    total_victories = sum(stat.victories for stat in brawler_stats)
-    total_trophy_change = sum(stat.trophy_change or 0 for stat in brawler_stats)  # Sicherheit gegen NULL
-
-    # Brawler-Statistiken formatieren
-    brawler_statistics = [
-        {
-            "brawler_name": stat.brawler_name,
-            "battles": stat.battles,
-            "victories": stat.victories,
-            "trophy_change": int(stat.trophy_change or 0),  # Konvertierung zu int und NULL-Handling
-            "win_rate": round(stat.victories / stat.battles * 100, 2)
-        }
-        for stat in brawler_stats
-    ]
-
-    # Zeitraum ermitteln
-    time_range = db.query(
-        func.min(BattleData.battle_time).label('start_date'),
-        func.max(BattleData.battle_time).label('end_date')
-    ).filter(*filters).first()
 
-    return {
-        "player_tag": player_tag,
-        "start_date": time_range.start_date,
-        "end_date": time_range.end_date,
-        "brawler_statistics": brawler_statistics,
-        "total_battles": total_battles,
-        "total_trophy_change": int(total_trophy_change),  # Konvertierung zu int
-        "overall_win_rate": round(total_victories / total_battles * 100, 2)
-    }
+@router.post("/brawler-statistics/batch", response_model=Dict[str, Optional[BrawlerStatsResponse]])
+async def get_batch_brawler_statistics(body: BatchStatisticsRequest, db: DatabaseRunner = Depends(get_db)):
+    """
+    Liefert die Brawler-Statistiken mehrerer Spieler als Zuordnung player_tag -> Statistik, berechnet in
+    einer nach player_tag gruppierten Abfrage. Spieler ohne Battles im Zeitraum erhalten null.
+    """
+    player_tags = tuple(dict.fromkeys(body.player_tags))
+    return await run_statistics(
+        db, "brawler-statistics-batch", stats.batch_brawler_statistics, player_tags,
+        body.start_date, body.end_date
+    )
 
 
-@app.get("/gamemode-statistics", response_model=GameModeStatsResponse)
-def get_gamemode_statistics(
+@router.get("/gamemode-statistics", response_model=GameModeStatsResponse, response_model_exclude_unset=True)
+async def get_gamemode_statistics(
     player_tag: Optional[str] = None,
     start_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
     end_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
-    db: Session = Depends(get_db)
+    approx: bool = Query(False, description=APPROX_DESCRIPTION),
+    validator: Validator = Depends(conditional_get),
+    db: DatabaseRunner = Depends(get_db)
 ):
     """
     Liefert Statistiken für jeden Game Mode. Optional gefiltert nach Spieler und Zeitraum.
+    Mit approx=true kommen p50, p90 und p99 der Kampfdauer aus KLL-Sketches hinzu.
     """
-    # Basis-Filter erstellen
-    filters = []
-    if player_tag:
-        filters.append(BattleData.player_tag == player_tag)
-    if start_date:
-        filters.append(BattleData.battle_time >= start_date)
-    if end_date:
-        filters.append(BattleData.battle_time <= end_date)
-
-    # Victory-Bedingung basierend auf battle_mode
-    victory_condition = case(
-        (BattleData.battle_mode == 'duoShowdown', BattleData.rank <= 2),
-        (BattleData.battle_mode == 'soloShowdown', BattleData.rank <= 4),
-        (BattleData.battle_mode.notin_(['duoShowdown', 'soloShowdown']), 
-         BattleData.battle_result == 'victory')
+    return await run_statistics(
+        db, "gamemode-statistics", stats.gamemode_statistics, player_tag, start_date, end_date,
+        approx=approx, validator=validator
     )
 
-    # Statistiken pro Game Mode abfragen
-    gamemode_stats = db.query(
-        BattleData.battle_mode,
-        func.count().label('battles'),
-        func.sum(case((victory_condition, 1), else_=0)).label('victories'),
-        func.coalesce(func.sum(BattleData.trophy_change), 0).label('trophy_change'),
-        func.avg(case(
-            (BattleData.battle_duration.isnot(None), BattleData.battle_duration)
-        )).label('avg_duration')
-    ).filter(
-        *filters
-    ).group_by(
-        BattleData.battle_mode
-    ).order_by(
-        func.count().desc()  # Sortierung nach Anzahl Battles
-    ).all()
-
-    if not gamemode_stats:
-        raise HTTPException(status_code=404, detail="Keine Daten für den angegebenen Zeitraum gefunden.")
-
-    # Gesamtstatistiken berechnen
-    total_battles = sum(stat.battles for stat in gamemode_stats)
-    total_victories = sum(stat.victories for stat in gamemode_stats)
-    total_trophy_change = sum(stat.trophy_change or 0 for stat in gamemode_stats)
-
-    # Game Mode Statistiken formatieren
-    game_mode_statistics = []
-    for stat in gamemode_stats:
-        avg_trophies = round(stat.trophy_change / stat.battles, 2)
-        
-        # Berechne seconds_per_trophy nur wenn sowohl duration als auch trophy_change verfügbar
-        seconds_per_trophy = None
-        if stat.avg_duration and stat.trophy_change > 0:
-            seconds_per_trophy = round((stat.avg_duration * stat.battles) / stat.trophy_change, 2)
-
-        game_mode_statistics.append({
-            "battle_mode": stat.battle_mode,
-            "battles": stat.battles,
-            "victories": stat.victories,
-            "trophy_change": int(stat.trophy_change or 0),
-            "avg_duration": round(stat.avg_duration, 2) if stat.avg_duration else None,
-            "avg_trophies_per_battle": avg_trophies,
-            "seconds_per_trophy": seconds_per_trophy,
-            "win_rate": round(stat.victories / stat.battles * 100, 2)
-        })
-
-    # Zeitraum ermitteln
-    time_range = db.query(
-        func.min(BattleData.battle_time).label('start_date'),
-        func.max(BattleData.battle_time).label('end_date')
-    ).filter(*filters).first()
 
-    return {
-        "player_tag": player_tag,
-        "start_date": time_range.start_date,
-        "end_date": time_range.end_date,
-        "game_mode_statistics": game_mode_statistics,
-        "total_battles": total_battles,
-        "total_trophy_change": int(total_trophy_change),
-        "overall_win_rate": round(total_victories / total_battles * 100, 2)
-    }
+@router.get("/map-statistics", response_model=MapStatsResponse, response_model_exclude_unset=True)
+async def get_map_statistics(
+    player_tag: Optional[str] = None,
+    start_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
+    end_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
+    approx: bool = Query(False, description=APPROX_DESCRIPTION),
+    validator: Validator = Depends(conditional_get),
+    db: DatabaseRunner = Depends(get_db)
+):
+    """
+    Liefert Statistiken für jede Map-Battle-Mode Kombination. Optional gefiltert nach Spieler und Zeitraum.
+    Mit approx=true kommen p50, p90 und p99 der Kampfdauer aus KLL-Sketches hinzu.
+    """
+    return await run_statistics(
+        db, "map-statistics", stats.map_statistics, player_tag, start_date, end_date,
+        approx=approx, validator=validator
+    )
 
 
-@app.get("/map-statistics", response_model=MapStatsResponse)
-def get_map_statistics(
+@router.get("/player-dashboard", response_model=PlayerDashboardResponse, response_model_exclude_unset=True)
+async def get_player_dashboard(
     player_tag: Optional[str] = None,
     start_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
     end_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
-    db: Session = Depends(get_db)
+    validator: Validator = Depends(conditional_get),
+    db: DatabaseRunner = Depends(get_db)
 ):
     """
-    Liefert Statistiken für jede Map-Battle-Mode Kombination. Optional gefiltert nach Spieler und Zeitraum.
+    Liefert Battle-, Trophy-, Brawler-, Game-Mode- und Map-Statistiken in einer Antwort.
+    Die Werte entsprechen exakt denen der einzelnen Endpunkte, werden aber aus einem einzigen Durchlauf berechnet.
     """
-    # Basis-Filter erstellen
-    filters = []
-    if player_tag:
-        filters.append(BattleData.player_tag == player_tag)
-    if start_date:
-        filters.append(BattleData.battle_time >= start_date)
-    if end_date:
-        filters.append(BattleData.battle_time <= end_date)
-
-    # Victory-Bedingung basierend auf battle_mode
-    victory_condition = case(
-        (BattleData.battle_mode == 'duoShowdown', BattleData.rank <= 2),
-        (BattleData.battle_mode == 'soloShowdown', BattleData.rank <= 4),
-        (BattleData.battle_mode.notin_(['duoShowdown', 'soloShowdown']), 
-         BattleData.battle_result == 'victory')
+    return await run_statistics(
+        db, "player-dashboard", stats.player_dashboard, player_tag, start_date, end_date, validator=validator
     )
 
-    # Basis-Statistiken pro Map abfragen
-    map_stats = db.query(
-        BattleData.event_map,
-        BattleData.battle_mode,
-        func.count().label('battles'),
-        func.sum(case((victory_condition, 1), else_=0)).label('victories'),
-        func.coalesce(func.sum(BattleData.trophy_change), 0).label('trophy_change'),
-        func.avg(case(
-            (BattleData.battle_duration.isnot(None), BattleData.battle_duration)
-        )).label('avg_duration')
-    ).filter(
-        *filters,
-        BattleData.event_map.isnot(None),  # Nur Einträge mit Map-Namen
-        BattleData.event_map != ''         # Keine leeren Strings
-    ).group_by(
-        BattleData.event_map,
-        BattleData.battle_mode
-    ).order_by(
-        func.count().desc()
-    ).all()
-
-    if not map_stats:
-        raise HTTPException(status_code=404, detail="Keine Daten für den angegebenen Zeitraum gefunden.")
-
-    # Map Statistiken mit Brawler-Informationen formatieren
-    map_statistics = []
-    for stat in map_stats:
-        # Filter für diese spezifische Map
-        map_filters = filters.copy()
-        map_filters.extend([
-            BattleData.event_map == stat.event_map,
-            BattleData.battle_mode == stat.battle_mode,
-            BattleData.event_map.isnot(None),  # Sicherheit für Brawler-Statistiken
-            BattleData.event_map != ''
-        ])
-
-        # Beste Brawler für diese Map ermitteln
-        brawler_stats = db.query(
-            BattleData.brawler_name,
-            func.count().label('battles'),
-            func.sum(case((victory_condition, 1), else_=0)).label('victories'),
-            func.coalesce(func.sum(BattleData.trophy_change), 0).label('trophy_change')
-        ).filter(
-            *map_filters
-        ).group_by(
-            BattleData.brawler_name
-        ).all()
-
-        # Brawler mit meisten Battles
-        most_played = max(brawler_stats, key=lambda x: x.battles)
-        # Brawler mit meisten Trophäen
-        most_trophies = max(brawler_stats, key=lambda x: x.trophy_change)
-
-        # Durchschnittliche Trophäen pro Battle
-        avg_trophies = round(stat.trophy_change / stat.battles, 2)
-        
-        # Sekunden pro Trophäe berechnen
-        seconds_per_trophy = None
-        if stat.avg_duration and stat.trophy_change > 0:
-            seconds_per_trophy = round((stat.avg_duration * stat.battles) / stat.trophy_change, 2)
-
-        map_statistics.append({
-            "event_map": stat.event_map,
-            "battle_mode": stat.battle_mode,
-            "battles": stat.battles,
-            "victories": stat.victories,
-            "trophy_change": int(stat.trophy_change),
-            "avg_trophies_per_battle": avg_trophies,
-            "avg_duration": round(stat.avg_duration, 2) if stat.avg_duration else None,
-            "seconds_per_trophy": seconds_per_trophy,
-            "win_rate": round(stat.victories / stat.battles * 100, 2),
-            "most_played_brawler": {
-                "brawler_name": most_played.brawler_name,
-                "battles": most_played.battles,
-                "victories": most_played.victories,
-                "trophy_change": int(most_played.trophy_change),
-                "win_rate": round(most_played.victories / most_played.battles * 100, 2)
-            },
-            "most_trophy_brawler": {
-                "brawler_name": most_trophies.brawler_name,
-                "battles": most_trophies.battles,
-                "victories": most_trophies.victories,
-                "trophy_change": int(most_trophies.trophy_change),
-                "win_rate": round(most_trophies.victories / most_trophies.battles * 100, 2)
-            }
-        })
-
-    # Gesamtstatistiken berechnen
-    total_battles = sum(stat.battles for stat in map_stats)
-    total_victories = sum(stat.victories for stat in map_stats)
-    total_trophy_change = sum(stat.trophy_change for stat in map_stats)
-
-    # Zeitraum ermitteln
-    time_range = db.query(
-        func.min(BattleData.battle_time).label('start_date'),
-        func.max(BattleData.battle_time).label('end_date')
-    ).filter(*filters).first()
 
-    return {
-        "player_tag": player_tag,
-        "start_date": time_range.start_date,
-        "end_date": time_range.end_date,
-        "map_statistics": map_statistics,
-        "total_battles": total_battles,
-        "total_trophy_change": int(total_trophy_change),
-        "overall_win_rate": round(total_victories / total_battles * 100, 2)
-    }
+@router.get("/leaderboard", response_model=LeaderboardResponse)
+async def get_leaderboard(
+    metric: Literal[leaderboard.METRICS] = Query("win_rate", description="Metrik, nach der gerankt wird"),
+    dimension: Literal[leaderboard.DIMENSIONS] = Query("player_tag", description="Was gerankt wird"),
+    k: int = Query(50, ge=1, le=1000, description="Anzahl Einträge"),
+    min_battles: int = Query(1, ge=1, description="Mindestanzahl Battles pro Eintrag"),
+    order: Optional[Literal["asc", "desc"]] = Query(None, description="Standard: asc für avg_duration und seconds_per_trophy, sonst desc"),
+    player_tag: Optional[str] = None,
+    battle_mode: Optional[str] = None,
+    event_map: Optional[str] = None,
+    start_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
+    end_date: Optional[datetime] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
+    validator: Validator = Depends(conditional_get),
+    db: DatabaseRunner = Depends(get_db)
+):
+    """
+    Liefert die Top-K-Rangliste einer Dimension (Spieler, Brawler, Modus, Map) nach einer Metrik, z. B. die
+    50 Spieler mit der höchsten Win-Rate ab 100 Battles oder die Brawler mit dem größten Trophäengewinn auf
+    einer Map. Sortierung und Begrenzung laufen in der Datenbank, übertragen werden nur die k Einträge.
+    """
+    return await run_statistics(
+        db, "leaderboard", leaderboard.leaderboard, player_tag, start_date, end_date,
+        metric=metric, dimension=dimension, k=k, min_battles=min_battles, order=order,
+        battle_mode=battle_mode, event_map=event_map, validator=validator
+    )
+
+
+@router.get("/live/{player_tag}", response_class=StreamingResponse)
+async def live_battles(player_tag: str):
+    """
+    Server-Sent Events mit den neuen Battles eines Spielers. Erstes Ereignis "snapshot" mit den laufenden
+    Kennzahlen (battles, victories, trophy_change, win_rate, last_battle), danach pro neuem Battle ein Ereignis
+    "battle" mit der Zeile (Felder wie BattleDataRead) und den fortgeschriebenen Kennzahlen; "totals", wenn sie
+    nach überschriebenen oder nachgetragenen Battles neu aggregiert wurden. Alle Streams eines Workers teilen
+    sich eine Datenbankabfrage pro LIVE_POLL_SECONDS.
+    """
+    stream = await live.hub.stream(player_tag)
+    return StreamingResponse(
+        stream, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/cache-statistics", response_model=CacheStatistics)
+def get_cache_statistics():
+    """
+    Liefert Treffer-, Fehl- und Verdrängungszähler des Ergebnis-Caches der Statistik-Endpunkte sowie
+    (mit PRECOMPUTE_ENABLED) den Zustand der Hintergrund-Neuberechnung.
+    """
+    scheduler = precompute.scheduler
+    return {**result_cache.statistics(), "precompute": scheduler.statistics() if scheduler else None}
+
+
+@router.get("/metrics", response_class=Response)
+def get_metrics():
+    """Request-Latenzen, Query-Anzahl und -Dauer pro Route im Prometheus-Textformat."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+def create_app() -> FastAPI:
+    """
+    App-Factory ohne Datenbankzugriff: die Engines entstehen bei der ersten Session, Schema-Check und Warmup
+    laufen optional im Lifespan (CREATE_SCHEMA_ON_STARTUP, WARMUP_ON_STARTUP, siehe startup.py).
+    """
+    if "import" not in cold_start.phases:
+        cold_start.record("import", cold_start.since_process_start())
+
+    # Query-Anzahl und -Dauer pro Request erfassen (Prometheus, Server-Timing, Slow-Query-Log)
+    on_engine_created(instrument_engine)
+    # Statement-Timeouts der Kostenklassen (MAX_EXECUTION_TIME bzw. SQLite-Progress-Handler)
+    on_engine_created(admission.install_statement_timeouts)
+
+    # Rollup-Tabelle bei jedem Schreibvorgang über die ORM-Session mitführen
+    if USE_ROLLUP:
+        enable_incremental_refresh(SessionLocal)
+
+    # Tages-Sketches für approx=true ebenso mitführen
+    if USE_SKETCHES:
+        sketches.enable_incremental_refresh(SessionLocal)
+
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(MetricsMiddleware)
+    app.add_exception_handler(NotModified, not_modified_handler)
+    app.include_router(router)
+    return app
+
+
+# Für `uvicorn main:app`; alternativ `uvicorn main:create_app --factory`
+app = create_app()
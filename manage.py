@@ -0,0 +1,129 @@
+"""
+Wartungsbefehle für die Battle-Log-Datenbank.
+
+Verwendung:
+    python manage.py rebuild-rollup [--player-tag TAG]
+    python manage.py rebuild-sketches
+    python manage.py archive --before DATUM
+    python manage.py create-indexes
+    python manage.py audit-queries [--days N] [--verbose]
+"""
+import argparse
+import sys
+from datetime import date
+
+from database import Base, SessionLocal, get_engine
+import archive
+import models  # noqa: F401  (registriert die Tabellen an Base.metadata)
+import rollup
+import sketches
+
+
+def rebuild_rollup(args):
+    """Baut die tägliche Rollup-Tabelle aus battle_logs neu auf."""
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine, tables=[models.BattleDailyRollup.__table__])
+    with engine.begin() as connection:
+        rows = rollup.rebuild(connection, args.player_tag)
+    print(f"Rollup neu aufgebaut: {rows} Einträge.")
+
+
+def rebuild_sketches(args):
+    """Baut die Tages-Sketches (HyperLogLog der Spieler, KLL der Kampfdauer) aus battle_logs neu auf."""
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine, tables=[
+        models.BattleDailyPlayers.__table__, models.BattleDailyDurations.__table__
+    ])
+    with engine.begin() as connection:
+        days = sketches.rebuild(connection)
+    print(f"Sketches neu aufgebaut: {days} Tage.")
+
+
+def archive_battles(args):
+    """Verschiebt alle Battles vor dem Monatsanfang von --before ins Parquet-Archiv (ARCHIVE_DIR)."""
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine, tables=[models.BattleDailyRollup.__table__])
+    archived = archive.archive_before(engine, args.before)
+    if not archived:
+        print(f"Keine Battles vor {archive.month_start(args.before)} in battle_logs.")
+        return
+    for month, rows in archived.items():
+        print(f"{month:%Y-%m}: {rows} Battles archiviert")
+    print(f"{sum(archived.values())} Battles ins Archiv verschoben.")
+
+
+def create_indexes(args):
+    """
+    Legt fehlende Tabellen und die in models.py deklarierten Sekundärindizes auf einer bestehenden
+    Datenbank an (create_all legt Indizes nur zusammen mit neuen Tabellen an).
+    """
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                index.create(bind=connection, checkfirst=True)
+                print(f"{table.name}.{index.name}: vorhanden")
+
+
+def audit_queries(args):
+    """Prüft die Query-Pläne aller lesenden Endpunkte auf Full Scans; Exit-Code 1 bei unerwarteten Scans."""
+    import query_audit
+
+    report = query_audit.audit(SessionLocal, args.days)
+    if not report:
+        print("Keine Daten in battle_logs, kein Audit möglich (bzw. Columnar-Engine aktiv).")
+        return
+
+    unexpected = 0
+    for entry in report:
+        if not entry["full_scans"] and not args.verbose:
+            continue
+        if entry["full_scans"] and not entry["expected"]:
+            status = "FULL SCAN"
+            unexpected += 1
+        else:
+            status = "ok" if not entry["full_scans"] else "Full Scan (erwartet)"
+        print(f"[{status}] {entry['endpoint']} ({entry['scenario']})")
+        for scan in entry["full_scans"]:
+            print(f"    {scan}")
+        if args.verbose:
+            print(f"    {entry['statement']}")
+
+    print(f"{len(report)} Statements geprüft, {unexpected} mit unerwartetem Full Scan.")
+    if unexpected:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wartungsbefehle für die Battle-Log-Datenbank")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild-rollup", help="Tägliche Rollup-Tabelle neu aufbauen (Backfill)")
+    rebuild.add_argument("--player-tag", help="Nur die Einträge dieses Spielers neu aufbauen")
+    rebuild.set_defaults(handler=rebuild_rollup)
+
+    rebuild_sketch = commands.add_parser("rebuild-sketches", help="Tages-Sketches für approx=true neu aufbauen")
+    rebuild_sketch.set_defaults(handler=rebuild_sketches)
+
+    archive_command = commands.add_parser("archive", help="Alte Battles ins Parquet-Archiv verschieben")
+    archive_command.add_argument(
+        "--before", type=date.fromisoformat, required=True,
+        help="Stichtag YYYY-MM-DD; archiviert werden ganze Monate vor dem Monatsanfang des Stichtags"
+    )
+    archive_command.set_defaults(handler=archive_battles)
+
+    indexes = commands.add_parser("create-indexes", help="Sekundärindizes auf bestehender Datenbank anlegen")
+    indexes.set_defaults(handler=create_indexes)
+
+    audit = commands.add_parser("audit-queries", help="Query-Pläne der Endpunkte auf Full Scans prüfen")
+    audit.add_argument("--days", type=int, default=30, help="Länge des geprüften Zeitraums in Tagen")
+    audit.add_argument("--verbose", action="store_true", help="Alle Statements samt SQL ausgeben")
+    audit.set_defaults(handler=audit_queries)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
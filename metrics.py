@@ -0,0 +1,261 @@
+"""
+Request- und SQL-Instrumentierung: Prometheus-Metriken, Server-Timing-Header und Slow-Query-Log.
+
+Die Middleware legt pro Request ein RequestStats-Objekt in einer ContextVar ab. Die SQLAlchemy-Events
+before/after_cursor_execute zählen und messen darüber jede Query dem Request zu, auch wenn sie im
+Threadpool (SyncRunner) oder im Greenlet von AsyncSession.run_sync läuft, da beide den Kontext kopieren.
+
+Zusätzlich wird pro Worker die Kaltstartzeit erfasst: Dauer der Startphasen und Zeit vom Prozessstart bis
+zur ersten beantworteten Anfrage (Gauges und eine Zeile im Logger "battle_stats.startup").
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from config import SLOW_QUERY_THRESHOLD_MS
+
+slow_query_log = logging.getLogger("battle_stats.slow_query")
+startup_log = logging.getLogger("battle_stats.startup")
+
+# Label für Queries außerhalb eines Requests bzw. für Pfade ohne passende Route
+NO_ROUTE = "-"
+
+# Bei executemany werden höchstens so viele Parametersätze ins Slow-Query-Log geschrieben
+MAX_LOGGED_PARAMETER_SETS = 5
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latenz der HTTP-Requests pro Route", ("method", "route", "status")
+)
+QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Dauer einzelner SQL-Queries pro Route", ("route",)
+)
+QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "Anzahl SQL-Queries pro Request", ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500, 1000)
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "Summierte Datenbankzeit pro Request", ("route",)
+)
+SLOW_QUERIES = Counter(
+    "db_slow_queries_total", "Anzahl Queries über SLOW_QUERY_THRESHOLD_MS", ("route",)
+)
+STARTUP_PHASE_SECONDS = Gauge(
+    "app_startup_phase_seconds", "Dauer der Startphasen dieses Workers (import, schema, warmup, ready)", ("phase",)
+)
+COLD_START_SECONDS = Gauge(
+    "app_cold_start_seconds", "Zeit vom Prozessstart bis zur ersten Antwort dieses Workers"
+)
+COALESCING_EXECUTIONS = Counter(
+    "statistics_executions_total", "Tatsächlich gestartete Statistik-Berechnungen (Cache-Prüfung und ggf. Abfrage)",
+    ("endpoint",)
+)
+COALESCED_REQUESTS = Counter(
+    "statistics_coalesced_total", "Anfragen, die eine laufende identische Berechnung mitgenutzt haben "
+    "(eingesparte Ausführungen)", ("endpoint",)
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight", "Laufende Anfragen pro Kostenklasse", ("cost_class",)
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queued", "Auf einen Platz wartende Anfragen pro Kostenklasse", ("cost_class",)
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Mit 503 abgewiesene Anfragen pro Kostenklasse und Grund "
+    "(queue_full, queue_timeout, statement_timeout)", ("cost_class", "reason")
+)
+LIVE_SUBSCRIBERS = Gauge(
+    "live_subscribers", "Offene Live-Streams (GET /live/{player_tag})"
+)
+LIVE_FEEDS = Gauge(
+    "live_feeds", "Spieler mit mindestens einem offenen Live-Stream"
+)
+LIVE_POLLS = Counter(
+    "live_polls_total", "Gemeinsame Datenbankabfragen des Live-Streams (eine pro Durchlauf für alle Spieler)"
+)
+LIVE_EVENTS = Counter(
+    "live_events_total", "Erzeugte Live-Ereignisse (einmal pro Spieler, unabhängig von der Zahl der Abonnenten)",
+    ("event",)
+)
+
+# Anfragen mit diesem Header stammen aus dem Warmup und zählen nicht als erste Anfrage
+WARMUP_HEADER = "x-warmup"
+
+
+def process_start_time() -> float:
+    """Startzeitpunkt des Prozesses (Unix-Zeit) aus /proc; ohne /proc der Zeitpunkt des ersten Imports."""
+    try:
+        with open("/proc/self/stat") as file:
+            # Feld 22 (starttime, in Clock-Ticks seit Systemstart); der Prozessname in Klammern kann Leerzeichen enthalten
+            started_ticks = int(file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return time.time()
+    return time.time() - uptime + started_ticks / os.sysconf("SC_CLK_TCK")
+
+
+class ColdStart:
+    """Startphasen und Zeit bis zur ersten Anfrage eines Workers."""
+
+    def __init__(self):
+        self.process_started = process_start_time()
+        self.phases = {}
+        self.first_request_seconds = None
+
+    def since_process_start(self) -> float:
+        return time.time() - self.process_started
+
+    def record(self, phase: str, seconds: float):
+        self.phases[phase] = seconds
+        STARTUP_PHASE_SECONDS.labels(phase).set(seconds)
+
+    @contextmanager
+    def measure(self, phase: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - started)
+
+    def ready(self):
+        """Startup abgeschlossen: Gesamtdauer seit Prozessstart festhalten und protokollieren."""
+        self.record("ready", self.since_process_start())
+        startup_log.info(json.dumps({"event": "startup", "pid": os.getpid(), **self._rounded(self.phases)}))
+
+    def request_finished(self):
+        """Beim Start der ersten Antwort (ohne Warmup-Anfragen) die Zeit seit Prozessstart festhalten."""
+        if self.first_request_seconds is not None:
+            return
+        self.first_request_seconds = self.since_process_start()
+        COLD_START_SECONDS.set(self.first_request_seconds)
+        startup_log.info(json.dumps({
+            "event": "first_request", "pid": os.getpid(), "cold_start_seconds": round(self.first_request_seconds, 3)
+        }))
+
+    @staticmethod
+    def _rounded(phases):
+        return {f"{phase}_seconds": round(seconds, 3) for phase, seconds in phases.items()}
+
+
+cold_start = ColdStart()
+
+
+class RequestStats:
+    """Query-Anzahl und Datenbankzeit des laufenden Requests."""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self):
+        # FastAPI legt die gematchte Route beim Routing im Scope ab
+        route = self.scope.get("route")
+        return getattr(route, "path", NO_ROUTE)
+
+    @property
+    def endpoint(self):
+        return f"{self.scope['method']} {self.route}"
+
+
+_current = ContextVar("request_stats", default=None)
+
+
+def _is_warmup(scope) -> bool:
+    return any(name == WARMUP_HEADER.encode() for name, _ in scope["headers"])
+
+
+class MetricsMiddleware:
+    """
+    Reine ASGI-Middleware (kein BaseHTTPMiddleware, damit Streaming-Antworten unverändert durchlaufen).
+    Misst die Latenz pro Route und setzt den Server-Timing-Header beim Start der Antwort.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                total_ms = (time.perf_counter() - started) * 1000
+                headers.append("Server-Timing", (
+                    f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+                    f"app;dur={total_ms:.1f}"
+                ))
+                if cold_start.first_request_seconds is None and not _is_warmup(scope):
+                    cold_start.request_finished()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = stats.route
+            REQUEST_LATENCY.labels(scope["method"], route, str(status)).observe(time.perf_counter() - started)
+            QUERIES_PER_REQUEST.labels(route).observe(stats.queries)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.db_seconds)
+            _current.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_started"].pop()
+    stats = _current.get()
+    route = stats.route if stats else NO_ROUTE
+    if stats:
+        stats.queries += 1
+        stats.db_seconds += duration
+    QUERY_LATENCY.labels(route).observe(duration)
+
+    if SLOW_QUERY_THRESHOLD_MS and duration * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        SLOW_QUERIES.labels(route).inc()
+        if executemany:
+            parameters = {"parameter_sets": len(parameters), "first": list(parameters[:MAX_LOGGED_PARAMETER_SETS])}
+        slow_query_log.warning(json.dumps({
+            "event": "slow_query",
+            "duration_ms": round(duration * 1000, 1),
+            "endpoint": stats.endpoint if stats else NO_ROUTE,
+            "statement": " ".join(statement.split()),
+            "parameters": parameters,
+        }, default=str))
+
+
+def _handle_error(exception_context):
+    # Bei einer fehlgeschlagenen Query feuert after_cursor_execute nicht; Startzeit trotzdem abräumen
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine):
+    """Registriert die Query-Events an einer (synchronen) Engine; für AsyncEngine deren sync_engine übergeben."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def render_metrics():
+    """Alle Metriken im Prometheus-Textformat als (Body, Content-Type)."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,8 +1,15 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, Index, LargeBinary
 from database import Base
 
 class BattleData(Base):
     __tablename__ = "battle_logs"
+    __table_args__ = (
+        # Sekundärindizes für die Zugriffsmuster der Statistik-Endpunkte (Zeitraum ohne Spieler, Gruppierungen)
+        Index("ix_battle_logs_battle_time", "battle_time"),
+        Index("ix_battle_logs_mode_time", "battle_mode", "battle_time"),
+        Index("ix_battle_logs_map_mode", "event_map", "battle_mode"),
+        Index("ix_battle_logs_brawler_time", "brawler_name", "battle_time"),
+    )
     
     player_tag = Column(String(50), primary_key=True)
     battle_time = Column(DateTime, primary_key=True)
@@ -23,3 +30,50 @@ class BattleData(Base):
     trophy_change = Column(Integer)
     rank = Column(Integer)
     is_star_player = Column(Boolean)
+
+
+class BattleDailyRollup(Base):
+    """
+    Vorverdichtete Tageswerte pro Spieler, Brawler, Modus und Map.
+    NULL-Werte in den Schlüsselspalten werden als leerer String gespeichert (Primärschlüssel erlaubt kein NULL).
+    """
+    __tablename__ = "battle_daily_rollup"
+    __table_args__ = (
+        # Zeiträume über alle Spieler (der Primärschlüssel beginnt mit player_tag)
+        Index("ix_battle_daily_rollup_day", "day"),
+    )
+
+    player_tag = Column(String(50), primary_key=True)
+    day = Column(Date, primary_key=True)
+    brawler_name = Column(String(50), primary_key=True)
+    battle_mode = Column(String(50), primary_key=True)
+    event_map = Column(String(100), primary_key=True)
+
+    battles = Column(Integer, nullable=False)
+    victories = Column(Integer, nullable=False)
+    trophy_change = Column(Integer, nullable=False)
+    duration_sum = Column(Integer, nullable=False)
+    duration_count = Column(Integer, nullable=False)
+    first_battle = Column(DateTime, nullable=False)
+    last_battle = Column(DateTime, nullable=False)
+
+
+class BattleDailyPlayers(Base):
+    """HyperLogLog-Sketch der Spieler eines Tages (Grundlage für approx=true, siehe sketches.py)."""
+    __tablename__ = "battle_daily_players"
+
+    day = Column(Date, primary_key=True)
+    players = Column(LargeBinary, nullable=False)
+
+
+class BattleDailyDurations(Base):
+    """
+    KLL-Sketch der Kampfdauer pro Tag, Modus und Map (Grundlage für approx=true, siehe sketches.py).
+    NULL-Werte in den Schlüsselspalten werden wie in der Rollup-Tabelle als leerer String gespeichert.
+    """
+    __tablename__ = "battle_daily_durations"
+
+    day = Column(Date, primary_key=True)
+    battle_mode = Column(String(50), primary_key=True)
+    event_map = Column(String(100), primary_key=True)
+    durations = Column(LargeBinary, nullable=False)
@@ -0,0 +1,151 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, exists, select
+
+from config import USE_ASYNC_DB
+from database import SessionLocal, AsyncSessionLocal, session_bind
+from models import BattleData
+from schemas import BattleDataBase
+from serialization import ndjson_lines
+
+# Standard- und Maximalgröße einer Seite im JSON-Modus
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+# Anzahl Zeilen, die im Streaming-Modus pro Fetch vom Server-Cursor gelesen werden
+STREAM_BATCH_SIZE = 1000
+
+# Zusammengesetzter Schlüssel, über den paginiert wird (entspricht dem Primärschlüssel)
+KEY_COLUMNS = (BattleData.player_tag, BattleData.battle_time, BattleData.brawler_id)
+
+# Ausgelesene Spalten in der Reihenfolge der Felder von BattleDataBase
+ROW_COLUMNS = tuple(getattr(BattleData, name) for name in BattleDataBase.model_fields)
+
+
+def parse_fields(fields: str = None):
+    """
+    Zerlegt den fields-Parameter (kommagetrennt) in eine Liste von Feldnamen aus BattleDataBase.
+    Ohne Angabe wird None geliefert (alle Felder); unbekannte Felder führen zu 400.
+    """
+    if not fields:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in BattleDataBase.model_fields]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unbekannte Felder: {', '.join(unknown)}. Erlaubt: {', '.join(BattleDataBase.model_fields)}."
+        )
+    return names or None
+
+
+def select_columns(fields=None):
+    """
+    Spalten der SELECT-Liste: die angeforderten Felder zuerst, danach die für den Cursor nötigen
+    Schlüsselspalten, falls sie nicht angefordert wurden (row_dicts schneidet sie anhand der Feldliste ab).
+    """
+    if not fields:
+        return ROW_COLUMNS
+    names = [*fields, *(column.key for column in KEY_COLUMNS if column.key not in fields)]
+    return tuple(getattr(BattleData, name) for name in names)
+
+
+def encode_cursor(entry) -> str:
+    """Kodiert den Schlüssel des letzten Eintrags einer Seite als opaken Cursor."""
+    key = [entry.player_tag, entry.battle_time.isoformat(), entry.brawler_id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Dekodiert einen Cursor zurück in (player_tag, battle_time, brawler_id)."""
+    try:
+        player_tag, battle_time, brawler_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(player_tag), datetime.fromisoformat(battle_time), int(brawler_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Ungültiger Cursor.")
+
+
+def keyset_filter(cursor: str):
+    """
+    Liefert die Bedingung "Schlüssel > Cursor" für die Keyset-Pagination.
+    Bewusst als ausgeschriebene OR-Kette statt Tupelvergleich, damit MySQL den Primärschlüssel-Index nutzt.
+    """
+    player_tag, battle_time, brawler_id = decode_cursor(cursor)
+    return or_(
+        BattleData.player_tag > player_tag,
+        and_(BattleData.player_tag == player_tag, BattleData.battle_time > battle_time),
+        and_(
+            BattleData.player_tag == player_tag,
+            BattleData.battle_time == battle_time,
+            BattleData.brawler_id > brawler_id
+        )
+    )
+
+
+def paginated_query(query, cursor, limit):
+    """Sortiert die Query nach dem Schlüssel und schränkt sie auf die Seite nach dem Cursor ein."""
+    if cursor:
+        query = query.filter(keyset_filter(cursor))
+    query = query.order_by(*KEY_COLUMNS)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+def read_page(db, filters, cursor, limit, fields=None):
+    """Liest eine Seite BattleData-Einträge nach dem Cursor als Row-Tupel (ohne ORM-Objekte)."""
+    return db.execute(paginated_query(select(*select_columns(fields)).where(*filters), cursor, limit)).all()
+
+
+def read_entry(db, player_tag, battle_time, brawler_id, fields=None):
+    """Liest einen einzelnen Eintrag über den Primärschlüssel als Row-Tupel (oder None)."""
+    return db.execute(select(*select_columns(fields)).where(
+        BattleData.player_tag == player_tag,
+        BattleData.battle_time == battle_time,
+        BattleData.brawler_id == brawler_id
+    )).first()
+
+
+def has_entries(db, filters):
+    """Prüft, ob mindestens ein Eintrag zu den Filtern existiert."""
+    return db.query(exists().where(*filters)).scalar()
+
+
+def stream_ndjson(filters, cursor=None, limit=None, fields=None):
+    """
+    Streamt BattleData-Einträge als NDJSON (eine JSON-Zeile pro Eintrag).
+    Nutzt eine eigene Session (auf einem Lese-Replika, falls konfiguriert) mit serverseitigem Cursor und
+    Partitionen, damit der Speicherverbrauch unabhängig von der Tabellengröße konstant bleibt.
+    """
+    with session_bind(read_only=True) as bind:
+        db = SessionLocal(bind=bind)
+        try:
+            statement = paginated_query(select(*select_columns(fields)).where(*filters), cursor, limit)
+            result = db.execute(statement.execution_options(stream_results=True))
+            for partition in result.partitions(STREAM_BATCH_SIZE):
+                yield ndjson_lines(partition, fields)
+        finally:
+            db.close()
+
+
+async def stream_ndjson_async(filters, cursor=None, limit=None, fields=None):
+    """Wie stream_ndjson, aber über eine AsyncSession mit serverseitigem Cursor (AsyncSession.stream)."""
+    with session_bind(read_only=True, asynchronous=True) as bind:
+        async with AsyncSessionLocal(bind=bind) as session:
+            statement = paginated_query(select(*select_columns(fields)).where(*filters), cursor, limit)
+            result = await session.stream(statement)
+            async for partition in result.partitions(STREAM_BATCH_SIZE):
+                yield ndjson_lines(partition, fields)
+
+
+def ndjson_stream(filters, cursor=None, limit=None, fields=None):
+    """Wählt den Streaming-Pfad passend zum konfigurierten Datenbankzugriff."""
+    if cursor:
+        # Cursor vor Beginn des Streams prüfen, damit ein ungültiger Cursor noch als 400 gemeldet werden kann
+        filters, cursor = [*filters, keyset_filter(cursor)], None
+    if USE_ASYNC_DB:
+        return stream_ndjson_async(filters, cursor, limit, fields)
+    return stream_ndjson(filters, cursor, limit, fields)
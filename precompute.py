@@ -0,0 +1,245 @@
+"""
+Hintergrund-Neuberechnung der meistangefragten spielerbezogenen Statistiken (stale-while-revalidate).
+
+cached_statistics meldet jeden spielerbezogenen Aufruf an den Scheduler (Endpunkt, player_tag, Zeitraum und
+Optionen als Schlüssel). Die Anfragezähler verfallen exponentiell (Halbwertszeit HALF_LIFE_SECONDS); die bis
+zu PRECOMPUTE_MAX_KEYS Schlüssel mit mindestens PRECOMPUTE_MIN_REQUESTS gelten als heiß.
+
+Alle PRECOMPUTE_INTERVAL_SECONDS prüft der Scheduler mit einer Abfrage die Watermarks (max(battle_time),
+Anzahl Battles) der heißen Spieler und stellt Schlüssel in die begrenzte Warteschlange, deren Cache-Eintrag
+fehlt, ein älteres Watermark hat oder bald abläuft. PRECOMPUTE_WORKERS asyncio-Tasks berechnen sie im
+Threadpool neu und legen das Ergebnis in den Ergebnis-Cache. Bis dahin liefern Anfragen den bisherigen Wert aus
+(höchstens CACHE_STALE_SECONDS über die TTL hinaus); ist die Warteschlange voll, wird der Auftrag verworfen und
+beim nächsten Durchlauf erneut eingeplant.
+
+Jede Neuberechnung belegt einen Platz der Kostenklasse heavy (admission.py) und läuft mit deren
+Statement-Timeout. Ist dort kein Platz frei, wird sie zurückgestellt statt sich vor Anfragen in die
+Warteschlange zu stellen; der nächste Durchlauf plant den Schlüssel erneut ein.
+"""
+import asyncio
+import heapq
+import logging
+import threading
+from dataclasses import dataclass, field
+
+from sqlalchemy import func, select
+from starlette.concurrency import run_in_threadpool
+
+import admission
+import cache
+from cache import result_cache, watermark
+from config import (
+    PRECOMPUTE_INTERVAL_SECONDS, PRECOMPUTE_MAX_KEYS, PRECOMPUTE_MIN_REQUESTS, PRECOMPUTE_QUEUE_SIZE,
+    PRECOMPUTE_WORKERS, cache_ttl
+)
+from database import SessionLocal, session_bind
+from models import BattleData
+
+logger = logging.getLogger("battle_stats.precompute")
+
+# Nach dieser Zeit zählt eine Anfrage nur noch halb
+HALF_LIFE_SECONDS = 600
+
+# Höchstens so viele Schlüssel werden gezählt (die seltensten fliegen bei Überschreitung raus)
+TRACKED_KEYS_FACTOR = 4
+
+# Kostenklasse der Neuberechnungen (admission.py)
+REFRESH_COST = "heavy"
+
+
+@dataclass
+class Job:
+    """Alles, was für eine Neuberechnung nötig ist (wie der Aufruf von cached_statistics)."""
+    endpoint: str
+    compute: object
+    player_tag: str
+    start_date: object
+    end_date: object
+    options: dict = field(default_factory=dict)
+    score: float = 0.0
+
+
+class Scheduler:
+    """Zählt Anfragen pro Schlüssel und berechnet die heißen Schlüssel im Hintergrund neu."""
+
+    def __init__(self, max_keys=PRECOMPUTE_MAX_KEYS, min_requests=PRECOMPUTE_MIN_REQUESTS,
+                 interval=PRECOMPUTE_INTERVAL_SECONDS, queue_size=PRECOMPUTE_QUEUE_SIZE, workers=PRECOMPUTE_WORKERS):
+        self.max_keys = max_keys
+        self.min_requests = min_requests
+        self.interval = interval
+        self.queue_size = queue_size
+        self.workers = workers
+        self._jobs = {}  # key -> Job
+        self._hot = frozenset()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._queue = None
+        self._pending = set()
+        self._tasks = []
+        self.refreshed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.deferred = 0
+
+    # --- Aufrufe aus cached_statistics (Threadpool oder Event-Loop) ----------------
+
+    def track(self, key, endpoint, compute, player_tag, start_date, end_date, options) -> bool:
+        """Zählt die Anfrage; liefert True, wenn der Schlüssel heiß ist. Batch- und globale Anfragen zählen nicht."""
+        if not isinstance(player_tag, str):
+            return False
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                job = self._jobs[key] = Job(endpoint, compute, player_tag, start_date, end_date, dict(options))
+            job.score += 1
+        return key in self._hot
+
+    def enqueue(self, key):
+        """Plant die Neuberechnung eines Schlüssels ein (thread-sicher, doppelte Aufträge werden zusammengefasst)."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._put, key)
+
+    # --- Event-Loop ------------------------------------------------------------------
+
+    def _put(self, key):
+        if key in self._pending:
+            return
+        try:
+            self._queue.put_nowait(key)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return
+        self._pending.add(key)
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._tick_loop())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        cache.revalidator = self
+
+    async def stop(self):
+        cache.revalidator = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    async def _tick_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("Prüfung der heißen Schlüssel fehlgeschlagen")
+
+    async def tick(self):
+        """Zähler verfallen lassen, heiße Schlüssel bestimmen und veraltete einplanen."""
+        self._hot = self._select_hot()
+        if not self._hot:
+            return
+        with self._lock:
+            jobs = {key: self._jobs[key] for key in self._hot if key in self._jobs}
+        watermarks = await run_in_threadpool(_watermarks, {job.player_tag for job in jobs.values()})
+        for key, job in jobs.items():
+            entry = result_cache.peek(key)
+            # Fehlt der Eintrag, ist er überholt oder läuft er vor dem nächsten Durchlauf ab: neu berechnen
+            if entry is None or entry[0] != watermarks.get(job.player_tag) or entry[1] <= self.interval:
+                self._put(key)
+
+    def _select_hot(self):
+        decay = 0.5 ** (self.interval / HALF_LIFE_SECONDS)
+        with self._lock:
+            for job in self._jobs.values():
+                job.score *= decay
+            candidates = [(job.score, key) for key, job in self._jobs.items() if job.score >= self.min_requests]
+            hot = heapq.nlargest(self.max_keys, candidates, key=lambda candidate: candidate[0])
+            limit = self.max_keys * TRACKED_KEYS_FACTOR
+            if len(self._jobs) > limit:
+                keep = heapq.nlargest(limit, self._jobs.items(), key=lambda item: item[1].score)
+                self._jobs = dict(keep)
+        return frozenset(key for _, key in hot)
+
+    async def _worker(self):
+        while True:
+            key = await self._queue.get()
+            try:
+                with self._lock:
+                    job = self._jobs.get(key)
+                if job is None:
+                    continue
+                if not admission.has_capacity(REFRESH_COST):
+                    # Anfragen haben Vorrang; der nächste Durchlauf plant den Schlüssel erneut ein
+                    self.deferred += 1
+                    continue
+                async with admission.admitted(REFRESH_COST):
+                    await run_in_threadpool(_refresh, key, job)
+                self.refreshed += 1
+            except Exception as error:
+                # z. B. HTTPException 404, wenn der Zeitraum keine Battles mehr enthält, oder 503 nach dem
+                # Statement-Timeout; der veraltete Wert läuft dann regulär aus, die nächste Anfrage rechnet selbst
+                self.failed += 1
+                logger.debug("Neuberechnung von %s fehlgeschlagen: %r", key, error)
+            finally:
+                self._pending.discard(key)
+                self._queue.task_done()
+
+    def statistics(self):
+        with self._lock:
+            tracked = len(self._jobs)
+        return {
+            "tracked_keys": tracked,
+            "hot_keys": len(self._hot),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "deferred": self.deferred,
+        }
+
+
+def _watermarks(player_tags):
+    """Watermark (max(battle_time), Anzahl Battles) pro Spieler in einer Abfrage über den Primärschlüssel."""
+    with session_bind(read_only=True) as bind:
+        db = SessionLocal(bind=bind)
+        try:
+            rows = db.execute(
+                select(BattleData.player_tag, func.max(BattleData.battle_time), func.count())
+                .where(BattleData.player_tag.in_(sorted(player_tags)))
+                .group_by(BattleData.player_tag)
+            )
+            return {player_tag: (latest, count) for player_tag, latest, count in rows}
+        finally:
+            db.close()
+
+
+def _refresh(key, job):
+    """Berechnet einen Schlüssel mit eigener Session neu und legt ihn mit aktuellem Watermark in den Cache."""
+    with session_bind(read_only=True) as bind:
+        db = SessionLocal(bind=bind)
+        try:
+            current = watermark(db, job.player_tag)
+            value = job.compute(db, job.player_tag, job.start_date, job.end_date, **job.options)
+        finally:
+            db.close()
+    result_cache.set(key, value, current, cache_ttl(job.endpoint))
+
+
+# Der laufende Scheduler des Workers (wird im Lifespan gestartet)
+scheduler = None
+
+
+def start():
+    global scheduler
+    scheduler = Scheduler()
+    scheduler.start()
+    return scheduler
+
+
+async def stop():
+    global scheduler
+    if scheduler is not None:
+        await scheduler.stop()
+        scheduler = None
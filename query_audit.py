@@ -0,0 +1,125 @@
+"""
+Audit der Query-Pläne aller lesenden Endpunkte.
+
+Die Endpunkt-Funktionen werden mit repräsentativen Parametern ausgeführt, die dabei abgesetzten
+SELECT-Statements über before_cursor_execute mitgeschnitten und anschließend per EXPLAIN
+(MySQL) bzw. EXPLAIN QUERY PLAN (SQLite) untersucht. Gemeldet werden Full Table Scans und
+vollständige Index-Scans.
+"""
+from contextlib import contextmanager
+from datetime import timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import event, func
+
+import leaderboard
+import stats
+from aggregation import build_filters
+from cache import watermark
+from database import Base
+from models import BattleData
+from pagination import DEFAULT_PAGE_SIZE, read_page
+
+# Endpunkt -> Funktion(db, player_tag, start_date, end_date)
+ENDPOINTS = {
+    "/battle-statistics": stats.battle_statistics,
+    "/trophy-progress": stats.trophy_progress,
+    "/brawler-statistics": stats.brawler_statistics,
+    "/gamemode-statistics": stats.gamemode_statistics,
+    "/map-statistics": stats.map_statistics,
+    "/player-dashboard": stats.player_dashboard,
+    "/battle-statistics?approx=true": lambda db, *args: stats.battle_statistics(db, *args, approx=True),
+    "/map-statistics?approx=true": lambda db, *args: stats.map_statistics(db, *args, approx=True),
+    "/leaderboard": leaderboard.leaderboard,
+    "/battle-data": lambda db, player_tag, start_date, end_date: read_page(
+        db, build_filters(player_tag, start_date, end_date), None, DEFAULT_PAGE_SIZE
+    ),
+    "(Cache-Watermark)": lambda db, player_tag, start_date, end_date: watermark(db, player_tag),
+}
+
+
+def scenarios(db, days=30):
+    """
+    Repräsentative Parameterkombinationen aus den vorhandenen Daten: ein Spieler, die letzten `days` Tage
+    (mit angebrochenen Randtagen) und beides zusammen. Ohne Filter ist ein vollständiger Scan unvermeidbar
+    und wird deshalb nur informativ gemeldet.
+    """
+    player_tag, latest = db.query(BattleData.player_tag, func.max(BattleData.battle_time)).group_by(
+        BattleData.player_tag
+    ).order_by(func.count().desc()).first() or (None, None)
+    if latest is None:
+        return []
+    end_date = latest - timedelta(hours=1)
+    start_date = end_date - timedelta(days=days)
+    return [
+        ("Spieler", dict(player_tag=player_tag)),
+        ("Zeitraum", dict(start_date=start_date, end_date=end_date)),
+        ("Spieler + Zeitraum", dict(player_tag=player_tag, start_date=start_date, end_date=end_date)),
+        ("ohne Filter", dict()),
+    ]
+
+
+@contextmanager
+def capture_statements(engine):
+    """Schneidet alle SELECT-Statements (mit DBAPI-Parametern) mit, die über die Engine laufen."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def full_scans(connection, statement, parameters):
+    """Liefert die Planzeilen eines Statements, die eine Tabelle bzw. einen Index vollständig lesen."""
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        plan = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+        # "SCAN battle_logs" = Full Table Scan, "SCAN ... USING [COVERING] INDEX" = vollständiger Index-Scan;
+        # Scans über abgeleitete Tabellen (UNION-Subqueries, anon_1) lesen nur Zwischenergebnisse
+        return [
+            row.detail for row in plan
+            if row.detail.startswith("SCAN ") and row.detail.split()[1] in Base.metadata.tables
+        ]
+    if dialect == "mysql":
+        plan = connection.exec_driver_sql("EXPLAIN " + statement, parameters).mappings().all()
+        return [
+            f"{row['table']}: type={row['type']}, key={row['key']}, rows={row['rows']}" for row in plan
+            if row["type"] in ("ALL", "index") and row["table"] in Base.metadata.tables
+        ]
+    raise ValueError(f"Query-Audit wird für {dialect} nicht unterstützt.")
+
+
+def audit(session_factory, days=30):
+    """
+    Führt alle Endpunkte mit allen Szenarien aus und liefert pro (Endpunkt, Szenario) die
+    gefundenen Full Scans als Liste von Dicts.
+    """
+    report = []
+    db = session_factory()
+    try:
+        engine = db.get_bind()
+        for scenario, params in scenarios(db, days):
+            for endpoint, function in ENDPOINTS.items():
+                with capture_statements(engine) as statements:
+                    try:
+                        function(db, params.get("player_tag"), params.get("start_date"), params.get("end_date"))
+                    except HTTPException:
+                        pass  # 404 bei leerem Ergebnis; die Queries wurden trotzdem abgesetzt
+                with engine.connect() as connection:
+                    for statement, parameters in statements:
+                        report.append({
+                            "endpoint": endpoint,
+                            "scenario": scenario,
+                            "statement": " ".join(statement.split()),
+                            "full_scans": full_scans(connection, statement, parameters),
+                            "expected": not params,
+                        })
+    finally:
+        db.close()
+    return report
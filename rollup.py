@@ -0,0 +1,86 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from itertools import chain
+
+from sqlalchemy import event, func, inspect, insert, delete, select
+
+from aggregation import raw_measures
+from models import BattleData, BattleDailyRollup
+
+# Schlüsselspalten der Rollup-Tabelle; NULL wird als leerer String abgelegt
+ROLLUP_KEYS = (
+    BattleData.player_tag,
+    func.date(BattleData.battle_time),
+    func.coalesce(BattleData.brawler_name, ''),
+    func.coalesce(BattleData.battle_mode, ''),
+    func.coalesce(BattleData.event_map, '')
+)
+
+ROLLUP_COLUMNS = [
+    "player_tag", "day", "brawler_name", "battle_mode", "event_map",
+    "battles", "victories", "trophy_change", "duration_sum", "duration_count", "first_battle", "last_battle"
+]
+
+
+def _aggregate(filters):
+    """SELECT, das battle_logs auf die Granularität der Rollup-Tabelle verdichtet."""
+    return select(*ROLLUP_KEYS, *raw_measures()).where(*filters).group_by(*ROLLUP_KEYS)
+
+
+def refresh_slices(connection, slices):
+    """
+    Berechnet die Rollup-Einträge für die betroffenen (player_tag, day)-Paare neu.
+    Pro Spieler wird der Tagesbereich zwischen dem ersten und letzten betroffenen Tag gelöscht
+    und aus battle_logs neu verdichtet; dadurch sind Inserts, Updates und Deletes gleichermaßen abgedeckt.
+    """
+    days_by_player = defaultdict(list)
+    for player_tag, day in slices:
+        days_by_player[player_tag].append(day)
+
+    for player_tag, days in days_by_player.items():
+        first_day, last_day = min(days), max(days)
+        connection.execute(delete(BattleDailyRollup).where(
+            BattleDailyRollup.player_tag == player_tag,
+            BattleDailyRollup.day >= first_day,
+            BattleDailyRollup.day <= last_day
+        ))
+        connection.execute(insert(BattleDailyRollup).from_select(ROLLUP_COLUMNS, _aggregate([
+            BattleData.player_tag == player_tag,
+            BattleData.battle_time >= datetime.combine(first_day, time.min),
+            BattleData.battle_time < datetime.combine(last_day + timedelta(days=1), time.min)
+        ])))
+
+
+def rebuild(connection, player_tag=None):
+    """Baut die Rollup-Tabelle (optional nur für einen Spieler) vollständig aus battle_logs neu auf."""
+    if player_tag:
+        connection.execute(delete(BattleDailyRollup).where(BattleDailyRollup.player_tag == player_tag))
+        filters = [BattleData.player_tag == player_tag]
+    else:
+        connection.execute(delete(BattleDailyRollup))
+        filters = []
+    return connection.execute(insert(BattleDailyRollup).from_select(ROLLUP_COLUMNS, _aggregate(filters))).rowcount
+
+
+def _touched_slices(session):
+    """Sammelt die (player_tag, day)-Paare aller geänderten BattleData-Objekte eines Flushs."""
+    slices = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, BattleData):
+            continue
+        history = inspect(obj).attrs.battle_time.history
+        for battle_time in chain(history.unchanged or (), history.added or (), history.deleted or ()):
+            slices.add((obj.player_tag, battle_time.date()))
+    return slices
+
+
+def _refresh_after_flush(session, flush_context):
+    slices = _touched_slices(session)
+    if slices:
+        refresh_slices(session.connection(), slices)
+
+
+def enable_incremental_refresh(session_factory):
+    """Inkrementelle Pflege: jeder Flush mit geänderten Battles aktualisiert die betroffenen Tage."""
+    if not event.contains(session_factory, "after_flush", _refresh_after_flush):
+        event.listen(session_factory, "after_flush", _refresh_after_flush)
@@ -1,6 +1,8 @@
 from datetime import datetime
 from typing import Optional, List
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from config import BATCH_MAX_PLAYERS
 
 # Gemeinsame Felder in allen Schemas
 class BattleDataBase(BaseModel):
@@ -48,6 +50,7 @@ class BattleStatistics(BaseModel):
 class DailyTrophyProgress(BaseModel):
     date: datetime
     trophy_change: int
+    cumulative_trophy_change: int
     total_battles: int
     victory_count: int
     win_rate: float
@@ -59,6 +62,7 @@ class TrophyProgressResponse(BaseModel):
     player_tag: Optional[str] = None
     start_date: datetime
     end_date: datetime
+    bucket: str = "day"
     daily_progress: List[DailyTrophyProgress]
     total_trophy_change: int
     total_battles: int
@@ -98,6 +102,11 @@ class GameModeStats(BaseModel):
     avg_trophies_per_battle: float
     seconds_per_trophy: Optional[float] = None
     win_rate: float
+    # Perzentile der Kampfdauer in Sekunden, nur mit approx=true (KLL-Sketch); sonst nicht in der Antwort
+    # (die Routen serialisieren mit response_model_exclude_unset)
+    duration_p50: Optional[int] = None
+    duration_p90: Optional[int] = None
+    duration_p99: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -136,6 +145,11 @@ class MapStats(BaseModel):
     win_rate: float
     most_played_brawler: BestBrawler
     most_trophy_brawler: BestBrawler
+    # Perzentile der Kampfdauer in Sekunden, nur mit approx=true (KLL-Sketch); sonst nicht in der Antwort
+    # (die Routen serialisieren mit response_model_exclude_unset)
+    duration_p50: Optional[int] = None
+    duration_p90: Optional[int] = None
+    duration_p99: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -151,3 +165,89 @@ class MapStatsResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+class BatchStatisticsRequest(BaseModel):
+    player_tags: List[str] = Field(min_length=1, max_length=BATCH_MAX_PLAYERS)
+    start_date: Optional[datetime] = None  # Format: YYYY-MM-DDTHH:MM:SS
+    end_date: Optional[datetime] = None
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    key: str  # Wert der Dimension, z. B. player_tag oder brawler_name
+    value: float  # Wert der gerankten Metrik
+    battles: int
+    victories: int
+    trophy_change: int
+    win_rate: float
+    avg_trophies_per_battle: float
+    avg_duration: Optional[float] = None  # in Sekunden
+    seconds_per_trophy: Optional[float] = None
+
+    class Config:
+        from_attributes = True
+
+class LeaderboardResponse(BaseModel):
+    metric: str
+    dimension: str
+    order: str
+    min_battles: int
+    player_tag: Optional[str] = None
+    battle_mode: Optional[str] = None
+    event_map: Optional[str] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    entries: List[LeaderboardEntry]
+
+    class Config:
+        from_attributes = True
+
+class PlayerDashboardResponse(BaseModel):
+    player_tag: Optional[str] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    battle_statistics: BattleStatistics
+    trophy_progress: TrophyProgressResponse
+    brawler_statistics: BrawlerStatsResponse
+    gamemode_statistics: GameModeStatsResponse
+    map_statistics: Optional[MapStatsResponse] = None  # None, wenn keine Battles mit Map-Namen vorliegen
+
+    class Config:
+        from_attributes = True
+
+class PrecomputeStatistics(BaseModel):
+    tracked_keys: int
+    hot_keys: int
+    queued: int
+    queue_size: int
+    refreshed: int
+    failed: int
+    dropped: int  # bei voller Warteschlange verworfene Aufträge
+    deferred: int  # mangels freiem Platz der Kostenklasse heavy zurückgestellte Aufträge
+
+class CacheStatistics(BaseModel):
+    entries: int
+    size_bytes: int
+    max_entries: int
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    invalidations: int
+    stale_hits: int  # veraltete Werte, die während der Neuberechnung ausgeliefert wurden
+    hit_rate: float
+    precompute: Optional[PrecomputeStatistics] = None  # nur mit PRECOMPUTE_ENABLED
+
+class BulkIngestError(BaseModel):
+    index: int  # Position des Datensatzes im Request (0-basiert)
+    detail: str
+
+class BulkIngestResult(BaseModel):
+    received: int
+    inserted: int
+    updated: int
+    rejected: int
+    batches: int
+    elapsed_seconds: float
+    rows_per_second: float
+    errors: List[BulkIngestError]
@@ -0,0 +1,52 @@
+"""
+Schneller Serialisierungspfad für große Listenantworten.
+
+Die battle-data-Endpunkte lesen schlanke Row-Tupel statt ORM-Objekten und kodieren sie direkt mit orjson,
+ohne jede Zeile einzeln über BattleDataRead zu validieren (die Werte kommen typisiert aus der Datenbank).
+Ohne orjson wird auf das json-Modul der Standardbibliothek zurückgefallen.
+"""
+import json
+from datetime import date, datetime
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson ist optional, beschleunigt aber das Kodieren deutlich
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} ist nicht JSON-serialisierbar")
+
+
+def dumps(content) -> bytes:
+    """Kodiert Dicts/Listen mit datetime-Werten im selben Format wie pydantic (ISO 8601)."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def row_dicts(rows, fields=None):
+    """
+    Row-Tupel -> Dicts mit den Spaltennamen als Schlüssel. Mit `fields` werden nur diese (am Anfang der
+    SELECT-Liste stehenden) Spalten übernommen; zusätzlich gelesene Schlüsselspalten fallen weg.
+    """
+    if not rows:
+        return []
+    names = fields or rows[0]._fields
+    return [dict(zip(names, row)) for row in rows]
+
+
+def ndjson_lines(rows, fields=None) -> bytes:
+    """Ein Block NDJSON-Zeilen (eine Zeile pro Row)."""
+    return b"".join(dumps(row) + b"\n" for row in row_dicts(rows, fields))
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse, die Inhalte ohne jsonable_encoder direkt mit orjson kodiert."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
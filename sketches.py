@@ -0,0 +1,408 @@
+"""
+Approximative Statistiken (approx=true) aus mergebaren Sketches, die pro Tag gespeichert werden.
+
+- unique_players: HyperLogLog mit 2^12 Registern pro Tag (battle_daily_players). Standardfehler
+  1,04 / sqrt(4096) ≈ 1,6 %; bei kleinen Mengen greift Linear Counting und das Ergebnis ist nahezu exakt.
+- Perzentile der Kampfdauer: KLL-Sketch (k=200) pro Tag, Modus und Map (battle_daily_durations).
+  Normalisierter Rang-Fehler ca. ±1,7 % (99 % Konfidenz); solange ein Sketch nicht komprimiert werden
+  musste (bis ca. k Werte), sind die Perzentile exakt.
+
+Beliebige Zeiträume entstehen durch Mergen der Tages-Sketches (verlustfrei für HLL, innerhalb der
+Fehlerschranke für KLL); nur angebrochene Randtage werden aus battle_logs gebildet. Ohne Sketches
+(USE_SKETCHES=false), für spielerbezogene Anfragen, für Zeiträume ohne ganzen Tag und für archivierte Monate
+rechnen die Endpunkte exakt über Datenbank und Archiv (COUNT(DISTINCT) bzw. exact_duration_percentiles), statt
+Rohdaten nach Python zu lesen.
+"""
+import hashlib
+import json
+import math
+import random
+import zlib
+from datetime import datetime, time, timedelta
+from itertools import chain
+
+from sqlalchemy import case, delete, event, func, inspect, insert, select
+
+import archive
+from aggregation import build_filters, full_days, split_range
+from config import USE_SKETCHES
+from models import BattleData, BattleDailyDurations, BattleDailyPlayers
+
+HLL_PRECISION = 12
+KLL_K = 200
+
+# Ausgelieferte Perzentile der Kampfdauer (Rang 0..1) und ihre Felder in der Antwort
+PERCENTILES = {0.5: "duration_p50", 0.9: "duration_p90", 0.99: "duration_p99"}
+
+# Gelesene Rohdaten-Spalten und Blockgröße beim Streamen aus battle_logs
+RAW_COLUMNS = (
+    BattleData.battle_time, BattleData.battle_mode, BattleData.event_map, BattleData.player_tag,
+    BattleData.battle_duration
+)
+RAW_BATCH_SIZE = 50000
+
+
+class HyperLogLog:
+    """HyperLogLog über einen 64-Bit-Hash (BLAKE2b) mit einem Byte pro Register."""
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers or 1 << HLL_PRECISION)
+
+    def add(self, value: str):
+        hashed = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        index = hashed >> (64 - HLL_PRECISION)
+        remainder = hashed & ((1 << (64 - HLL_PRECISION)) - 1)
+        rank = (64 - HLL_PRECISION) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))  # Linear Counting für kleine Mengen
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls(zlib.decompress(data))
+
+
+class KLLSketch:
+    """
+    KLL-Quantil-Sketch: Level h hält Werte mit Gewicht 2^h. Ist der Sketch voll, wird das unterste volle
+    Level sortiert und jeder zweite Wert (zufälliger Offset) mit doppeltem Gewicht eine Ebene höher geschoben.
+    """
+
+    def __init__(self, k: int = KLL_K, levels=None):
+        self.k = k
+        self.levels = levels or [[]]
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(math.ceil(self.k * (2 / 3) ** depth), 2)
+
+    def _is_full(self):
+        return sum(map(len, self.levels)) >= sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def _compress(self):
+        while self._is_full():
+            for level, items in enumerate(self.levels):
+                if len(items) < self._capacity(level):
+                    continue
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items.sort()
+                # Bei ungerader Anzahl bleibt der größte Wert auf seinem Level
+                keep = [items.pop()] if len(items) % 2 else []
+                self.levels[level + 1].extend(items[random.getrandbits(1)::2])
+                self.levels[level] = keep
+                break
+
+    def add(self, value):
+        self.levels[0].append(value)
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append([])
+            self.levels[level].extend(items)
+        self._compress()
+
+    def quantiles(self, fractions):
+        """Werte zu den Rängen `fractions` (0..1) in einem Durchlauf über die gewichteten Werte."""
+        weighted = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+        total = sum(weight for _, weight in weighted)
+        results, cumulative, position = [], 0, 0
+        for fraction in sorted(fractions):
+            while position < len(weighted) - 1 and cumulative + weighted[position][1] < fraction * total:
+                cumulative += weighted[position][1]
+                position += 1
+            results.append(weighted[position][0] if weighted else None)
+        return dict(zip(sorted(fractions), results))
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(json.dumps({"k": self.k, "levels": self.levels}, separators=(",", ":")).encode())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "KLLSketch":
+        content = json.loads(zlib.decompress(data))
+        return cls(content["k"], content["levels"])
+
+
+def duration_percentiles(sketch):
+    """p50/p90/p99 der Kampfdauer in Sekunden (None ohne bekannte Dauer)."""
+    if sketch is None:
+        return {name: None for name in PERCENTILES.values()}
+    values = sketch.quantiles(PERCENTILES)
+    return {name: values[fraction] for fraction, name in PERCENTILES.items()}
+
+
+# --- Pflege der Tages-Sketches ---------------------------------------------------
+
+def _raw_rows(connection, filters):
+    """Streamt die für die Sketches nötigen Spalten aus battle_logs in Blöcken."""
+    result = connection.execution_options(stream_results=True).execute(select(*RAW_COLUMNS).where(*filters))
+    return chain.from_iterable(result.partitions(RAW_BATCH_SIZE))
+
+
+def _accumulate(rows, players, durations):
+    """Trägt Battles (Tupel bzw. Objekte mit den RAW_COLUMNS) in die Sketches pro Tag bzw. Tag/Modus/Map ein."""
+    for battle_time, battle_mode, event_map, player_tag, battle_duration in rows:
+        day = battle_time.date()
+        players.setdefault(day, HyperLogLog()).add(player_tag)
+        if battle_duration is not None:
+            durations.setdefault((day, battle_mode or '', event_map or ''), KLLSketch()).add(battle_duration)
+
+
+def _store(connection, days, players, durations):
+    """Ersetzt die Sketches der angegebenen Tage."""
+    connection.execute(delete(BattleDailyPlayers).where(BattleDailyPlayers.day.in_(days)))
+    connection.execute(delete(BattleDailyDurations).where(BattleDailyDurations.day.in_(days)))
+    if players:
+        connection.execute(insert(BattleDailyPlayers), [
+            {"day": day, "players": sketch.to_bytes()} for day, sketch in players.items()
+        ])
+    if durations:
+        connection.execute(insert(BattleDailyDurations), [
+            {"day": day, "battle_mode": battle_mode, "event_map": event_map, "durations": sketch.to_bytes()}
+            for (day, battle_mode, event_map), sketch in durations.items()
+        ])
+
+
+def refresh_days(connection, days):
+    """Baut die Sketches der angegebenen Tage aus battle_logs neu auf (nach Updates und Deletes nötig)."""
+    days = sorted(set(days))
+    players, durations = {}, {}
+    for day in days:
+        _accumulate(_raw_rows(connection, [
+            BattleData.battle_time >= datetime.combine(day, time.min),
+            BattleData.battle_time < datetime.combine(day + timedelta(days=1), time.min)
+        ]), players, durations)
+    _store(connection, days, players, durations)
+
+
+def add_battles(connection, battles):
+    """
+    Trägt neu eingefügte Battles inkrementell in die bestehenden Tages-Sketches ein. Die betroffenen
+    Sketch-Zeilen werden dabei gesperrt (SELECT ... FOR UPDATE), damit parallele Importe nichts überschreiben.
+    """
+    new_players, new_durations = {}, {}
+    _accumulate(battles, new_players, new_durations)
+    if not new_players:
+        return
+    days = list(new_players)
+
+    players = {day: HyperLogLog.from_bytes(data) for day, data in connection.execute(
+        select(BattleDailyPlayers.day, BattleDailyPlayers.players)
+        .where(BattleDailyPlayers.day.in_(days)).with_for_update()
+    )}
+    durations = {(day, battle_mode, event_map): KLLSketch.from_bytes(data) for day, battle_mode, event_map, data in
+                 connection.execute(
+                     select(BattleDailyDurations.day, BattleDailyDurations.battle_mode,
+                            BattleDailyDurations.event_map, BattleDailyDurations.durations)
+                     .where(BattleDailyDurations.day.in_(days)).with_for_update()
+                 )}
+
+    for day, sketch in new_players.items():
+        players.setdefault(day, HyperLogLog()).merge(sketch)
+    for key, sketch in new_durations.items():
+        durations.setdefault(key, KLLSketch()).merge(sketch)
+    _store(connection, days, players, durations)
+
+
+def rebuild(connection):
+    """Baut alle Tages-Sketches vollständig aus battle_logs neu auf. Liefert die Anzahl der Tage."""
+    players, durations = {}, {}
+    _accumulate(_raw_rows(connection, []), players, durations)
+    connection.execute(delete(BattleDailyPlayers))
+    connection.execute(delete(BattleDailyDurations))
+    _store(connection, list(players), players, durations)
+    return len(players)
+
+
+def _battle_row(obj):
+    return obj.battle_time, obj.battle_mode, obj.event_map, obj.player_tag, obj.battle_duration
+
+
+def _refresh_after_flush(session, flush_context):
+    # Geänderte oder gelöschte Battles erfordern einen Neuaufbau ihrer (alten und neuen) Tage
+    days = set()
+    for obj in chain(session.dirty, session.deleted):
+        if isinstance(obj, BattleData):
+            history = inspect(obj).attrs.battle_time.history
+            for battle_time in chain(history.unchanged or (), history.added or (), history.deleted or ()):
+                days.add(battle_time.date())
+    connection = session.connection()
+    if days:
+        refresh_days(connection, days)
+    added = [_battle_row(obj) for obj in session.new
+             if isinstance(obj, BattleData) and obj.battle_time.date() not in days]
+    if added:
+        add_battles(connection, added)
+
+
+def enable_incremental_refresh(session_factory):
+    """Inkrementelle Pflege: jeder Flush mit geänderten Battles aktualisiert die Sketches der betroffenen Tage."""
+    if not event.contains(session_factory, "after_flush", _refresh_after_flush):
+        event.listen(session_factory, "after_flush", _refresh_after_flush)
+
+
+# --- Abfragen ---------------------------------------------------------------------
+
+def _stored_days(model, start_date, end_date):
+    """Filter auf die vollständig im Zeitraum liegenden Tage, None wenn kein ganzer Tag enthalten ist."""
+    rollup_filters, raw_filter_lists = split_range(None, start_date, end_date)
+    if rollup_filters is None:
+        return None, raw_filter_lists
+    first_day, last_day = full_days(start_date, end_date)
+    filters = []
+    if first_day:
+        filters.append(model.day >= first_day)
+    if last_day:
+        filters.append(model.day <= last_day)
+    return filters, raw_filter_lists
+
+
+def available(player_tag=None, start_date=None, end_date=None) -> bool:
+    """
+    Sketches gibt es nur mit USE_SKETCHES, nicht pro Spieler, nur für ganze Tage und nicht für archivierte Monate
+    (archive_before löscht deren Sketch-Tage). Sonst rechnen die Endpunkte exakt über Datenbank und Archiv.
+    """
+    return (
+        USE_SKETCHES and not player_tag and split_range(None, start_date, end_date)[0] is not None
+        and not archive.overlaps(start_date, end_date)
+    )
+
+
+def _sources(model, start_date, end_date):
+    """Ganze Tage aus der Sketch-Tabelle, angebrochene Randtage aus battle_logs (nur wenn available())."""
+    if not USE_SKETCHES:
+        raise ValueError("Sketches sind nur mit USE_SKETCHES=true verfügbar")
+    return _stored_days(model, start_date, end_date)
+
+
+def approx_unique_players(db, start_date=None, end_date=None):
+    """Geschätzte Anzahl unterschiedlicher Spieler im Zeitraum aus den gemergten HyperLogLog-Sketches."""
+    day_filters, raw_filter_lists = _sources(BattleDailyPlayers, start_date, end_date)
+    merged = HyperLogLog()
+    if day_filters is not None:
+        for data in db.execute(select(BattleDailyPlayers.players).where(*day_filters)).scalars():
+            merged.merge(HyperLogLog.from_bytes(data))
+    for filters in raw_filter_lists:
+        players = {}
+        _accumulate(_raw_rows(db.connection(), filters), players, {})
+        for sketch in players.values():
+            merged.merge(sketch)
+    return merged.count()
+
+
+def duration_sketches(db, dims, start_date=None, end_date=None):
+    """
+    KLL-Sketches der Kampfdauer, gemergt auf `dims` (Teilmenge von battle_mode, event_map).
+    Schlüssel sind Tupel in der Reihenfolge von `dims`, NULL wird wie in den Grains als None geliefert.
+    """
+    day_filters, raw_filter_lists = _sources(BattleDailyDurations, start_date, end_date)
+    merged = {}
+
+    def merge(battle_mode, event_map, sketch):
+        values = {"battle_mode": battle_mode or None, "event_map": event_map or None}
+        key = tuple(values[name] for name in dims)
+        if key in merged:
+            merged[key].merge(sketch)
+        else:
+            merged[key] = sketch
+
+    if day_filters is not None:
+        for battle_mode, event_map, data in db.execute(select(
+            BattleDailyDurations.battle_mode, BattleDailyDurations.event_map, BattleDailyDurations.durations
+        ).where(*day_filters)):
+            merge(battle_mode, event_map, KLLSketch.from_bytes(data))
+    for filters in raw_filter_lists:
+        durations = {}
+        _accumulate(_raw_rows(db.connection(), filters), {}, durations)
+        for (_, battle_mode, event_map), sketch in durations.items():
+            merge(battle_mode, event_map, sketch)
+    return merged
+
+
+def exact_duration_percentiles(db, dims, player_tag=None, start_date=None, end_date=None):
+    """
+    Exakte p50/p90/p99 der Kampfdauer pro Gruppe `dims` (Nearest-Rank wie KLLSketch.quantiles).
+
+    Ohne Archiv im Zeitraum in einer Abfrage: CUME_DIST() je Gruppe, dann pro Perzentil der kleinste Wert mit
+    mindestens diesem Rang; übertragen wird nur eine Zeile pro Gruppe. Berührt der Zeitraum archivierte Monate,
+    werden die Häufigkeiten pro Dauer aus battle_logs (GROUP BY) und dem Archiv zusammengeführt.
+    """
+    if archive.overlaps(start_date, end_date):
+        return _percentiles_from_counts(chain(
+            _duration_counts(db, dims, player_tag, start_date, end_date),
+            archive.duration_counts(dims, player_tag, start_date, end_date)
+        ))
+
+    columns = [getattr(BattleData, name) for name in dims]
+    ranked = select(
+        *columns,
+        BattleData.battle_duration.label("duration"),
+        func.cume_dist().over(partition_by=columns, order_by=BattleData.battle_duration).label("rank")
+    ).where(BattleData.battle_duration.isnot(None), *build_filters(player_tag, start_date, end_date)).subquery()
+    groups = [ranked.c[name] for name in dims]
+    query = select(*groups, *(
+        func.min(case((ranked.c.rank >= fraction, ranked.c.duration))).label(name)
+        for fraction, name in PERCENTILES.items()
+    )).group_by(*groups)
+    return {
+        tuple(value or None for value in row[:len(dims)]): dict(zip(PERCENTILES.values(), row[len(dims):]))
+        for row in db.execute(query)
+    }
+
+
+def _duration_counts(db, dims, player_tag=None, start_date=None, end_date=None):
+    """Häufigkeiten der Kampfdauer in battle_logs: (Gruppe nach `dims`, battle_duration, Anzahl)."""
+    columns = [getattr(BattleData, name) for name in dims]
+    rows = db.execute(
+        select(*columns, BattleData.battle_duration, func.count())
+        .where(BattleData.battle_duration.isnot(None), *build_filters(player_tag, start_date, end_date))
+        .group_by(*columns, BattleData.battle_duration)
+    )
+    return [(tuple(row[:len(dims)]), row[-2], row[-1]) for row in rows]
+
+
+def _percentiles_from_counts(counts):
+    """Nearest-Rank-Perzentile pro Gruppe aus (Gruppe, Dauer, Anzahl); NULL bzw. '' als Gruppe wird None."""
+    histograms = {}
+    for group, duration, count in counts:
+        histogram = histograms.setdefault(tuple(value or None for value in group), {})
+        histogram[duration] = histogram.get(duration, 0) + count
+
+    result = {}
+    for group, histogram in histograms.items():
+        total = sum(histogram.values())
+        values, cumulative, fractions = {}, 0, sorted(PERCENTILES)
+        for duration in sorted(histogram):
+            cumulative += histogram[duration]
+            # wie CUME_DIST() >= Rang: der kleinste Wert, bis zu dem mindestens dieser Anteil reicht
+            while fractions and cumulative / total >= fractions[0]:
+                values[PERCENTILES[fractions.pop(0)]] = duration
+        result[group] = values
+    return result
+
+
+def percentiles_by_group(db, dims, player_tag=None, start_date=None, end_date=None):
+    """p50/p90/p99 der Kampfdauer pro Gruppe aus den Sketches, wenn available(), sonst exakt (inkl. Archiv)."""
+    if not available(player_tag, start_date, end_date):
+        return exact_duration_percentiles(db, dims, player_tag, start_date, end_date)
+    return {
+        key: duration_percentiles(sketch)
+        for key, sketch in duration_sketches(db, dims, start_date, end_date).items()
+    }
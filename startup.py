@@ -0,0 +1,101 @@
+"""
+Start und Herunterfahren eines Workers (FastAPI-Lifespan).
+
+Import und App-Factory bauen keine Datenbankverbindung auf. Im Lifespan laufen optional, bevor der Worker
+Anfragen annimmt:
+- CREATE_SCHEMA_ON_STARTUP: fehlende Tabellen anlegen (Base.metadata.create_all),
+- WARMUP_ON_STARTUP: Connection-Pools aller Engines füllen und die WARMUP_PATHS einmal über die App selbst
+  abrufen, wodurch Ergebnis-Cache (und ggf. Columnar-Engine) geladen werden.
+Danach startet mit PRECOMPUTE_ENABLED der Scheduler für heiße Schlüssel (precompute.py). Beim Herunterfahren
+werden Scheduler und Pools beendet.
+"""
+import logging
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+from starlette.concurrency import run_in_threadpool
+
+import database
+import precompute
+from config import (
+    CACHE_ENABLED, CREATE_SCHEMA_ON_STARTUP, DB_POOL_SIZE, PRECOMPUTE_ENABLED, WARMUP_ON_STARTUP, WARMUP_PATHS
+)
+from database import Base, get_engine, get_engines
+from metrics import WARMUP_HEADER, cold_start
+
+logger = logging.getLogger("battle_stats.startup")
+
+
+def create_schema():
+    """Legt fehlende Tabellen an (bestehende bleiben unverändert, Indizes siehe manage.py create-indexes)."""
+    import models  # noqa: F401  (registriert die Tabellen an Base.metadata)
+
+    Base.metadata.create_all(bind=get_engine())
+
+
+def _pool_size(engine) -> int:
+    # SQLite nutzt NullPool bzw. SingletonThreadPool ohne vorgehaltene Verbindungen, eine reicht zum Prüfen
+    return DB_POOL_SIZE if isinstance(engine.pool, QueuePool) else 1
+
+
+async def prime_pools():
+    """Füllt die Connection-Pools von Primary, Replikas und ggf. den Async-Engines."""
+    engines = get_engines()
+    for engine in [engines.primary, *engines.replicas]:
+        await run_in_threadpool(_prime_sync_pool, engine)
+    if engines.async_primary is not None:
+        for engine in [engines.async_primary, *engines.async_replicas]:
+            await _prime_async_pool(engine)
+
+
+def _prime_sync_pool(engine):
+    """Öffnet gleichzeitig so viele Verbindungen, wie der Pool dauerhaft hält, und gibt sie an ihn zurück."""
+    connections = []
+    try:
+        for _ in range(_pool_size(engine)):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+async def _prime_async_pool(engine):
+    async with AsyncExitStack() as stack:
+        for _ in range(_pool_size(engine.sync_engine)):
+            connection = await stack.enter_async_context(engine.connect())
+            await connection.execute(text("SELECT 1"))
+
+
+async def warm_caches(app, paths=WARMUP_PATHS):
+    """Ruft die Endpunkte ohne Parameter über die App selbst auf (gleiche Cache-Schlüssel wie echte Anfragen)."""
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://warmup", timeout=None) as client:
+        for path in paths:
+            response = await client.get(path, headers={WARMUP_HEADER: "1"})
+            if response.status_code >= 500:
+                logger.warning("Warmup %s: Status %s", path, response.status_code)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if CREATE_SCHEMA_ON_STARTUP:
+        with cold_start.measure("schema"):
+            await run_in_threadpool(create_schema)
+    if WARMUP_ON_STARTUP:
+        with cold_start.measure("warmup"):
+            await prime_pools()
+            await warm_caches(app)
+    if PRECOMPUTE_ENABLED and CACHE_ENABLED:
+        precompute.start()
+    cold_start.ready()
+    try:
+        yield
+    finally:
+        await precompute.stop()
+        if database.engines_created():
+            await get_engines().dispose()
@@ -0,0 +1,427 @@
+from datetime import datetime, time
+
+from fastapi import HTTPException
+
+import aggregation
+import archive
+import sketches
+from aggregation import merge_grains
+from columnar import active_store
+
+# Feinste Granularität, aus der sich alle Statistik-Antworten ableiten lassen
+BATTLE_DIMS = ()
+TROPHY_DIMS = ("day",)
+BRAWLER_DIMS = ("brawler_name",)
+GAMEMODE_DIMS = ("battle_mode",)
+MAP_DIMS = ("event_map", "battle_mode", "brawler_name")
+DASHBOARD_DIMS = ("day", "brawler_name", "battle_mode", "event_map")
+
+
+def _win_rate(victories, battles):
+    return round(victories / battles * 100, 2)
+
+
+def _time_range(grains):
+    """Erster und letzter Battle über alle Grains."""
+    return min(g["first_battle"] for g in grains), max(g["last_battle"] for g in grains)
+
+
+def _avg_duration(grain):
+    """Durchschnittliche Dauer über alle Battles mit bekannter Dauer."""
+    return grain["duration_sum"] / grain["duration_count"] if grain["duration_count"] else None
+
+
+def _seconds_per_trophy(avg_duration, battles, trophy_change):
+    """Sekunden pro Trophäe, nur wenn sowohl Dauer als auch positive Trophäenänderung verfügbar sind."""
+    if avg_duration and trophy_change > 0:
+        return round((avg_duration * battles) / trophy_change, 2)
+    return None
+
+
+def _totals(grains):
+    total_battles = sum(g["battles"] for g in grains)
+    total_victories = sum(g["victories"] for g in grains)
+    total_trophy_change = sum(g["trophy_change"] for g in grains)
+    return total_battles, total_victories, total_trophy_change
+
+
+def reduce_battle_statistics(grains, unique_players):
+    """Verdichtet Grains zu BattleStatistics."""
+    if not grains:
+        raise HTTPException(status_code=404, detail="Keine Battles im angegebenen Zeitraum gefunden.")
+
+    stats = merge_grains(grains, BATTLE_DIMS)[0]
+
+    # Berechne Tage zwischen erstem und letztem Battle
+    days_diff = (stats["last_battle"] - stats["first_battle"]).days + 1
+
+    return {
+        "first_battle": stats["first_battle"],
+        "last_battle": stats["last_battle"],
+        "total_battles": stats["battles"],
+        "unique_players": unique_players,
+        "avg_battles_per_day": round(stats["battles"] / days_diff, 2),
+        "avg_trophies_per_day": round(stats["trophy_change"] / days_diff, 2),
+        "avg_victories_per_day": round(stats["victories"] / days_diff, 2),
+        "win_rate": _win_rate(stats["victories"], stats["battles"])
+    }
+
+
+def lttb(points, max_points, x, y):
+    """
+    Largest-Triangle-Three-Buckets: reduziert eine Zeitreihe auf max_points Punkte. Erster und letzter Punkt
+    bleiben erhalten; aus jedem Bucket dazwischen wird der Punkt mit der größten Dreiecksfläche zum zuletzt
+    gewählten Punkt und zum Mittelwert des nächsten Buckets übernommen.
+    """
+    count = len(points)
+    if max_points >= count or max_points < 3:
+        return points
+
+    sampled = [points[0]]
+    every = (count - 2) / (max_points - 2)
+    previous = 0
+    for i in range(max_points - 2):
+        # Mittelwert des nächsten Buckets (für den letzten Bucket ist das der letzte Punkt)
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, count)
+        next_points = points[next_start:next_end]
+        avg_x = sum(x(point) for point in next_points) / len(next_points)
+        avg_y = sum(y(point) for point in next_points) / len(next_points)
+
+        prev_x, prev_y = x(points[previous]), y(points[previous])
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((prev_x - avg_x) * (y(points[j]) - prev_y) - (prev_x - x(points[j])) * (avg_y - prev_y))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        previous = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def reduce_trophy_progress(grains, player_tag=None, bucket="day", max_points=None):
+    """
+    Verdichtet Grains zum Trophy Progress pro Bucket (Standard: Tag) mit kumulierter Trophäenänderung.
+    Mit max_points wird die Reihe per LTTB über die kumulierte Trophäenänderung ausgedünnt; die Summen
+    beziehen sich weiterhin auf alle Buckets.
+    """
+    bucket_stats = sorted(merge_grains(grains, (bucket,)), key=lambda g: g[bucket])
+
+    if not bucket_stats:
+        raise HTTPException(status_code=404, detail="Keine Daten für den angegebenen Zeitraum gefunden.")
+
+    total_battles, total_victories, total_trophy_change = _totals(bucket_stats)
+
+    # Fortschritte pro Bucket formatieren
+    progress = []
+    cumulative = 0
+    for entry in bucket_stats:
+        cumulative += entry["trophy_change"]
+        start = entry[bucket]
+        progress.append({
+            "date": start if isinstance(start, datetime) else datetime.combine(start, time.min),
+            "trophy_change": entry["trophy_change"],
+            "cumulative_trophy_change": cumulative,
+            "total_battles": entry["battles"],
+            "victory_count": entry["victories"],
+            "win_rate": _win_rate(entry["victories"], entry["battles"])
+        })
+
+    if max_points:
+        progress = lttb(progress, max_points, x=lambda p: p["date"].timestamp(), y=lambda p: p["cumulative_trophy_change"])
+
+    return {
+        "player_tag": player_tag,
+        "start_date": progress[0]["date"],
+        "end_date": progress[-1]["date"],
+        "bucket": bucket,
+        "daily_progress": progress,
+        "total_trophy_change": total_trophy_change,
+        "total_battles": total_battles,
+        "overall_win_rate": _win_rate(total_victories, total_battles)
+    }
+
+
+def reduce_brawler_statistics(grains, player_tag=None):
+    """Verdichtet Grains zu Statistiken pro Brawler."""
+    # Sortierung nach Anzahl Battles, bei Gleichstand alphabetisch
+    brawler_stats = sorted(
+        merge_grains(grains, BRAWLER_DIMS), key=lambda g: (-g["battles"], g["brawler_name"] or '')
+    )
+
+    if not brawler_stats:
+        raise HTTPException(status_code=404, detail="Keine Daten für den angegebenen Zeitraum gefunden.")
+
+    total_battles, total_victories, total_trophy_change = _totals(brawler_stats)
+    start, end = _time_range(brawler_stats)
+
+    brawler_statistics = [
+        {
+            "brawler_name": stat["brawler_name"],
+            "battles": stat["battles"],
+            "victories": stat["victories"],
+            "trophy_change": stat["trophy_change"],
+            "win_rate": _win_rate(stat["victories"], stat["battles"])
+        }
+        for stat in brawler_stats
+    ]
+
+    return {
+        "player_tag": player_tag,
+        "start_date": start,
+        "end_date": end,
+        "brawler_statistics": brawler_statistics,
+        "total_battles": total_battles,
+        "total_trophy_change": total_trophy_change,
+        "overall_win_rate": _win_rate(total_victories, total_battles)
+    }
+
+
+def reduce_gamemode_statistics(grains, player_tag=None, percentiles=None):
+    """
+    Verdichtet Grains zu Statistiken pro Game Mode. Mit `percentiles` (p50/p90/p99 der Kampfdauer pro Modus,
+    siehe sketches.percentiles_by_group) kommen die Perzentile hinzu.
+    """
+    # Sortierung nach Anzahl Battles, bei Gleichstand alphabetisch
+    gamemode_stats = sorted(
+        merge_grains(grains, GAMEMODE_DIMS), key=lambda g: (-g["battles"], g["battle_mode"] or '')
+    )
+
+    if not gamemode_stats:
+        raise HTTPException(status_code=404, detail="Keine Daten für den angegebenen Zeitraum gefunden.")
+
+    total_battles, total_victories, total_trophy_change = _totals(gamemode_stats)
+    start, end = _time_range(gamemode_stats)
+
+    game_mode_statistics = []
+    for stat in gamemode_stats:
+        avg_duration = _avg_duration(stat)
+        entry = {
+            "battle_mode": stat["battle_mode"],
+            "battles": stat["battles"],
+            "victories": stat["victories"],
+            "trophy_change": stat["trophy_change"],
+            "avg_duration": round(avg_duration, 2) if avg_duration else None,
+            "avg_trophies_per_battle": round(stat["trophy_change"] / stat["battles"], 2),
+            "seconds_per_trophy": _seconds_per_trophy(avg_duration, stat["battles"], stat["trophy_change"]),
+            "win_rate": _win_rate(stat["victories"], stat["battles"])
+        }
+        if percentiles is not None:
+            entry.update(percentiles.get((stat["battle_mode"],)) or sketches.duration_percentiles(None))
+        game_mode_statistics.append(entry)
+
+    return {
+        "player_tag": player_tag,
+        "start_date": start,
+        "end_date": end,
+        "game_mode_statistics": game_mode_statistics,
+        "total_battles": total_battles,
+        "total_trophy_change": total_trophy_change,
+        "overall_win_rate": _win_rate(total_victories, total_battles)
+    }
+
+
+def _best_brawler(brawler):
+    return {
+        "brawler_name": brawler["brawler_name"],
+        "battles": brawler["battles"],
+        "victories": brawler["victories"],
+        "trophy_change": brawler["trophy_change"],
+        "win_rate": _win_rate(brawler["victories"], brawler["battles"])
+    }
+
+
+def reduce_map_statistics(grains, player_tag=None, percentiles=None):
+    """
+    Verdichtet Grains (Map, Modus, Brawler) zu Statistiken pro Map-Battle-Mode Kombination. Mit `percentiles`
+    (p50/p90/p99 der Kampfdauer pro Map und Modus) kommen die Perzentile hinzu.
+    """
+    brawler_rows = merge_grains(grains, MAP_DIMS)
+
+    # Zeitraum über alle gefilterten Battles (auch solche ohne Map-Namen)
+    start, end = _time_range(brawler_rows) if brawler_rows else (None, None)
+
+    # Nur Einträge mit Map-Namen, keine leeren Strings
+    brawler_rows = [row for row in brawler_rows if row["event_map"]]
+    if not brawler_rows:
+        raise HTTPException(status_code=404, detail="Keine Daten für den angegebenen Zeitraum gefunden.")
+
+    brawlers_by_map = {}
+    for row in brawler_rows:
+        brawlers_by_map.setdefault((row["event_map"], row["battle_mode"]), []).append(row)
+
+    # Sortierung nach Anzahl Battles, bei Gleichstand deterministisch nach Map und Modus
+    map_stats = sorted(
+        merge_grains(brawler_rows, ("event_map", "battle_mode")),
+        key=lambda g: (-g["battles"], g["event_map"], g["battle_mode"] or '')
+    )
+
+    map_statistics = []
+    for stat in map_stats:
+        brawlers = brawlers_by_map[(stat["event_map"], stat["battle_mode"])]
+        # Brawler mit meisten Battles bzw. meisten Trophäen (bei Gleichstand alphabetisch)
+        most_played = min(brawlers, key=lambda b: (-b["battles"], b["brawler_name"] or ''))
+        most_trophies = min(brawlers, key=lambda b: (-b["trophy_change"], b["brawler_name"] or ''))
+
+        avg_duration = _avg_duration(stat)
+        entry = {
+            "event_map": stat["event_map"],
+            "battle_mode": stat["battle_mode"],
+            "battles": stat["battles"],
+            "victories": stat["victories"],
+            "trophy_change": stat["trophy_change"],
+            "avg_trophies_per_battle": round(stat["trophy_change"] / stat["battles"], 2),
+            "avg_duration": round(avg_duration, 2) if avg_duration else None,
+            "seconds_per_trophy": _seconds_per_trophy(avg_duration, stat["battles"], stat["trophy_change"]),
+            "win_rate": _win_rate(stat["victories"], stat["battles"]),
+            "most_played_brawler": _best_brawler(most_played),
+            "most_trophy_brawler": _best_brawler(most_trophies)
+        }
+        if percentiles is not None:
+            entry.update(
+                percentiles.get((stat["event_map"], stat["battle_mode"])) or sketches.duration_percentiles(None)
+            )
+        map_statistics.append(entry)
+
+    total_battles, total_victories, total_trophy_change = _totals(map_stats)
+
+    return {
+        "player_tag": player_tag,
+        "start_date": start,
+        "end_date": end,
+        "map_statistics": map_statistics,
+        "total_battles": total_battles,
+        "total_trophy_change": total_trophy_change,
+        "overall_win_rate": _win_rate(total_victories, total_battles)
+    }
+
+
+def fetch_grains(db, dims, player_tag=None, start_date=None, end_date=None):
+    """
+    Grains aus der Columnar-Engine (falls aktiviert), sonst per SQL aus Rollup bzw. battle_logs; berührt der
+    Zeitraum archivierte Monate, kommen deren Grains aus dem Parquet-Archiv hinzu.
+    """
+    store = active_store(db.get_bind())
+    if store is not None:
+        grains = store.grains(dims, player_tag, start_date, end_date)
+    else:
+        grains = aggregation.fetch_grains(db, dims, player_tag, start_date, end_date)
+    if not archive.overlaps(start_date, end_date):
+        return grains
+    return merge_grains(grains + archive.grains(dims, player_tag, start_date, end_date), dims)
+
+
+def count_players(db, player_tag=None, start_date=None, end_date=None):
+    store = active_store(db.get_bind())
+    if archive.overlaps(start_date, end_date):
+        # Spieler können in beiden Schichten vorkommen, daher Vereinigung statt Summe
+        if store is not None:
+            hot = store.players(player_tag, start_date, end_date)
+        else:
+            hot = aggregation.players(db, player_tag, start_date, end_date)
+        return len(hot | archive.players(player_tag, start_date, end_date))
+    if store is not None:
+        return store.count_players(player_tag, start_date, end_date)
+    return aggregation.count_players(db, player_tag, start_date, end_date)
+
+
+def _unique_players(db, grains, player_tag=None, start_date=None, end_date=None, approx=False):
+    """
+    Mit player_tag ist die Anzahl trivial, sonst ist eine eigene DISTINCT-Abfrage nötig (bzw. mit approx
+    eine Schätzung aus den HyperLogLog-Sketches, sofern es für den Zeitraum welche gibt).
+    """
+    if not grains:
+        return 0
+    if player_tag:
+        return 1
+    if approx and sketches.available(player_tag, start_date, end_date):
+        return sketches.approx_unique_players(db, start_date, end_date)
+    return count_players(db, player_tag, start_date, end_date)
+
+
+def battle_statistics(db, player_tag=None, start_date=None, end_date=None, approx=False):
+    grains = fetch_grains(db, BATTLE_DIMS, player_tag, start_date, end_date)
+    return reduce_battle_statistics(grains, _unique_players(db, grains, player_tag, start_date, end_date, approx))
+
+
+def trophy_progress(db, player_tag=None, start_date=None, end_date=None, bucket="day", max_points=None):
+    grains = fetch_grains(db, (bucket,), player_tag, start_date, end_date)
+    return reduce_trophy_progress(grains, player_tag, bucket, max_points)
+
+
+def brawler_statistics(db, player_tag=None, start_date=None, end_date=None):
+    return reduce_brawler_statistics(fetch_grains(db, BRAWLER_DIMS, player_tag, start_date, end_date), player_tag)
+
+
+def gamemode_statistics(db, player_tag=None, start_date=None, end_date=None, approx=False):
+    grains = fetch_grains(db, GAMEMODE_DIMS, player_tag, start_date, end_date)
+    percentiles = None
+    if approx and grains:
+        percentiles = sketches.percentiles_by_group(db, GAMEMODE_DIMS, player_tag, start_date, end_date)
+    return reduce_gamemode_statistics(grains, player_tag, percentiles)
+
+
+def map_statistics(db, player_tag=None, start_date=None, end_date=None, approx=False):
+    grains = fetch_grains(db, MAP_DIMS, player_tag, start_date, end_date)
+    percentiles = None
+    if approx and grains:
+        percentiles = sketches.percentiles_by_group(db, ("event_map", "battle_mode"), player_tag, start_date, end_date)
+    return reduce_map_statistics(grains, player_tag, percentiles)
+
+
+def _grains_by_player(grains):
+    by_player = {}
+    for grain in grains:
+        by_player.setdefault(grain["player_tag"], []).append(grain)
+    return by_player
+
+
+def batch_battle_statistics(db, player_tags, start_date=None, end_date=None):
+    """
+    BattleStatistics für mehrere Spieler aus einer einzigen nach player_tag gruppierten Abfrage.
+    Spieler ohne Battles im Zeitraum werden mit None geliefert.
+    """
+    by_player = _grains_by_player(fetch_grains(db, ("player_tag",) + BATTLE_DIMS, player_tags, start_date, end_date))
+    return {
+        tag: reduce_battle_statistics(by_player[tag], 1) if tag in by_player else None
+        for tag in player_tags
+    }
+
+
+def batch_brawler_statistics(db, player_tags, start_date=None, end_date=None):
+    """Brawler-Statistiken für mehrere Spieler aus einer einzigen nach player_tag gruppierten Abfrage."""
+    by_player = _grains_by_player(fetch_grains(db, ("player_tag",) + BRAWLER_DIMS, player_tags, start_date, end_date))
+    return {
+        tag: reduce_brawler_statistics(by_player[tag], tag) if tag in by_player else None
+        for tag in player_tags
+    }
+
+
+def player_dashboard(db, player_tag=None, start_date=None, end_date=None):
+    """
+    Alle fünf Statistiken aus einem einzigen Durchlauf: die Grains werden einmal auf feinster Ebene
+    (Tag, Brawler, Modus, Map) gelesen und für jede Antwort in Python weiter verdichtet.
+    """
+    grains = fetch_grains(db, DASHBOARD_DIMS, player_tag, start_date, end_date)
+    if not grains:
+        raise HTTPException(status_code=404, detail="Keine Daten für den angegebenen Zeitraum gefunden.")
+
+    # Ohne Battles mit Map-Namen liefert /map-statistics 404, im Dashboard bleibt der Abschnitt leer
+    try:
+        map_stats = reduce_map_statistics(grains, player_tag)
+    except HTTPException:
+        map_stats = None
+
+    return {
+        "player_tag": player_tag,
+        "start_date": start_date,
+        "end_date": end_date,
+        "battle_statistics": reduce_battle_statistics(
+            grains, _unique_players(db, grains, player_tag, start_date, end_date)
+        ),
+        "trophy_progress": reduce_trophy_progress(grains, player_tag),
+        "brawler_statistics": reduce_brawler_statistics(grains, player_tag),
+        "gamemode_statistics": reduce_gamemode_statistics(grains, player_tag),
+        "map_statistics": map_stats
+    }
@@ -0,0 +1,79 @@
+"""
+Gemeinsame Fixtures: eine SQLite-Datei pro Testlauf, die App ohne Lifespan und ein Query-Zähler.
+
+DATABASE_URL wird vor dem ersten Import der App-Module gesetzt (config liest die Umgebung beim Import, die
+Engines entstehen erst beim ersten Zugriff). Optionale Pfade (Rollup, Sketches, Columnar, Archiv) bleiben aus.
+"""
+import os
+import tempfile
+from datetime import datetime
+
+_directory = tempfile.mkdtemp(prefix="battle_stats_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_directory, 'tests.sqlite')}"
+for _name in ("USE_ROLLUP", "USE_SKETCHES", "USE_ASYNC_DB", "USE_COLUMNAR_ENGINE", "PRECOMPUTE_ENABLED", "WARMUP_ON_STARTUP"):
+    os.environ[_name] = "false"
+os.environ["ARCHIVE_DIR"] = ""
+os.environ["READ_DATABASE_URL"] = ""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+
+import models
+from benchmarks.datagen import COLUMNS, generate_rows
+from cache import result_cache
+from database import Base, get_engine
+
+
+@pytest.fixture(scope="session")
+def engine():
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def load_battles(engine):
+    """Leert battle_logs und den Ergebnis-Cache und lädt generierte Battles (Optionen wie datagen.generate_rows)."""
+    def load(rows, **options):
+        with engine.begin() as connection:
+            connection.execute(models.BattleData.__table__.delete())
+            records = [dict(zip(COLUMNS, row)) for row in generate_rows(rows, **options)]
+            for record in records:
+                record["battle_time"] = datetime.strptime(record["battle_time"], "%Y-%m-%d %H:%M:%S.%f")
+            connection.execute(insert(models.BattleData), records)
+        result_cache.clear()
+    return load
+
+
+@pytest.fixture
+def client(engine):
+    from main import create_app
+
+    result_cache.clear()
+    return TestClient(create_app())
+
+
+@pytest.fixture
+def count_queries(engine):
+    """Zählt die SQL-Statements, die während des with-Blocks ausgeführt werden."""
+    class Counter:
+        def __init__(self):
+            self.statements = []
+
+        def __enter__(self):
+            self.statements.clear()
+            event.listen(engine, "before_cursor_execute", self._record)
+            return self
+
+        def __exit__(self, *exc):
+            event.remove(engine, "before_cursor_execute", self._record)
+
+        def _record(self, conn, cursor, statement, parameters, context, executemany):
+            self.statements.append(statement)
+
+        @property
+        def count(self):
+            return len(self.statements)
+
+    return Counter()
@@ -0,0 +1,36 @@
+"""approx=true liefert nach dem Archivieren eines Monats dieselben Werte wie vorher (Datenbank und Archiv)."""
+from datetime import date
+
+import pytest
+from sqlalchemy import func, select
+
+import archive
+import sketches
+from cache import result_cache
+from models import BattleDailyDurations, BattleDailyPlayers
+
+pytest.importorskip("pyarrow")
+
+ENDPOINTS = ("/battle-statistics", "/gamemode-statistics", "/map-statistics")
+
+
+def test_approx_unchanged_after_archiving_a_month(client, load_battles, engine, monkeypatch, tmp_path):
+    load_battles(3000, players=50, maps=5)
+    before = {endpoint: client.get(endpoint, params={"approx": "true"}).json() for endpoint in ENDPOINTS}
+
+    monkeypatch.setattr(sketches, "USE_SKETCHES", True)
+    with engine.begin() as connection:
+        sketches.rebuild(connection)
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path))
+    assert list(archive.archive_before(engine, date(2024, 2, 1))) == [date(2024, 1, 1)]
+    result_cache.clear()
+
+    with engine.connect() as connection:
+        for model in (BattleDailyPlayers, BattleDailyDurations):
+            # keine Sketch-Tage des archivierten Monats mehr, die zusätzlich zum Archiv zählen könnten
+            assert connection.execute(
+                select(func.count()).select_from(model).where(model.day < date(2024, 2, 1))
+            ).scalar() == 0
+
+    for endpoint in ENDPOINTS:
+        assert client.get(endpoint, params={"approx": "true"}).json() == before[endpoint]
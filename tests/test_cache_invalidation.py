@@ -0,0 +1,91 @@
+"""Der Ergebnis-Cache darf nach nachgetragenen oder überschriebenen Battles keine alten Werte ausliefern."""
+from datetime import datetime
+
+from sqlalchemy import insert, select
+
+from cache import result_cache
+from models import BattleData
+
+PLAYER = "#P0000001"
+PARAMS = {"player_tag": PLAYER}
+
+
+def _battle(battle_time, **values):
+    return {
+        "player_tag": PLAYER, "battle_time": battle_time, "brawler_id": 16000001, "brawler_name": "BRAWLER 01",
+        "battle_mode": "gemGrab", "event_map": "Map 000", "battle_result": "victory", "trophy_change": 8,
+        "battle_duration": 120, **values,
+    }
+
+
+def test_backfilled_battle_invalidates_entry(client, load_battles):
+    load_battles(200, players=2)
+    before = client.get("/battle-statistics", params=PARAMS).json()
+
+    response = client.post("/battle-data/bulk", json=[_battle("2023-12-01T10:00:00")])
+    assert response.json()["inserted"] == 1
+
+    after = client.get("/battle-statistics", params=PARAMS).json()
+    assert after["total_battles"] == before["total_battles"] + 1
+    assert after["first_battle"] == "2023-12-01T10:00:00"
+
+
+def test_backfill_from_other_writer_changes_watermark(client, load_battles, engine):
+    """Ohne Import über diesen Worker (kein Entfernen) erkennt die Anzahl im Watermark den Nachtrag."""
+    load_battles(200, players=2)
+    before = client.get("/battle-statistics", params=PARAMS).json()
+
+    with engine.begin() as connection:
+        connection.execute(insert(BattleData), [_battle(datetime(2023, 12, 1, 10))])
+
+    after = client.get("/battle-statistics", params=PARAMS).json()
+    assert after["total_battles"] == before["total_battles"] + 1
+
+
+def test_overwritten_battles_invalidate_entry(client, load_battles, engine):
+    load_battles(200, players=2)
+    before = client.get("/battle-statistics", params=PARAMS).json()
+    global_before = client.get("/battle-statistics").json()
+
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(BattleData.__table__).where(BattleData.player_tag == PLAYER).limit(5)
+        ).mappings().all()
+    overwritten = [
+        {**row, "battle_time": row["battle_time"].isoformat(), "trophy_change": (row["trophy_change"] or 0) + 100}
+        for row in rows
+    ]
+    response = client.post("/battle-data/bulk", json=overwritten)
+    assert response.json()["updated"] == 5
+
+    after = client.get("/battle-statistics", params=PARAMS).json()
+    assert after["total_battles"] == before["total_battles"]
+    assert after["last_battle"] == before["last_battle"]
+    assert after["avg_trophies_per_day"] != before["avg_trophies_per_day"]
+    assert client.get("/battle-statistics").json()["avg_trophies_per_day"] != global_before["avg_trophies_per_day"]
+
+
+def test_invalidate_players_keeps_unrelated_entries():
+    result_cache.clear()
+    result_cache.set(("battle-statistics", "#A", None, None, ()), {}, None, 60)
+    result_cache.set(("battle-statistics", "#B", None, None, ()), {}, None, 60)
+    result_cache.set(("battle-statistics-batch", ("#B", "#C"), None, None, ()), {}, None, 60)
+    result_cache.set(("battle-statistics", None, None, None, ()), {}, None, 60)
+
+    assert result_cache.invalidate_players({"#B"}) == 3
+    assert result_cache.peek(("battle-statistics", "#A", None, None, ())) is not None
+
+
+def test_global_watermark_without_count(client, load_battles, engine, count_queries):
+    """Über alle Spieler kein count(*) über battle_logs; ein Import über diesen Worker macht den Eintrag ungültig."""
+    load_battles(200, players=2)
+    before = client.get("/battle-statistics").json()
+
+    with count_queries as counter:
+        assert client.get("/battle-statistics").json() == before
+    [statement] = counter.statements
+    assert "count(" not in statement.lower()
+
+    response = client.post("/battle-data/bulk", json=[_battle("2023-12-01T10:00:00")])
+    assert response.json()["inserted"] == 1
+    assert client.get("/battle-statistics").json()["total_battles"] == before["total_battles"] + 1
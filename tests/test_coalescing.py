@@ -0,0 +1,55 @@
+"""Bricht die erste von mehreren gleichen Anfragen ab, erhalten die übrigen das Ergebnis der gemeinsamen Berechnung."""
+import asyncio
+import threading
+
+import httpx
+
+import main
+import stats
+
+PARAMS = {"player_tag": "#P0000001"}
+
+
+def test_follower_served_after_leader_cancelled(load_battles, monkeypatch):
+    load_battles(200, players=2)
+    monkeypatch.setattr(main, "COALESCE_REQUESTS", True)
+    started, leader_gone = threading.Event(), threading.Event()
+    sessions = {"request": [], "compute": []}
+    battle_statistics = stats.battle_statistics
+
+    def compute(db, *args, **kwargs):
+        sessions["compute"].append(db)
+        started.set()
+        assert leader_gone.wait(5)  # rechnet erst weiter, wenn get_db die Session der ersten Anfrage geschlossen hat
+        return battle_statistics(db, *args, **kwargs)
+
+    monkeypatch.setattr(stats, "battle_statistics", compute)
+
+    async def request_db(request: main.Request):
+        async for runner in main.get_db(request):
+            sessions["request"].append(runner.session)
+            yield runner
+
+    app = main.create_app()
+    app.dependency_overrides[main.get_db] = request_db
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            leader = asyncio.ensure_future(client.get("/battle-statistics", params=PARAMS))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            follower = asyncio.ensure_future(client.get("/battle-statistics", params=PARAMS))
+            await asyncio.sleep(0.05)
+            assert main.statistics_flight.in_flight() == 1
+
+            leader.cancel()
+            await asyncio.gather(leader, return_exceptions=True)
+            leader_gone.set()
+            return await follower
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert response.json()["total_battles"] > 0
+    assert len(sessions["compute"]) == 1
+    assert sessions["compute"][0] not in sessions["request"]
@@ -0,0 +1,81 @@
+"""ETag und Ergebnis-Cache prüfen denselben, einmal pro Anfrage gelesenen Stand des Spielers."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert
+
+import cache
+from models import BattleData
+
+PLAYER = "#P0000001"
+PARAMS = {"player_tag": PLAYER}
+
+
+class HotKeys:
+    """Revalidator, für den jeder Schlüssel heiß ist (ohne Hintergrund-Neuberechnung)."""
+
+    def __init__(self):
+        self.enqueued = []
+
+    def track(self, *args):
+        return True
+
+    def enqueue(self, key):
+        self.enqueued.append(key)
+
+
+@pytest.fixture
+def hot_keys(monkeypatch):
+    revalidator = HotKeys()
+    monkeypatch.setattr(cache, "revalidator", revalidator)
+    return revalidator
+
+
+def _backfill(engine):
+    with engine.begin() as connection:
+        connection.execute(insert(BattleData), [{
+            "player_tag": PLAYER, "battle_time": datetime(2023, 12, 1, 10), "brawler_id": 16000001,
+            "brawler_name": "BRAWLER 01", "battle_mode": "gemGrab", "event_map": "Map 000",
+            "battle_result": "victory", "trophy_change": 8, "battle_duration": 120,
+        }])
+
+
+def test_validator_read_once_per_request(client, load_battles, count_queries):
+    load_battles(200, players=2)
+    with count_queries as counter:
+        assert client.get("/battle-statistics", params=PARAMS).status_code == 200
+    assert counter.count == 2  # Watermark und Aggregation
+
+    with count_queries as counter:
+        assert client.get("/battle-statistics", params=PARAMS).status_code == 200
+    assert counter.count == 1  # Cache-Treffer gegen dasselbe Watermark
+
+
+def test_backfill_changes_etag_and_body_together(client, load_battles, engine):
+    load_battles(200, players=2)
+    before = client.get("/battle-statistics", params=PARAMS)
+    etag = before.headers["ETag"]
+
+    _backfill(engine)
+
+    after = client.get("/battle-statistics", params=PARAMS, headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.headers["ETag"] != etag
+    assert after.json()["total_battles"] == before.json()["total_battles"] + 1
+
+    revalidated = client.get("/battle-statistics", params=PARAMS, headers={"If-None-Match": after.headers["ETag"]})
+    assert revalidated.status_code == 304
+
+
+def test_stale_value_is_served_without_validators(client, load_battles, engine, hot_keys):
+    load_battles(200, players=2)
+    before = client.get("/battle-statistics", params=PARAMS)
+    assert "ETag" in before.headers
+
+    _backfill(engine)
+
+    stale = client.get("/battle-statistics", params=PARAMS)
+    assert stale.status_code == 200
+    assert stale.json() == before.json()
+    assert "ETag" not in stale.headers and "Last-Modified" not in stale.headers
+    assert len(hot_keys.enqueued) == 1
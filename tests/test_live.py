@@ -0,0 +1,62 @@
+"""Der Live-Feed zählt auch Battles, die in derselben Sekunde wie sein Cursor liegen."""
+import asyncio
+import json
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from live import Hub
+from models import BattleData
+
+PLAYER = "#P0000001"
+SECOND = datetime(2030, 3, 1, 10, 0, 0)
+
+
+def _battle(brawler_id, battle_time=SECOND):
+    return {
+        "player_tag": PLAYER, "battle_time": battle_time, "brawler_id": brawler_id, "brawler_name": "BRAWLER",
+        "battle_mode": "gemGrab", "event_map": "Map 000", "battle_result": "victory", "trophy_change": 8,
+        "battle_duration": 120,
+    }
+
+
+def _events(chunk: bytes):
+    return [
+        (lines[0].removeprefix(b"event: ").decode(), json.loads(lines[1].removeprefix(b"data: ")))
+        for lines in (event.split(b"\n") for event in chunk.split(b"\n\n") if event)
+    ]
+
+
+def test_battles_in_cursor_second_are_counted(load_battles, engine):
+    load_battles(200, players=2)
+
+    def insert_battles(*battles):
+        with engine.begin() as connection:
+            connection.execute(insert(BattleData), list(battles))
+
+    async def scenario():
+        hub = Hub(poll_interval=3600)  # poll() wird direkt aufgerufen
+        insert_battles(_battle(16000002))
+        stream = await hub.stream(PLAYER)
+        try:
+            [(_, snapshot)] = _events(await stream.__anext__())
+            feed = hub.feeds[PLAYER]
+            assert feed.cursor == (SECOND, 16000002)
+
+            # gleiche Sekunde wie der Cursor (anderer Writer) und zwei Battles derselben Sekunde in einem Durchlauf
+            insert_battles(_battle(16000005), _battle(16000007, SECOND.replace(second=1)),
+                           _battle(16000003, SECOND.replace(second=1)))
+            await hub.poll()
+            events = _events(await stream.__anext__())
+        finally:
+            await stream.aclose()
+            if hub._watch is not None:
+                hub._watch.cancel()
+        return snapshot["totals"], events
+
+    totals, events = asyncio.run(scenario())
+    assert [(name, data["battle"]["brawler_id"]) for name, data in events] == [
+        ("battle", 16000005), ("battle", 16000003), ("battle", 16000007)
+    ]
+    assert events[-1][1]["totals"]["battles"] == totals["battles"] + 3
+    assert events[-1][1]["totals"]["last_battle"] == "2030-03-01T10:00:01"
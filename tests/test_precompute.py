@@ -0,0 +1,44 @@
+"""Die Hintergrund-Neuberechnung belegt einen Platz der Kostenklasse heavy oder wird zurückgestellt."""
+import asyncio
+
+import admission
+import stats
+from cache import cache_key, result_cache
+from precompute import REFRESH_COST, Scheduler
+
+PLAYER = "#P0000001"
+
+
+def test_refresh_deferred_without_free_slot(load_battles, monkeypatch):
+    load_battles(200, players=2)
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", True)
+    limiter = admission.limiters[REFRESH_COST]
+    key = cache_key("brawler-statistics", PLAYER)
+
+    async def scenario():
+        scheduler = Scheduler(interval=3600, workers=1)
+        scheduler.start()
+        try:
+            scheduler.track(key, "brawler-statistics", stats.brawler_statistics, PLAYER, None, None, {})
+
+            limiter.active = limiter.cost_class.concurrency  # alle Plätze durch Anfragen belegt
+            try:
+                scheduler.enqueue(key)
+                await asyncio.sleep(0)
+                await scheduler._queue.join()
+            finally:
+                limiter.active = 0
+            deferred = scheduler.statistics()
+
+            scheduler.enqueue(key)
+            await asyncio.sleep(0)
+            await scheduler._queue.join()
+            return deferred, scheduler.statistics()
+        finally:
+            await scheduler.stop()
+
+    deferred, refreshed = asyncio.run(scenario())
+    assert (deferred["deferred"], deferred["refreshed"]) == (1, 0)
+    assert (refreshed["deferred"], refreshed["refreshed"]) == (1, 1)
+    assert result_cache.peek(key) is not None
+    assert limiter.active == 0
@@ -0,0 +1,25 @@
+"""Die Statistik-Endpunkte brauchen unabhängig von der Zahl der Maps bzw. Brawler gleich viele Queries."""
+import pytest
+
+PLAYER = "#P0000000"
+
+
+def _queries(client, count_queries, path, params):
+    with count_queries as counter:
+        response = client.get(path, params=params)
+    assert response.status_code == 200, response.text
+    return counter.count
+
+
+@pytest.mark.parametrize("path", ["/map-statistics", "/brawler-statistics"])
+@pytest.mark.parametrize("params", [{}, {"player_tag": PLAYER}], ids=["alle", "spieler"])
+def test_query_count_independent_of_maps(client, load_battles, count_queries, path, params):
+    load_battles(400, players=4, maps=1, brawlers=1)
+    single = _queries(client, count_queries, path, params)
+
+    load_battles(400, players=4, maps=40, brawlers=30)
+    many = _queries(client, count_queries, path, params)
+
+    assert client.get(path, params=params).json()  # Plausibilität: Antwort mit Inhalt
+    assert single == many
+    assert single <= 2  # Watermark (zugleich Validator) und eine gruppierte Abfrage
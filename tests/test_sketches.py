@@ -0,0 +1,121 @@
+"""Fehlerschranken der Sketches (README, Approximative Statistiken) und der exakte Pfad ohne Sketches."""
+import math
+import random
+from bisect import bisect_left, bisect_right
+
+import pytest
+from sqlalchemy import select
+
+import sketches
+from models import BattleData
+from sketches import PERCENTILES, HyperLogLog, KLLSketch
+
+# Relativer Standardfehler 1,04 / sqrt(2^12) bzw. normalisierter Rang-Fehler (99 % Konfidenz) laut README
+HLL_STANDARD_ERROR = 1.04 / math.sqrt(4096)
+KLL_RANK_ERROR = 0.017
+
+
+def _hll(values):
+    sketch = HyperLogLog()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def _exact_percentile(values, fraction):
+    """Nearest-Rank-Perzentil einer sortierten Liste."""
+    return values[max(math.ceil(fraction * len(values)), 1) - 1]
+
+
+@pytest.mark.parametrize("cardinality", [1000, 20000, 100000])
+def test_hll_within_three_standard_errors(cardinality):
+    estimate = _hll(f"#P{index:08d}" for index in range(cardinality)).count()
+    assert abs(estimate - cardinality) / cardinality <= 3 * HLL_STANDARD_ERROR
+
+
+def test_hll_mean_error_matches_standard_error():
+    """Über viele unabhängige Mengen liegt der mittlere Fehler im Bereich des Standardfehlers."""
+    errors = []
+    for run in range(20):
+        estimate = _hll(f"#R{run:02d}-{index:06d}" for index in range(20000)).count()
+        errors.append((estimate - 20000) / 20000)
+    assert math.sqrt(sum(error * error for error in errors) / len(errors)) <= 1.5 * HLL_STANDARD_ERROR
+
+
+def test_hll_merge_is_lossless():
+    days = [[f"#P{index:06d}" for index in range(day * 3000, day * 3000 + 5000)] for day in range(5)]
+    merged = HyperLogLog()
+    for players in days:
+        merged.merge(_hll(players))
+    assert merged.registers == _hll(player for players in days for player in players).registers
+
+
+@pytest.mark.parametrize("merged", [False, True], ids=["ein-sketch", "gemergt"])
+def test_kll_rank_error_within_bound(merged):
+    random.seed(7)
+    values = [random.lognormvariate(4.5, 0.6) for _ in range(100000)]
+    if merged:
+        sketch = KLLSketch()
+        for start in range(0, len(values), 10000):
+            part = KLLSketch()
+            for value in values[start:start + 10000]:
+                part.add(value)
+            sketch.merge(part)
+    else:
+        sketch = KLLSketch()
+        for value in values:
+            sketch.add(value)
+
+    ordered = sorted(values)
+    for fraction, estimate in sketch.quantiles((0.1, 0.5, 0.9, 0.99)).items():
+        # Rang des geschätzten Werts (bei Gleichstand das ganze Intervall) gegen den angefragten Rang
+        low, high = bisect_left(ordered, estimate) / len(ordered), bisect_right(ordered, estimate) / len(ordered)
+        assert low - KLL_RANK_ERROR <= fraction <= high + KLL_RANK_ERROR
+
+
+def test_kll_exact_below_capacity():
+    values = list(range(150, 0, -1))
+    sketch = KLLSketch()
+    for value in values:
+        sketch.add(value)
+    ordered = sorted(values)
+    assert sketch.quantiles(PERCENTILES) == {fraction: _exact_percentile(ordered, fraction) for fraction in PERCENTILES}
+
+
+def test_approx_without_sketches_is_exact(client, load_battles, engine, count_queries, monkeypatch):
+    """Ohne USE_SKETCHES liefert approx=true exakte Werte per SQL, ohne Rohdaten zu lesen."""
+    load_battles(3000, players=50, maps=5)
+
+    def raw_rows(*args):
+        raise AssertionError("Rohdaten aus battle_logs gelesen")
+
+    monkeypatch.setattr(sketches, "_raw_rows", raw_rows)
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(BattleData.event_map, BattleData.battle_mode, BattleData.battle_duration)
+            .where(BattleData.battle_duration.isnot(None))
+        ).all()
+    durations = {}
+    for event_map, battle_mode, duration in rows:
+        durations.setdefault((event_map, battle_mode), []).append(duration)
+
+    with count_queries as counter:
+        response = client.get("/map-statistics", params={"approx": "true"})
+    assert response.status_code == 200
+    assert counter.count <= 3  # Watermark, Grains, Perzentile
+    for entry in response.json()["map_statistics"]:
+        ordered = sorted(durations[(entry["event_map"], entry["battle_mode"])])
+        for fraction, name in PERCENTILES.items():
+            assert entry[name] == _exact_percentile(ordered, fraction)
+
+    approx = client.get("/battle-statistics", params={"approx": "true"}).json()
+    assert approx["unique_players"] == client.get("/battle-statistics").json()["unique_players"] == 50
+
+
+def test_percentiles_only_with_approx(client, load_battles):
+    load_battles(500, players=5, maps=3)
+    for endpoint, section in (("/gamemode-statistics", "game_mode_statistics"), ("/map-statistics", "map_statistics")):
+        exact = client.get(endpoint).json()[section]
+        assert not any(name in entry for entry in exact for name in PERCENTILES.values())
+        assert all(name in entry for entry in client.get(endpoint, params={"approx": "true"}).json()[section]
+                   for name in PERCENTILES.values())